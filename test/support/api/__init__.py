@@ -8,14 +8,14 @@ from functools import partial
 
 import responses
 
-from .cache import MockFileCache
+from .cache import MockCache
 from .. import files
 
 import config
 
 
 def disable_cache():
-    return mock.patch("vmbot.helpers.api.FileCache", new=MockFileCache)
+    return mock.patch("vmbot.helpers.api._get_http_cache", new=MockCache)
 
 
 def _add_to_mock(mock, f=None, **kwargs):
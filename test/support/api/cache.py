@@ -5,18 +5,7 @@ from __future__ import absolute_import, division, unicode_literals, print_functi
 from cachecontrol.cache import BaseCache
 
 
-class MockFileCache(BaseCache):
-    def __init__(
-        self,
-        directory,
-        forever=False,
-        filemode=0o0600,
-        dirmode=0o0700,
-        use_dir_lock=None,
-        lock_class=None,
-    ):
-        pass
-
+class MockCache(BaseCache):
     def get(self, key):
         return None
 
@@ -0,0 +1,53 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import sqlite3
+
+# Small excerpt of the SDE tables used by vmbot.helpers.staticdata
+MOCK_SDE = """
+CREATE TABLE invTypes (typeID INTEGER PRIMARY KEY, typeName TEXT,
+                       published INTEGER, marketGroupID INTEGER);
+INSERT INTO invTypes VALUES (34, 'Tritanium', 1, 1857), (35, 'Pyerite', 1, 1857),
+                            (36, 'Mexallon', 1, 1857), (25595, 'Alloyed Tritanium Bar', 1, 1861),
+                            (35833, 'Fortizar', 1, 2201), (35834, 'Keepstar', 1, 2201),
+                            (2016, 'Tritanium Pin', 0, NULL);
+
+CREATE TABLE mapRegions (regionID INTEGER PRIMARY KEY, regionName TEXT);
+INSERT INTO mapRegions VALUES (10000002, 'The Forge'), (10000043, 'Domain'),
+                              (10000033, 'The Citadel'), (12000001, 'ADR01');
+
+CREATE TABLE mapConstellations (constellationID INTEGER PRIMARY KEY, constellationName TEXT);
+INSERT INTO mapConstellations VALUES (20000020, 'Kimotoro'), (20000001, 'San Matar'),
+                                     (20000766, 'Throne Worlds'), (20000322, 'Mareerieh'),
+                                     (26000001, 'ADC01');
+
+CREATE TABLE mapSolarSystems (solarSystemID INTEGER PRIMARY KEY, solarSystemName TEXT,
+                              constellationID INTEGER, regionID INTEGER);
+INSERT INTO mapSolarSystems VALUES (30000142, 'Jita', 20000020, 10000002),
+                                   (30000001, 'Tanoo', 20000001, 10000002),
+                                   (30002187, 'Amarr', 20000766, 10000043),
+                                   (30005243, 'Madomi', 20000766, 10000043),
+                                   (30005226, 'Dom-Aphis', 20000322, 10000043),
+                                   (30100000, 'Domistic', 26000001, 12000001);
+
+CREATE TABLE staStations (stationID INTEGER PRIMARY KEY, solarSystemID INTEGER);
+INSERT INTO staStations VALUES (60003760, 30000142), (60012526, 30000001),
+                               (60014437, 30000001);
+
+CREATE TABLE chrFactions (factionID INTEGER PRIMARY KEY, factionName TEXT);
+INSERT INTO chrFactions VALUES (500001, 'Caldari State'), (500003, 'Amarr Empire');
+
+CREATE TABLE invNames (itemID INTEGER PRIMARY KEY, itemName TEXT);
+INSERT INTO invNames VALUES (40009082, 'Jita IV'), (30000142, 'Jita'),
+                            (60003760, 'Jita IV - Moon 4 - Caldari Navy Assembly Plant');
+
+CREATE TABLE market_structures (typeID INTEGER NOT NULL PRIMARY KEY);
+INSERT INTO market_structures VALUES (35833), (35834);
+"""
+
+
+def create_mock_sde():
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.executescript(MOCK_SDE)
+    return conn
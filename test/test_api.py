@@ -7,7 +7,10 @@ import mock
 
 import StringIO
 import logging
+import io
 
+from concurrent import futures
+from urllib3 import HTTPResponse
 import responses
 
 from .support import api as api_support
@@ -20,13 +23,33 @@ from vmbot.helpers import api
 class TestAPI(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
-        # Reset _API_REG to re-enable caching
-        api._API_REG = api.threading.local()
+        # Reset the shared session to re-enable caching
+        api._shared_sess = None
 
     def test_get_requests_session(self):
         sess = api._get_requests_session()
         self.assertIs(api._get_requests_session(), sess)
         self.assertIn("XVMX-VMBot", sess.headers['User-Agent'])
+        self.assertEqual(sess.get_adapter("https://esi.evetech.net")._pool_maxsize,
+                         api.POOL_MAXSIZE)
+
+    def test_get_requests_session_shared(self):
+        sess = api._get_requests_session()
+        self.assertIs(api._http_pool.submit(api._get_requests_session).result(), sess)
+
+    @responses.activate
+    def test_cookies_blocked(self):
+        responses.add(responses.GET, "https://httpbin.org/cookies/set",
+                      headers={'Set-Cookie': "test=1; Path=/"})
+        api.request_api("https://httpbin.org/cookies/set")
+        self.assertEqual(len(api._get_requests_session().cookies), 0)
+
+    def test_connection_pool_stats(self):
+        adapter = api._get_requests_session().get_adapter("https://esi.evetech.net")
+        adapter.poolmanager.connection_from_url("https://esi.evetech.net")
+        self.assertDictEqual(api.connection_pool_stats()['esi.evetech.net'],
+                             {'maxsize': api.POOL_MAXSIZE, 'available': api.POOL_MAXSIZE,
+                              'connections': 0, 'requests': 0})
 
     def test_get_names_single(self):
         # character_id: 91754106 Joker Gates
@@ -84,6 +107,50 @@ class TestAPI(unittest.TestCase):
         api_support.add_plain_404(responses, url="https://zkillboard.com/api/killID/54520379/")
         self.assertEqual(api.zbot("54520379"), "API returned error code 404")
 
+    @responses.activate
+    def test_expand_zbot_error_uncached(self):
+        api_support.add_plain_404(responses, url="https://zkillboard.com/api/killID/54520379/")
+        self.assertTupleEqual(api.expand_zbot("54520379"), ("API returned error code 404", None))
+
+    @mock.patch("vmbot.helpers.staticdata.type_name", return_value="Hurricane")
+    @mock.patch("vmbot.helpers.staticdata.system_data",
+                return_value={'system_name': "Saranen", 'region_name': "Lonetrek"})
+    @mock.patch("vmbot.helpers.api.get_tickers", return_value=("XVMX", "CONDI"))
+    @mock.patch("vmbot.helpers.api.get_names", return_value={1: "Victim A", 2: "Victim B"})
+    @mock.patch("vmbot.helpers.api._fetch_killmail")
+    def test_expand_zbots(self, mock_km, mock_names, mock_tickers, mock_system, mock_type):
+        def killmail(victim):
+            return ({'points': 1, 'totalValue': 1000.0},
+                    {'victim': {'character_id': victim, 'corporation_id': 3,
+                                'ship_type_id': 4, 'damage_taken': 5},
+                     'attackers': [{}], 'solar_system_id': 6,
+                     'killmail_time': "2016-06-10T02:09:38Z"})
+
+        kills = {10: killmail(1), 20: killmail(2), 30: None}
+
+        def fetch(kill_id):
+            if kill_id == 40:
+                raise APIStatusError(mock.Mock(), "API returned error code 404")
+            return kills[kill_id]
+
+        mock_km.side_effect = fetch
+        pool = futures.ThreadPoolExecutor(max_workers=4)
+        res = api.expand_zbots([10, 20, 30, 40, 10], pool)
+        pool.shutdown()
+
+        self.assertEqual(res[10], ("Victim A [XVMX] <CONDI> | Hurricane (1 point(s)) | 1.00k ISK | "
+                                   "Saranen (Lonetrek) | 1 attacker(s) (5 damage) | "
+                                   "2016-06-10 02:09:38", api.ZBOT_CACHE_TTL))
+        self.assertTrue(res[20][0].startswith("Victim B"))
+        self.assertEqual(res[30], ("Failed to load data for https://zkillboard.com/kill/30/",
+                                   None))
+        self.assertEqual(res[40], ("API returned error code 404", None))
+
+        self.assertEqual(mock_km.call_count, 4)
+        self.assertEqual(sorted(mock_names.call_args[0]), [1, 2])
+        mock_names.assert_called_once()
+        self.assertEqual(mock_tickers.call_count, 2)
+
     @responses.activate
     def test_zbot_APIError_esi(self):
         responses.add_passthru("https://zkillboard.com/api/")
@@ -130,6 +197,16 @@ class TestAPI(unittest.TestCase):
         api_support.add_yt_video_quotaExceeded(responses)
         self.assertFalse(api.ytbot("GNFgkN1kbNc"))
 
+    @mock.patch("config.YT_KEY", new="TestKey")
+    @responses.activate
+    def test_expand_ytbot(self):
+        api_support.add_yt_video_200(responses)
+        self.assertEqual(api.expand_ytbot("GNFgkN1kbNc")[1], api.YTBOT_CACHE_TTL)
+
+        responses.reset()
+        api_support.add_yt_video_quotaExceeded(responses)
+        self.assertTupleEqual(api.expand_ytbot("GNFgkN1kbNc"), (False, None))
+
     @mock.patch("config.YT_KEY", new="TestKey")
     @responses.activate
     def test_ytbot_404(self):
@@ -170,6 +247,72 @@ class TestAPI(unittest.TestCase):
 
         logger.removeHandler(handler)
 
+    @responses.activate
+    @mock.patch("vmbot.helpers.api._esi_limiter", new_callable=api.ESIRateLimiter)
+    def test_request_esi_error_limit(self, mock_limiter):
+        responses.add(responses.GET, "https://esi.evetech.net/v1/markets/-1/orders/", status=404,
+                      headers={'X-ESI-Error-Limit-Remain': "99",
+                               'X-ESI-Error-Limit-Reset': "60"})
+        self.assertRaises(APIStatusError, api.request_esi, "/v1/markets/{}/orders/", (-1,))
+
+        stats = api.esi_limiter_stats()
+        self.assertEqual(stats['error_remain'], 99)
+        self.assertEqual(stats['in_flight'], 0)
+
+    @responses.activate
+    @mock.patch("vmbot.helpers.api._esi_limiter", new_callable=api.ESIRateLimiter)
+    def test_request_esi_error_limit_cached(self, mock_limiter):
+        # Cached response stored while the error budget was nearly exhausted
+        cached = HTTPResponse(body=io.BytesIO(b'{"players": 1}'), status=200,
+                              headers={'X-ESI-Error-Limit-Remain': "5",
+                                       'X-ESI-Error-Limit-Reset': "60"},
+                              preload_content=False)
+
+        with mock.patch("cachecontrol.controller.CacheController.cached_request",
+                        return_value=cached):
+            self.assertDictEqual(api.request_esi("/v2/status/"), {'players': 1})
+
+        self.assertEqual(len(responses.calls), 0)
+        self.assertEqual(mock_limiter.error_remain, mock_limiter.ERROR_LIMIT)
+        self.assertEqual(mock_limiter.reset_at, 0)
+        self.assertEqual(mock_limiter.in_flight, 0)
+        self.assertDictEqual(mock_limiter._buckets, {})
+
+    @responses.activate
+    def test_request_esi_etag(self):
+        responses.add(responses.GET, "https://esi.evetech.net/v2/status/", status=304,
+                      headers={'ETag': '"abc"'})
+        res, head = api.request_esi("/v2/status/", with_head=True, etag='"abc"')
+        self.assertIs(res, api.NOT_MODIFIED)
+        self.assertEqual(responses.calls[0].request.headers['If-None-Match'], '"abc"')
+
+    @responses.activate
+    def test_request_esi_etag_modified(self):
+        responses.add(responses.GET, "https://esi.evetech.net/v2/status/",
+                      json={'players': 1}, headers={'ETag': '"def"'})
+        self.assertDictEqual(api.request_esi("/v2/status/", etag='"abc"'), {'players': 1})
+
+    @responses.activate
+    def test_request_esi_stream(self):
+        responses.add(responses.GET, "https://esi.evetech.net/v1/markets/10000002/orders/",
+                      json=[{'order_id': 1}, {'order_id': 2}])
+        res = api.request_esi("/v1/markets/{}/orders/", (10000002,), stream=True)
+        self.assertListEqual(list(res), [{'order_id': 1}, {'order_id': 2}])
+
+    @responses.activate
+    def test_request_esi_async(self):
+        responses.add(responses.GET, "https://esi.evetech.net/v2/status/",
+                      json={'players': 1}, headers={'Cache-Control': "no-store"})
+        res, head = api.request_esi_async("/v2/status/", with_head=True).result()
+        self.assertDictEqual(res, {'players': 1})
+        self.assertEqual(head['Cache-Control'], "no-store")
+
+    @responses.activate
+    def test_request_api_async_RequestException(self):
+        f = api.request_api_async("https://httpbin.org/get")
+        self.assertRaisesRegexp(APIRequestError,
+                                r"^Error while connecting to API: Connection refused", f.result)
+
     @responses.activate
     def test_request_api_RequestException(self):
         self.assertRaisesRegexp(APIRequestError,
@@ -181,5 +324,78 @@ class TestAPI(unittest.TestCase):
                                 api.request_api, "https://httpbin.org/status/404")
 
 
+def mock_status_error(status_code):
+    exc = mock.Mock(name="RequestException")
+    exc.response.status_code = status_code
+    return APIStatusError(exc, "TestException")
+
+
+def resolved(result):
+    f = futures.Future()
+    f.set_result(result)
+    return f
+
+
+@mock.patch("vmbot.helpers.api.PAGE_RETRY_DELAY", new=0)
+class TestIterPages(unittest.TestCase):
+    def setUp(self):
+        self.request = mock.Mock(return_value=([1], {'X-Pages': 5}))
+        self.request_async = mock.Mock(
+            side_effect=lambda route, fmt, params, **kw: resolved(([params['page']], {}))
+        )
+
+    def pages(self, **kwargs):
+        return api.iter_pages(self.request, self.request_async, "/v1/route/{}/", (1,), **kwargs)
+
+    def test_iter_pages(self):
+        self.assertListEqual([page for page, _ in self.pages()], [[1], [2], [3], [4], [5]])
+        self.request.assert_called_once_with("/v1/route/{}/", (1,), params={'page': 1},
+                                             headers=None, timeout=5, with_head=True,
+                                             stream=False)
+
+    def test_iter_pages_single(self):
+        self.request.return_value = ([1], {})
+        self.assertListEqual([page for page, _ in self.pages()], [[1]])
+        self.request_async.assert_not_called()
+
+    def test_iter_pages_parallel(self):
+        pages = self.pages(parallel=2)
+        next(pages)
+        self.assertEqual(self.request_async.call_count, 2)
+        next(pages)
+        self.assertEqual(self.request_async.call_count, 3)
+
+    def test_iter_pages_close(self):
+        pending = futures.Future()
+        self.request_async.side_effect = None
+        self.request_async.return_value = pending
+
+        pages = self.pages(parallel=2)
+        next(pages)
+        pages.close()
+        self.assertTrue(pending.cancelled())
+        self.assertEqual(self.request_async.call_count, 2)
+
+    def test_iter_pages_retry(self):
+        self.request.side_effect = [mock_status_error(502), ([1], {'X-Pages': 2})]
+        failed = futures.Future()
+        failed.set_exception(mock_status_error(504))
+        self.request_async.side_effect = [failed, resolved(([2], {}))]
+
+        self.assertListEqual([page for page, _ in self.pages()], [[1], [2]])
+        self.assertEqual(self.request.call_count, 2)
+        self.assertEqual(self.request_async.call_count, 2)
+
+    def test_iter_pages_error(self):
+        self.request.side_effect = mock_status_error(404)
+        self.assertRaises(APIStatusError, list, self.pages())
+        self.request.assert_called_once()
+
+    def test_iter_pages_retries_exhausted(self):
+        self.request.side_effect = APIRequestError(mock.Mock(), "TestException")
+        self.assertRaises(APIRequestError, list, self.pages(retries=1))
+        self.assertEqual(self.request.call_count, 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,88 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+import mock
+
+import threading
+
+from vmbot.services.cmdexecutor import CommandExecutor
+
+
+class TestCommandExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = CommandExecutor()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+        del self.executor
+
+    def blocking_cmd(self, res):
+        self.release.wait(5)
+        return res
+
+    def test_submit(self):
+        callback = mock.Mock()
+        self.assertTrue(self.executor.submit("user", "room", callback, lambda x: x * 2, 21))
+
+        self.executor.pool.shutdown(wait=True)
+        callback.assert_not_called()
+        self.executor.process()
+        callback.assert_called_once_with(42)
+
+    def test_user_limit(self):
+        for _ in xrange(CommandExecutor.MAX_PER_USER):
+            self.assertTrue(self.executor.submit("user", None, mock.Mock(),
+                                                 self.blocking_cmd, None))
+        self.assertFalse(self.executor.submit("user", None, mock.Mock(), self.blocking_cmd, None))
+        self.assertTrue(self.executor.submit("user2", None, mock.Mock(), self.blocking_cmd, None))
+        self.assertEqual(self.executor.rejected, 1)
+
+    def test_room_limit(self):
+        for i in xrange(CommandExecutor.MAX_PER_ROOM):
+            self.assertTrue(self.executor.submit("user{}".format(i), "room", mock.Mock(),
+                                                 self.blocking_cmd, None))
+        self.assertFalse(self.executor.submit("user", "room", mock.Mock(), self.blocking_cmd, None))
+        self.assertTrue(self.executor.submit("user", "room2", mock.Mock(), self.blocking_cmd, None))
+
+    @mock.patch.object(CommandExecutor, "MAX_QUEUE_DEPTH", new=2)
+    def test_queue_limit(self):
+        self.assertTrue(self.executor.submit("user1", None, mock.Mock(), self.blocking_cmd, None))
+        self.assertTrue(self.executor.submit("user2", None, mock.Mock(), self.blocking_cmd, None))
+        self.assertFalse(self.executor.submit("user3", None, mock.Mock(), self.blocking_cmd, None))
+
+    def test_release_limits(self):
+        callback = mock.Mock()
+        for _ in xrange(CommandExecutor.MAX_PER_USER):
+            self.executor.submit("user", "room", callback, self.blocking_cmd, "res")
+
+        self.release.set()
+        self.executor.pool.shutdown(wait=True)
+        self.executor.process()
+        self.assertEqual(callback.call_count, CommandExecutor.MAX_PER_USER)
+        self.assertDictEqual(self.executor.stats(),
+                             {'queue_depth': 0, 'running': 0, 'rejected': 0})
+        self.assertFalse(self.executor._users)
+        self.assertFalse(self.executor._rooms)
+
+    def test_exception(self):
+        callback = mock.Mock()
+
+        def fail():
+            raise RuntimeError("TestException")
+
+        with mock.patch("logging.Logger.exception") as mock_log:
+            self.executor.submit("user", None, callback, fail)
+            self.executor.pool.shutdown(wait=True)
+            mock_log.assert_called_once()
+
+        self.executor.process()
+        callback.assert_not_called()
+        self.assertEqual(self.executor.stats()['running'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
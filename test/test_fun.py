@@ -26,8 +26,8 @@ class TestFun(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
-        # Reset _API_REG to re-enable caching
-        api._API_REG = api.threading.local()
+        # Reset the shared session to re-enable caching
+        api._shared_sess = None
 
     def setUp(self):
         self.fun = Fun()
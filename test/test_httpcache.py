@@ -0,0 +1,104 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+
+import sqlite3
+import time
+
+from vmbot.helpers.httpcache import SQLiteCache
+
+
+class TestSQLiteCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SQLiteCache(":memory:", sweep_interval=None)
+
+    def tearDown(self):
+        self.cache.close()
+        del self.cache
+
+    def test_set_get(self):
+        self.cache.set("key", b"value" * 100)
+        self.assertEqual(self.cache.get("key"), b"value" * 100)
+        self.assertLess(self.cache.nbytes, 100)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_stats(self):
+        self.cache.set("key", b"value")
+        self.cache.get("key")
+        self.cache.get("other")
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['evictions'], 0)
+
+    def test_replace(self):
+        self.cache.set("key", b"a")
+        nbytes = self.cache.nbytes
+        self.cache.set("key", b"b")
+        self.assertEqual(self.cache.get("key"), b"b")
+        self.assertEqual(self.cache.nbytes, nbytes)
+
+    def test_delete(self):
+        self.cache.set("key", b"value")
+        self.cache.delete("key")
+        self.cache.delete("other")
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.cache.nbytes, 0)
+
+    def test_lru_eviction(self):
+        self.cache.set("a", b"a")
+        entry_size = self.cache.nbytes
+        self.cache.max_bytes = 2 * entry_size
+
+        self.cache.set("b", b"b")
+        self.cache._conn.execute("UPDATE http_cache SET accessed = accessed - ?;",
+                                 (2 * self.cache.TOUCH_INTERVAL,))
+        self.cache.get("a")
+        self.cache.set("c", b"c")
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), b"a")
+        self.assertEqual(self.cache.get("c"), b"c")
+        self.assertEqual(self.cache.nbytes, 2 * entry_size)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_touch_interval(self):
+        self.cache.set("a", b"a")
+        accessed = time.time() - self.cache.TOUCH_INTERVAL / 2
+        self.cache._conn.execute("UPDATE http_cache SET accessed = ?;", (accessed,))
+
+        self.cache.get("a")
+        self.assertEqual(self.cache._conn.execute("SELECT accessed FROM http_cache;").fetchone(),
+                         (accessed,))
+
+    def test_close(self):
+        cache = SQLiteCache(":memory:", sweep_interval=60)
+        cache.close()
+        self.assertFalse(cache._sweeper.is_alive())
+        self.assertRaises(sqlite3.ProgrammingError, cache.get, "a")
+
+    def test_sweep(self):
+        self.cache.set("a", b"a")
+        self.cache.set("b", b"b")
+        self.cache._conn.execute("UPDATE http_cache SET accessed = ? WHERE key = 'a';",
+                                 (time.time() - self.cache.idle_ttl - 1,))
+
+        self.assertEqual(self.cache.sweep(), 1)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), b"b")
+
+    def test_sweep_thread(self):
+        cache = SQLiteCache(":memory:", idle_ttl=0, sweep_interval=0.01)
+        cache.set("a", b"a")
+        time.sleep(0.1)
+        cache.close()
+        self.assertEqual(cache.nbytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
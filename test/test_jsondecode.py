@@ -0,0 +1,51 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+
+import json
+
+from vmbot.helpers import jsondecode
+
+DATA = [{'order_id': i, 'price': 1.5 * i, 'name': "Tritanium ⚡"} for i in xrange(50)]
+DATA += [12345, "str", [], {}, None]
+
+
+def chunked(raw, size):
+    return [raw[i:i + size] for i in xrange(0, len(raw), size)]
+
+
+class TestJSONDecode(unittest.TestCase):
+    raw = json.dumps(DATA, ensure_ascii=False).encode("utf-8")
+
+    def test_loads(self):
+        self.assertListEqual(jsondecode.loads(self.raw), DATA)
+
+    def test_iter_array(self):
+        self.assertListEqual(list(jsondecode.iter_array([self.raw])), DATA)
+
+    def test_iter_array_chunked(self):
+        # Chunks split elements, numbers, and multi-byte characters
+        for size in (1, 2, 7, 64):
+            self.assertListEqual(list(jsondecode.iter_array(chunked(self.raw, size))), DATA)
+
+    def test_iter_array_empty(self):
+        self.assertListEqual(list(jsondecode.iter_array([b" [ ", b"] "])), [])
+
+    def test_iter_array_lazy(self):
+        res = jsondecode.iter_array(iter([b'[{"a": 1}, ', b'{"b": 2}', b"]"]))
+        self.assertDictEqual(next(res), {'a': 1})
+
+    def test_iter_array_truncated(self):
+        self.assertRaises(ValueError, list, jsondecode.iter_array([b'[1, {"a": ']))
+        self.assertRaises(ValueError, list, jsondecode.iter_array([b"[1, 2"]))
+        self.assertRaises(ValueError, list, jsondecode.iter_array([]))
+
+    def test_iter_array_invalid(self):
+        self.assertRaises(ValueError, list, jsondecode.iter_array([b'{"a": 1}']))
+        self.assertRaises(ValueError, list, jsondecode.iter_array([b"[1 2]"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+import mock
+
+from os import path
+import shutil
+import tempfile
+import time
+
+from vmbot.async.km_store import KillmailStore
+from vmbot.async.km_feed import KMFeed
+
+
+def package(killmail_id, value):
+    return {'killID': killmail_id, 'killmail': {'killmail_id': killmail_id},
+            'zkb': {'totalValue': value}}
+
+
+class TestKillmailStore(unittest.TestCase):
+    def setUp(self):
+        self.store = KillmailStore(":memory:")
+
+    def tearDown(self):
+        self.store.close()
+        del self.store
+
+    def test_append(self):
+        self.assertEqual(self.store.append("kill", package(1, 100.0)), 1)
+        self.assertEqual(self.store.append("kill", package(2, 50.0)), 2)
+        self.assertEqual(self.store.append("loss", package(3, 10.0)), 3)
+
+        self.assertTupleEqual(self.store.summary("kill"), (2, 2, 150.0))
+        self.assertTupleEqual(self.store.summary("loss"), (3, 1, 10.0))
+
+    def test_append_duplicate(self):
+        self.assertTrue(self.store.append("kill", package(1, 100.0)))
+        self.assertIsNone(self.store.append("kill", package(1, 100.0)))
+        self.assertIsNone(self.store.append("loss", package(1, 100.0)))
+
+        self.assertEqual(self.store.summary("kill")[1], 1)
+        self.assertEqual(self.store.summary("loss")[1], 0)
+
+    def test_summary_empty(self):
+        self.assertTupleEqual(self.store.summary("kill"), (0, 0, 0))
+
+        self.store.append("kill", package(1, 10.0))
+        self.store.ack("kill", 1)
+        self.assertTupleEqual(self.store.summary("kill"), (1, 0, 0))
+
+    def test_packages(self):
+        for id_, value in ((1, 30.0), (2, 10.0), (3, 20.0)):
+            self.store.append("kill", package(id_, value))
+        upto = self.store.summary("kill")[0]
+        self.store.append("kill", package(4, 40.0))
+
+        self.assertListEqual(self.store.packages("kill", upto), [package(2, 10.0),
+                                                                 package(3, 20.0),
+                                                                 package(1, 30.0)])
+        self.assertListEqual(self.store.packages("kill", upto, min_value=20.0),
+                             [package(3, 20.0), package(1, 30.0)])
+
+    def test_pending(self):
+        self.store.append("loss", package(1, 30.0))
+        self.store.append("kill", package(2, 20.0))
+        self.store.append("loss", package(3, 10.0))
+        self.store.ack("loss", 1)
+
+        self.assertListEqual(self.store.pending("loss"), [(3, package(3, 10.0))])
+
+    def test_ack(self):
+        self.store.append("kill", package(1, 10.0))
+        self.store.append("loss", package(2, 20.0))
+        upto = self.store.summary("kill")[0]
+        self.store.append("kill", package(3, 30.0))
+        self.store.ack("kill", upto)
+
+        self.assertTupleEqual(self.store.summary("kill"), (3, 1, 30.0))
+        self.assertEqual(self.store.summary("loss")[1], 1)
+        # Acknowledged killmails are still deduplicated
+        self.assertIsNone(self.store.append("kill", package(1, 10.0)))
+
+    def test_ack_prune(self):
+        self.store.append("kill", package(1, 10.0))
+        self.store.append("loss", package(2, 20.0))
+        self.store.ack("kill", self.store.summary("kill")[0])
+
+        with mock.patch("time.time", return_value=time.time() + self.store.max_age + 1):
+            self.store.ack("kill", self.store.summary("kill")[0])
+
+        # Unprocessed losses are kept regardless of their age
+        self.assertTrue(self.store.append("kill", package(1, 10.0)))
+        self.assertIsNone(self.store.append("loss", package(2, 20.0)))
+        self.assertTupleEqual(self.store.summary("kill"), (3, 1, 10.0))
+
+    def test_reopen(self):
+        db_path = path.join(tempfile.mkdtemp(), "killmails.sqlite")
+        try:
+            store = KillmailStore(db_path)
+            store.append("kill", package(1, 10.0))
+            store.append("kill", package(2, 20.0))
+            store.ack("kill", 1)
+            store.close()
+
+            store = KillmailStore(db_path)
+            self.assertTupleEqual(store.summary("kill"), (2, 1, 20.0))
+            self.assertIsNone(store.append("kill", package(1, 10.0)))
+            store.close()
+        finally:
+            shutil.rmtree(path.dirname(db_path))
+
+
+class TestKMFeedLosses(unittest.TestCase):
+    def setUp(self):
+        self.store = KillmailStore(":memory:")
+        # Don't listen to RedisQ
+        with mock.patch("threading.Thread"):
+            self.feed = KMFeed(1, store=self.store)
+
+    def tearDown(self):
+        self.store.close()
+        del self.feed
+        del self.store
+
+    @mock.patch("vmbot.async.km_feed.Lossmail", side_effect=lambda p: p['killID'])
+    def test_process_losses(self, mock_lossmail):
+        for id_ in (1, 2):
+            self.feed._queue_loss(self.store.append("loss", package(id_, 10.0)), package(id_, 10.0))
+
+        self.assertEqual(self.feed.process_losses(), "2 new loss(es):\n1\n2")
+        self.assertEqual(self.store.summary("loss")[1], 0)
+        self.assertIsNone(self.feed.process_losses())
+
+    @mock.patch("vmbot.async.km_feed.Lossmail", side_effect=KeyError)
+    def test_process_losses_error(self, mock_lossmail):
+        with mock.patch("logging.Logger.exception"):
+            self.feed._queue_loss(self.store.append("loss", package(1, 10.0)), package(1, 10.0))
+
+        # The failed loss is skipped for good
+        self.assertIsNone(self.feed.process_losses())
+        self.assertEqual(self.store.summary("loss")[1], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+import mock
+
+import threading
+
+from vmbot.services.linkcache import LinkExpansionCache
+
+
+class TestLinkExpansionCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LinkExpansionCache()
+
+    def tearDown(self):
+        self.cache.shutdown()
+        del self.cache
+
+    def test_get(self):
+        expand = mock.MagicMock(return_value=("res", 60))
+        self.assertEqual(self.cache.get("key", expand).result(), "res")
+        self.assertEqual(self.cache.get("key", expand).result(), "res")
+
+        expand.assert_called_once_with()
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_get_uncached(self):
+        expand = mock.MagicMock(return_value=("error", None))
+        self.assertEqual(self.cache.get("key", expand).result(), "error")
+        self.assertEqual(self.cache.get("key", expand).result(), "error")
+        self.assertEqual(expand.call_count, 2)
+
+    def test_get_expired(self):
+        expand = mock.MagicMock(return_value=("res", 60))
+        self.cache.get("key", expand).result()
+
+        with mock.patch("time.time", return_value=self.cache._entries["key"][1]):
+            self.cache.get("key", expand).result()
+        self.assertEqual(expand.call_count, 2)
+
+    def test_get_exception(self):
+        expand = mock.MagicMock(side_effect=ValueError)
+        self.assertRaises(ValueError, self.cache.get("key", expand).result)
+        self.assertDictEqual(self.cache._inflight, {})
+        self.assertNotIn("key", self.cache._entries)
+
+    def test_get_singleflight(self):
+        release = threading.Event()
+
+        def expand():
+            release.wait()
+            return "res", 60
+
+        expand = mock.MagicMock(side_effect=expand)
+        futs = [self.cache.get("key", expand) for _ in range(3)]
+        release.set()
+
+        self.assertListEqual([f.result() for f in futs], ["res"] * 3)
+        expand.assert_called_once_with()
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_get_many(self):
+        self.cache.get("a", lambda: ("cached", 60)).result()
+
+        expand = mock.MagicMock(return_value={"b": ("res b", 60), "c": ("error", None)})
+        futs = self.cache.get_many(["a", "b", "c", "b"], expand)
+
+        self.assertListEqual([f.result() for f in futs], ["cached", "res b", "error", "res b"])
+        expand.assert_called_once_with(["b", "c"])
+        self.assertListEqual(list(self.cache._entries), ["a", "b"])
+
+    def test_get_many_missing(self):
+        futs = self.cache.get_many(["a", "b"], lambda keys: {"a": ("res", 60)})
+        self.assertEqual(futs[0].result(), "res")
+        self.assertRaises(KeyError, futs[1].result)
+        self.assertDictEqual(self.cache._inflight, {})
+
+    @mock.patch.object(LinkExpansionCache, "MAX_ENTRIES", new=2)
+    def test_get_evict(self):
+        for key in ("a", "b", "a", "c"):
+            self.cache.get(key, lambda: (key, 60)).result()
+        self.assertListEqual(list(self.cache._entries), ["a", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
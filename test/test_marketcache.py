@@ -6,6 +6,9 @@ import unittest
 import mock
 
 from datetime import timedelta
+from email.utils import formatdate
+import threading
+import time
 
 from concurrent.futures import ThreadPoolExecutor
 
@@ -13,7 +16,7 @@ from vmbot.helpers import database as db
 from vmbot.helpers.exceptions import APIStatusError
 from vmbot.models.market import MarketStructure
 
-from vmbot.services.marketcache import MarketStructureLookup
+from vmbot.services.marketcache import MarketStructureLookup, MarketSnapshotCache
 
 
 def mock_status_error(status_code):
@@ -153,5 +156,84 @@ class TestMarketStructureLookup(unittest.TestCase):
         mock_rollback.assert_called()
 
 
+class TestMarketSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = MarketSnapshotCache()
+        self.fetch = mock.Mock(return_value=(mock.Mock(name="Snapshot", nbytes=100), None))
+
+    def tearDown(self):
+        del self.cache
+
+    def test_hit(self):
+        snapshot = self.cache.get("key", self.fetch)
+        self.assertIs(self.cache.get("key", self.fetch), snapshot)
+        self.fetch.assert_called_once_with(None)
+        self.assertDictEqual(self.cache.stats(),
+                             {'entries': 1, 'nbytes': 100, 'hits': 1, 'misses': 1})
+
+    def test_expires(self):
+        self.fetch.return_value = (mock.Mock(nbytes=100), formatdate(time.time() - 1, usegmt=True))
+        self.cache.get("key", self.fetch)
+        self.cache.get("key", self.fetch)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_expires_stale(self):
+        self.fetch.return_value = (mock.Mock(nbytes=100), formatdate(time.time() - 1, usegmt=True))
+        snapshot = self.cache.get("key", self.fetch)
+        self.cache.get("key", self.fetch)
+        self.fetch.assert_called_with(snapshot)
+
+    def test_expiry(self):
+        self.assertAlmostEqual(self.cache._expiry(formatdate(1600000000, usegmt=True)),
+                               1600000000)
+        self.assertGreater(self.cache._expiry("invalid"), time.time())
+        self.assertGreater(self.cache._expiry(None), time.time())
+
+    @mock.patch.object(MarketSnapshotCache, "MAX_BYTES", new=250)
+    def test_lru_eviction(self):
+        self.cache.get("a", self.fetch)
+        self.cache.get("b", self.fetch)
+        self.cache.get("a", self.fetch)
+        self.cache.get("c", self.fetch)
+
+        self.assertEqual(self.cache.nbytes, 200)
+        self.assertListEqual(list(self.cache._entries), ["a", "c"])
+
+    @mock.patch.object(MarketSnapshotCache, "MAX_BYTES", new=50)
+    def test_oversized(self):
+        self.cache.get("key", self.fetch)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_single_flight(self):
+        release = threading.Event()
+
+        def slow_fetch(stale):
+            release.wait(5)
+            return mock.Mock(nbytes=100), None
+
+        fetch = mock.Mock(side_effect=slow_fetch)
+        res = []
+        threads = [threading.Thread(target=lambda: res.append(self.cache.get("key", fetch)))
+                   for _ in xrange(3)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+
+        fetch.assert_called_once()
+        self.assertEqual(len(set(map(id, res))), 1)
+
+    def test_error(self):
+        self.fetch.side_effect = mock_status_error(500)
+        self.assertRaises(APIStatusError, self.cache.get, "key", self.fetch)
+        self.assertFalse(self.cache._inflight)
+
+        self.fetch.side_effect = None
+        self.cache.get("key", self.fetch)
+        self.assertEqual(self.fetch.call_count, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
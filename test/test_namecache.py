@@ -0,0 +1,148 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+import mock
+
+from datetime import timedelta
+import threading
+import time
+
+from sqlalchemy.pool import StaticPool
+
+from vmbot.helpers import database as db
+from vmbot.helpers.exceptions import APIStatusError
+from vmbot.models.entity import EntityName
+
+from vmbot.services.namecache import NameResolver
+
+MOCK_NAMES = {
+    91754106: "Joker Gates",
+    2052404106: "Valar Morghulis.",
+    1354830081: "Goonswarm Federation"
+}
+
+
+def mock_status_error(status_code):
+    exc = mock.Mock(name="RequestException")
+    exc.response.status_code = status_code
+    return APIStatusError(exc, "TestException")
+
+
+def mock_request_names(ids):
+    if any(id_ not in MOCK_NAMES for id_ in ids):
+        raise mock_status_error(404)
+    return [{'id': id_, 'name': MOCK_NAMES[id_], 'category': "character"} for id_ in ids]
+
+
+class TestNameResolver(unittest.TestCase):
+    # Lookups access the database from multiple threads
+    db_engine = db.create_engine("sqlite://", poolclass=StaticPool,
+                                 connect_args={'check_same_thread': False})
+
+    @classmethod
+    def setUpClass(cls):
+        db.init_db(cls.db_engine)
+        db.Session.configure(bind=cls.db_engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        db.Session.configure(bind=db.engine)
+        cls.db_engine.dispose()
+        del cls.db_engine
+
+    def setUp(self):
+        self.request = mock.Mock(side_effect=mock_request_names)
+        self.resolver = NameResolver(self.request)
+
+        with db.Session.begin() as sess:
+            sess.execute(db.delete(EntityName))
+
+    def tearDown(self):
+        del self.resolver
+
+    def test_resolve(self):
+        self.assertDictEqual(self.resolver([91754106, 2052404106]),
+                             {91754106: "Joker Gates", 2052404106: "Valar Morghulis."})
+        self.request.assert_called_once()
+
+    def test_cache(self):
+        self.resolver([91754106])
+        self.assertDictEqual(self.resolver([91754106]), {91754106: "Joker Gates"})
+        self.request.assert_called_once()
+
+    def test_expired_cache(self):
+        self.resolver([91754106])
+        with db.Session.begin() as sess:
+            name = sess.get(EntityName, 91754106)
+            name.last_updated -= NameResolver.NAME_CACHE_TTL + timedelta(days=1)
+
+        self.assertDictEqual(self.resolver([91754106]), {91754106: "Joker Gates"})
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_batch(self):
+        release = threading.Event()
+
+        def request_names(ids):
+            release.wait()
+            return mock_request_names(ids)
+
+        self.request.side_effect = request_names
+        res = {}
+
+        def lookup(id_):
+            res.update(self.resolver([id_]))
+
+        ids = list(MOCK_NAMES)
+        threads = [threading.Thread(target=lookup, args=(id_,)) for id_ in ids]
+        threads[0].start()
+        while not self.request.called:
+            time.sleep(0.01)
+
+        # Lookups queued while the first batch is in flight are merged
+        for t in threads[1:]:
+            t.start()
+        while len(self.resolver._pending) < len(ids) - 1:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertDictEqual(res, MOCK_NAMES)
+        self.assertEqual(self.request.call_count, 2)
+        self.assertItemsEqual(self.request.call_args[0][0], ids[1:])
+
+    def test_store_conflict(self):
+        with mock.patch("vmbot.models.entity.EntityName.from_esi_record",
+                        side_effect=db.IntegrityError("", {}, "")):
+            self.assertDictEqual(self.resolver([91754106]), {91754106: "Joker Gates"})
+
+    def test_batch_invalidid(self):
+        res = []
+
+        def lookup(*ids):
+            res.append(self.resolver(ids))
+
+        threads = [threading.Thread(target=lookup, args=(91754106,)),
+                   threading.Thread(target=lookup, args=(2052404106, -1))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertIn({91754106: "Joker Gates"}, res)
+        self.assertIn({2052404106: "{ERROR}", -1: "{ERROR}"}, res)
+
+    def test_max_batch_size(self):
+        self.resolver.MAX_BATCH_SIZE = 2
+        self.assertDictEqual(self.resolver(MOCK_NAMES.keys()), MOCK_NAMES)
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_request_error(self):
+        self.request.side_effect = mock_status_error(500)
+        self.assertDictEqual(self.resolver([91754106]), {91754106: "{ERROR}"})
+
+
+if __name__ == "__main__":
+    unittest.main()
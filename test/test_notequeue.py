@@ -11,6 +11,7 @@ from xmpp.protocol import JID
 import vmbot.helpers.database as db
 
 from vmbot.services.notequeue import NoteQueue
+from vmbot.services.occupancy import OccupancyIndex
 from vmbot.models.note import Note
 
 CUR_TIME = datetime.utcnow()
@@ -23,14 +24,12 @@ NOTES = [
     ["user4", "MUC text", CUR_TIME, "room1@example.com"],
     ["user5", "Missing MUC text", CUR_TIME, "room2@example.com"]
 ]
-NICK_DICT = {
-    'room1': {
-        'user1': JID("receiver1@example.com/res1"),
-        'user2': JID("receiver2@example.com/res2"),
-        'user4': JID("receiver4@example.com/res4"),
-        'user5': JID("receiver5@example.com/res5")
-    }
-}
+OCCUPANTS = [
+    ("room1", "user1", JID("receiver1@example.com/res1")),
+    ("room1", "user2", JID("receiver2@example.com/res2")),
+    ("room1", "user4", JID("receiver4@example.com/res4")),
+    ("room1", "user5", JID("receiver5@example.com/res5"))
+]
 
 
 class TestNoteQueue(unittest.TestCase):
@@ -49,6 +48,9 @@ class TestNoteQueue(unittest.TestCase):
 
     def setUp(self):
         self.queue = NoteQueue()
+        self.occupancy = OccupancyIndex()
+        for occupant in OCCUPANTS:
+            self.occupancy.join(*occupant)
         self.sess = db.Session()
         self.notes = [Note(*args) for args in NOTES]
 
@@ -58,24 +60,37 @@ class TestNoteQueue(unittest.TestCase):
         del self.queue
 
     def test_add_note(self):
+        self.queue.update_queue(self.sess)
         for note in self.notes:
             self.queue.add_note(note, self.sess)
             self.assertIsNotNone(note.note_id)
 
         for note in self.notes:
-            self.assertIn((note.offset_time, (note.note_id, note.receiver, note.room)),
-                          self.queue._queue)
+            self.assertIn((note.offset_time, note.note_id, note.receiver, note.room),
+                          self.queue._heap)
 
         # Clean up database
         for note in self.notes:
             self.sess.delete(note)
         self.sess.commit()
 
+    def test_add_note_unloaded(self):
+        # Notes are loaded on the first update instead
+        self.queue.add_note(self.notes[0], self.sess)
+        self.assertListEqual(self.queue._heap, [])
+
+        self.queue.update_queue(self.sess)
+        self.assertEqual(len(self.queue._heap), 1)
+
+        self.sess.delete(self.notes[0])
+        self.sess.commit()
+
     def test_queue(self):
         for note in self.notes:
             self.queue.add_note(note, self.sess)
+        expired_id = self.notes[2].note_id
 
-        res = self.queue.fetch(NICK_DICT, self.sess)
+        res = self.queue.fetch(self.occupancy, self.sess)
         self.assertEqual(len(res), 2)
 
         valid_rcvr = [self.notes[0].receiver, self.notes[3].room]
@@ -85,7 +100,42 @@ class TestNoteQueue(unittest.TestCase):
             self.assertIn(msg.data, valid_data)
 
         # All notes have been processed already
-        self.assertEqual(self.queue.fetch(NICK_DICT, self.sess), [])
+        self.assertEqual(self.queue.fetch(self.occupancy, self.sess), [])
+
+        # Expired note has been removed
+        self.assertIsNone(self.sess.get(Note, expired_id))
+
+        # Offline receiver's note is delivered on join
+        self.assertListEqual(
+            self.queue.fetch_for_occupant("room1", "user6", JID("receiver6@example.com/res6"),
+                                          self.sess),
+            []
+        )
+        res = self.queue.fetch_for_occupant("room2", "user5", JID("receiver5@example.com/res5"),
+                                            self.sess)
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0].data, self.notes[4].data)
+        self.assertDictEqual(self.queue._waiting, {})
+
+        # Clean up database
+        self.sess.delete(self.notes[1])
+        self.sess.commit()
+
+    def test_queue_expired_waiting(self):
+        self.queue.add_note(self.notes[4], self.sess)
+        self.queue.fetch(self.occupancy, self.sess)
+        self.assertIn(self.notes[4].note_id, self.queue._waiting)
+
+        key, _ = self.queue._waiting[self.notes[4].note_id]
+        self.queue._waiting[self.notes[4].note_id] = (key, EXP_TIME)
+        self.queue.update_queue(self.sess)
+
+        self.assertDictEqual(self.queue._waiting, {})
+        self.assertFalse(self.queue._index)
+
+        # Clean up database
+        self.sess.delete(self.notes[4])
+        self.sess.commit()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+
+from xmpp.protocol import JID
+
+from vmbot.services.occupancy import OccupancyIndex
+
+
+class TestOccupancyIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = OccupancyIndex()
+        self.index.join("room1", "nick1", JID("user1@example.com/res1"))
+        self.index.join("room1", "nick1-alt", JID("user1@example.com/res2"))
+        self.index.join("room2", "nick1", JID("user1@example.com/res1"))
+        self.index.join("room2", "nick2", JID("user2@example.com/res"))
+
+    def tearDown(self):
+        del self.index
+
+    def test_lookups(self):
+        self.assertIn("room1", self.index)
+        self.assertEqual(self.index.jid("room1", "nick1-alt"), JID("user1@example.com/res2"))
+        self.assertIsNone(self.index.jid("room1", "nick2"))
+        self.assertListEqual(sorted(self.index.nicks("room2")), ["nick1", "nick2"])
+        self.assertEqual(len(list(self.index.occupants())), 4)
+
+    def test_reverse_lookups(self):
+        self.assertTrue(self.index.is_online("user1@example.com"))
+        self.assertSetEqual(self.index.rooms_of("user1@example.com"), {"room1", "room2"})
+        self.assertSetEqual(self.index.jids_in("room2"), {"user1@example.com", "user2@example.com"})
+        self.assertSetEqual(self.index.nicks_of("user1"),
+                            {("room1", "nick1"), ("room1", "nick1-alt"), ("room2", "nick1")})
+
+    def test_in_room(self):
+        self.assertTrue(self.index.in_room("room1", "nick1"))
+        self.assertTrue(self.index.in_room("room1", "user1"))
+        self.assertFalse(self.index.in_room("room1", "user2"))
+        self.assertFalse(self.index.in_room("room3", "user1"))
+
+    def test_leave(self):
+        self.index.leave("room1", "nick1")
+        self.assertSetEqual(self.index.rooms_of("user1@example.com"), {"room1", "room2"})
+        self.assertTrue(self.index.in_room("room1", "user1"))
+
+        self.index.leave("room1", "nick1-alt")
+        self.assertNotIn("room1", self.index)
+        self.assertSetEqual(self.index.rooms_of("user1@example.com"), {"room2"})
+        self.assertFalse(self.index.in_room("room1", "user1"))
+
+        self.index.leave("room2", "nick1")
+        self.assertFalse(self.index.is_online("user1@example.com"))
+        self.assertSetEqual(self.index.nicks_of("user1"), set())
+
+    def test_leave_unknown(self):
+        self.index.leave("room1", "nick2")
+        self.index.leave("room3", "nick1")
+        self.assertEqual(len(list(self.index.occupants())), 4)
+
+    def test_rejoin(self):
+        # Nick taken over by another user
+        self.index.join("room2", "nick2", JID("user3@example.com/res"))
+        self.assertFalse(self.index.is_online("user2@example.com"))
+        self.assertSetEqual(self.index.jids_in("room2"), {"user1@example.com", "user3@example.com"})
+
+
+if __name__ == "__main__":
+    unittest.main()
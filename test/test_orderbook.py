@@ -0,0 +1,102 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+
+from vmbot.helpers.orderbook import OrderBook, TypeIndexedBook
+
+ORDERS = [
+    {'is_buy_order': False, 'volume_remain': 10, 'price': 56.00,
+     'location_id': 60003760, 'type_id': 34},
+    {'is_buy_order': False, 'volume_remain': 190, 'price': 63.61,
+     'location_id': 60003760, 'type_id': 34},
+    {'is_buy_order': False, 'volume_remain': 800, 'price': 70.00,
+     'location_id': 60008494, 'type_id': 35},
+    {'is_buy_order': True, 'volume_remain': 100, 'price': 42.33,
+     'location_id': 60003760, 'type_id': 34},
+    {'is_buy_order': True, 'volume_remain': 400, 'price': 40.00,
+     'location_id': 60003760, 'type_id': 34}
+]
+
+
+class TestOrderBook(unittest.TestCase):
+    def test_from_orders(self):
+        book = OrderBook.from_orders(ORDERS)
+        self.assertEqual(len(book), 5)
+        self.assertListEqual(book.location_id.tolist(),
+                             [60003760, 60003760, 60008494, 60003760, 60003760])
+        self.assertListEqual(book.is_buy.tolist(), [False, False, False, True, True])
+
+    def test_from_orders_empty(self):
+        self.assertEqual(len(OrderBook.from_orders(iter([]))), 0)
+
+    def test_concat(self):
+        book = OrderBook.concat(OrderBook.from_orders(ORDERS[:2]), OrderBook.empty(),
+                                OrderBook.from_orders(ORDERS[2:]))
+        self.assertListEqual(book.volume.tolist(), [10, 190, 800, 100, 400])
+
+    def test_nbytes(self):
+        self.assertEqual(OrderBook.from_orders(ORDERS).nbytes, 5 * (8 + 8 + 1 + 8 + 8))
+
+    def test_at_locations(self):
+        book = OrderBook.from_orders(ORDERS).at_locations({60008494})
+        self.assertListEqual(book.price.tolist(), [70.00])
+
+    def test_of_type(self):
+        book = OrderBook.from_orders(ORDERS).of_type(34)
+        self.assertEqual(len(book), 4)
+        self.assertListEqual(book.type_id.tolist(), [34] * 4)
+
+    def test_totals(self):
+        self.assertTupleEqual(OrderBook.from_orders(ORDERS).totals(),
+                              ((56.00, 1000), (42.33, 500)))
+
+    def test_totals_empty(self):
+        self.assertTupleEqual(OrderBook.empty().totals(), ((0.0, 0), (0.0, 0)))
+
+    def test_stats(self):
+        stats = OrderBook.from_orders(ORDERS).stats()
+        # 5% of sell volume (50 units) are only covered by the second order
+        self.assertTupleEqual(stats['sell'], (56.00, 63.61, 1000))
+        # 5% of buy volume (25 units) are covered by the best order
+        self.assertTupleEqual(stats['buy'], (42.33, 42.33, 500))
+        self.assertAlmostEqual(stats['spread'], (56.00 - 42.33) / 56.00)
+
+    def test_stats_percentile(self):
+        stats = OrderBook.from_orders(ORDERS).stats(percentile=50)
+        self.assertEqual(stats['sell'][1], 70.00)
+        self.assertEqual(stats['buy'][1], 40.00)
+
+    def test_stats_empty(self):
+        self.assertDictEqual(OrderBook.empty().stats(),
+                             {'sell': (0.0, 0.0, 0), 'buy': (0.0, 0.0, 0), 'spread': None})
+
+
+class TestTypeIndexedBook(unittest.TestCase):
+    def setUp(self):
+        self.index = TypeIndexedBook(OrderBook.from_orders(ORDERS))
+
+    def tearDown(self):
+        del self.index
+
+    def test_of_type(self):
+        book = self.index.of_type(34)
+        self.assertListEqual(book.price.tolist(), [56.00, 63.61, 42.33, 40.00])
+        self.assertListEqual(self.index.of_type(35).price.tolist(), [70.00])
+
+    def test_of_type_missing(self):
+        self.assertEqual(len(self.index.of_type(36)), 0)
+
+    def test_type_ids(self):
+        self.assertSetEqual(self.index.type_ids(), {34, 35})
+        self.assertEqual(len(self.index), 5)
+
+    def test_empty(self):
+        index = TypeIndexedBook(OrderBook.empty())
+        self.assertEqual(len(index.of_type(34)), 0)
+        self.assertGreater(index.nbytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
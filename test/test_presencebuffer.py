@@ -0,0 +1,89 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+import mock
+
+from datetime import datetime, timedelta
+
+import vmbot.helpers.database as db
+
+from vmbot.services.presencebuffer import PresenceBuffer
+from vmbot.models.user import User, Nickname
+
+
+class TestPresenceBuffer(unittest.TestCase):
+    db_engine = db.create_engine("sqlite://")
+
+    @classmethod
+    def setUpClass(cls):
+        db.init_db(cls.db_engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_engine.dispose()
+        del cls.db_engine
+
+    def setUp(self):
+        self.buffer = PresenceBuffer()
+        self.sess = db.Session(bind=self.db_engine)
+
+    def tearDown(self):
+        self.sess.execute(db.delete(Nickname))
+        self.sess.execute(db.delete(User))
+        self.sess.commit()
+        self.sess.close()
+        del self.buffer
+
+    def nicks(self):
+        return self.sess.execute(db.select(Nickname._user_jid, Nickname.nick, Nickname.last_seen).
+                                 order_by(Nickname.nick)).all()
+
+    def test_flush(self):
+        seen = datetime(2020, 1, 1)
+        self.buffer.record("nick1", "user@example.com", seen)
+        self.buffer.record("nick2", "user@example.com", seen)
+        self.buffer.flush(self.sess)
+
+        self.assertEqual(len(self.buffer), 0)
+        self.assertListEqual(self.nicks(), [("user@example.com", "nick1", seen),
+                                            ("user@example.com", "nick2", seen)])
+        self.assertFalse(self.sess.get(User, "user@example.com").allow_admin)
+
+    def test_flush_update(self):
+        seen = datetime(2020, 1, 1)
+        self.buffer.record("nick", "user@example.com", seen)
+        self.buffer.flush(self.sess)
+
+        # Updates are coalesced per nick
+        self.buffer.record("nick", "user@example.com", seen + timedelta(hours=1))
+        self.buffer.record("nick", "user@example.com", seen + timedelta(hours=2))
+        self.assertEqual(len(self.buffer), 1)
+        self.buffer.flush(self.sess)
+
+        self.assertListEqual(self.nicks(), [("user@example.com", "nick",
+                                             seen + timedelta(hours=2))])
+
+    def test_flush_empty(self):
+        with mock.patch.object(self.sess, "execute") as mock_execute:
+            self.buffer.flush(self.sess)
+        mock_execute.assert_not_called()
+
+    def test_flush_error(self):
+        self.buffer.record("nick", "user@example.com")
+        with mock.patch.object(self.sess, "commit", side_effect=db.OperationalError("", {}, "")):
+            self.buffer.flush(self.sess)
+
+        self.assertEqual(len(self.buffer), 1)
+        self.buffer.flush(self.sess)
+        self.assertEqual(len(self.nicks()), 1)
+
+    def test_flush_due(self):
+        self.assertFalse(self.buffer.flush_due())
+        with mock.patch("time.time", return_value=self.buffer._next_flush):
+            self.assertTrue(self.buffer.flush_due())
+
+
+if __name__ == "__main__":
+    unittest.main()
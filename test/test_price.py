@@ -5,22 +5,40 @@ from __future__ import absolute_import, division, unicode_literals, print_functi
 import unittest
 import mock
 
-import shutil
+from email.utils import formatdate
 
 from concurrent import futures
 import requests
 
-from vmbot.helpers.files import HTTPCACHE
-from vmbot.helpers.exceptions import APIError
+from vmbot.helpers.httpcache import SQLiteCache
+from vmbot.helpers.exceptions import APIError, APIStatusError
 from vmbot.helpers import api
 
-from vmbot.price import Price
+from vmbot.helpers.orderbook import OrderBook
+
+from vmbot.price import Price, _market_snapshots
+
+
+def mock_order(is_buy, volume, price, location_id=60003760, type_id=34):
+    return {'is_buy_order': is_buy, 'volume_remain': volume, 'price': price,
+            'location_id': location_id, 'type_id': type_id}
+
+
+EXPIRED = formatdate(0, usegmt=True)
+
+
+def mock_request_esi_async(*args, **kwargs):
+    # Resolve immediately using the (possibly mocked) synchronous request_esi
+    f = futures.Future()
+    f.set_result(api.request_esi(*args, **kwargs))
+    return f
 
 
 def mock_get_token():
     return mock.Mock(name="SSOToken", scopes=[])
 
 
+@mock.patch("vmbot.helpers.api.request_esi_async", new=mock_request_esi_async)
 class TestPrice(unittest.TestCase):
     default_mess = ""
     default_args = ""
@@ -36,15 +54,19 @@ class TestPrice(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        shutil.rmtree(HTTPCACHE, ignore_errors=True)
+        # Start with an empty HTTP cache
+        cls.cache_patcher = mock.patch("vmbot.helpers.api._http_cache",
+                                       new=SQLiteCache(":memory:", sweep_interval=None))
+        cls.cache_patcher.start()
 
     @classmethod
     def tearDownClass(cls):
-        # _API_REG may still hold a FileCache
-        api._API_REG = api.threading.local()
-        shutil.rmtree(HTTPCACHE, ignore_errors=True)
+        # The shared session may still hold the temporary cache
+        cls.cache_patcher.stop()
+        api._shared_sess = None
 
     def setUp(self):
+        _market_snapshots.clear()
         self.price = Price()
         self.price.api_pool = futures.ThreadPoolExecutor(max_workers=10)
         self.price.get_token = mock_get_token
@@ -96,6 +118,21 @@ class TestPrice(unittest.TestCase):
              + "<br />TestResponse" + "<br />TestResponse")
         )
 
+    @mock.patch("vmbot.price.Price._get_region_orders")
+    def test_pricedepth(self, mock_region_orders):
+        mock_region_orders.return_value = OrderBook.from_orders([
+            mock_order(False, 10, 40.00), mock_order(False, 990, 50.00),
+            mock_order(True, 1000, 30.00)
+        ])
+        self.assertEqual(
+            self.price.pricedepth(self.default_mess, "Mexallon@The Forge"),
+            ("<strong>Mexallon</strong> in <strong>The Forge</strong>:<br />"
+             "Sells: <strong>40.00</strong> ISK -- 50.00 ISK at 5% depth -- 1,000 units<br />"
+             "Buys: <strong>30.00</strong> ISK -- 30.00 ISK at 5% depth -- 1,000 units<br />"
+             "Spread: 25.00%")
+        )
+        self.assertTrue(mock_region_orders.call_args[1]['depth'])
+
     def test_price_invaliditem(self):
         self.assertEqual(
             self.price.price(self.default_mess, "InvalidItem"),
@@ -131,16 +168,143 @@ class TestPrice(unittest.TestCase):
             self.no_spread_template.format("Pyerite", "Jita", 0, 0, 0, 0)
         )
 
-    def test_calc_totals(self):
-        orders = [
-            {'is_buy_order': False, 'volume_remain': 674, 'price': 63.61},
-            {'is_buy_order': False, 'volume_remain': 26, 'price': 56.00},
-            {'is_buy_order': True, 'volume_remain': 500, 'price': 42.33},
+    @mock.patch("vmbot.helpers.api.request_esi", side_effect=[
+        ([mock_order(False, 674, 63.61)], {'X-Pages': 3}),
+        ([mock_order(True, 500, 42.33)], {}),
+        ([mock_order(False, 26, 56.00)], {})
+    ])
+    def test_get_region_orders_merge(self, mock_esi):
+        self.assertTupleEqual(self.price._get_region_orders(10000002, 34),
+                              ((56.00, 700), (42.33, 500)))
+
+    @mock.patch("vmbot.helpers.api.request_esi", return_value=([mock_order(True, 1, 1.00)], {}))
+    def test_get_region_orders_cached(self, mock_esi):
+        self.price._get_region_orders(10000002, 34)
+        self.assertTupleEqual(self.price._get_region_orders(10000002, 34),
+                              ((0.0, 0), (1.00, 1)))
+        mock_esi.assert_called_once()
+
+        self.price._get_region_orders(10000002, 35)
+        self.assertEqual(mock_esi.call_count, 2)
+
+    @mock.patch("vmbot.helpers.api.request_esi", side_effect=[
+        ([mock_order(True, 1, 1.00)], {'X-Pages': 2, 'ETag': '"a"', 'Expires': EXPIRED}),
+        ([mock_order(True, 2, 2.00)], {'ETag': '"b"', 'Expires': EXPIRED}),
+        (api.NOT_MODIFIED, {'X-Pages': 2, 'ETag': '"a"'}),
+        api.NOT_MODIFIED
+    ])
+    def test_get_region_orders_revalidated(self, mock_esi):
+        book = self.price._get_region_orders(10000002, 34, depth=True)
+        self.assertIs(self.price._get_region_orders(10000002, 34, depth=True), book)
+        self.assertEqual(mock_esi.call_count, 4)
+        self.assertEqual(mock_esi.call_args_list[2][1]['etag'], '"a"')
+        self.assertEqual(mock_esi.call_args_list[3][1]['etag'], '"b"')
+
+    @mock.patch("vmbot.helpers.api.request_esi", side_effect=[
+        ([mock_order(True, 1, 1.00)], {'X-Pages': 2, 'ETag': '"a"', 'Expires': EXPIRED}),
+        ([mock_order(True, 2, 2.00)], {'ETag': '"b"', 'Expires': EXPIRED}),
+        (api.NOT_MODIFIED, {'X-Pages': 2, 'ETag': '"a"'}),
+        [mock_order(True, 3, 3.00)],
+        ([mock_order(True, 1, 1.00)], {'X-Pages': 2, 'ETag': '"a"'}),
+        ([mock_order(True, 3, 3.00)], {'ETag': '"c"'})
+    ])
+    def test_get_region_orders_modified(self, mock_esi):
+        self.price._get_region_orders(10000002, 34)
+        self.assertTupleEqual(self.price._get_region_orders(10000002, 34),
+                              ((0.0, 0), (3.00, 4)))
+        self.assertEqual(mock_esi.call_count, 6)
+
+    @mock.patch("vmbot.helpers.staticdata.system_stations", return_value={60003760})
+    @mock.patch("vmbot.price.MarketStructureLookup")
+    def test_get_system_orders(self, mock_lookup, mock_stations):
+        mock_lookup.return_value.return_value = [1022734985679]
+        token = mock.Mock(name="SSOToken", scopes=["esi-universe.read_structures.v1",
+                                                   "esi-markets.structure_markets.v1"])
+        token.request_esi.side_effect = [
+            ([mock_order(False, 26, 56.00, location_id=1022734985679),
+              mock_order(False, 1, 1.00, location_id=1022734985679, type_id=35)],
+             {'X-Pages': 1})
         ]
-        self.assertTupleEqual(self.price._calc_totals(orders), ((56.00, 700), (42.33, 500)))
+        reg_orders = [mock_order(False, 674, 63.61), mock_order(True, 500, 42.33),
+                      mock_order(True, 1, 50.00, location_id=60008494)]
+
+        with mock.patch("vmbot.helpers.api.request_esi", return_value=(reg_orders, {})):
+            res = self.price._get_system_orders(token, 10000002, 30000142, [1022734985679], 34)
+
+        self.assertTupleEqual(res, ((56.00, 700), (42.33, 500)))
+        mock_lookup.return_value.finalize.assert_called_once()
+
+    @mock.patch("vmbot.helpers.staticdata.system_stations", return_value=set())
+    @mock.patch("vmbot.price.MarketStructureLookup")
+    @mock.patch("vmbot.helpers.api.request_esi", return_value=([], {}))
+    def test_get_system_orders_structure_cached(self, mock_esi, mock_lookup, mock_stations):
+        mock_lookup.return_value.return_value = [1022734985679]
+        token = mock.Mock(name="SSOToken", scopes=["esi-universe.read_structures.v1",
+                                                   "esi-markets.structure_markets.v1"])
+        token.request_esi.return_value = (
+            [mock_order(False, 26, 56.00, location_id=1022734985679),
+             mock_order(False, 1, 1.00, location_id=1022734985679, type_id=35)],
+            {'X-Pages': 1}
+        )
 
-    def test_calc_totals_noorders(self):
-        self.assertTupleEqual(self.price._calc_totals([]), ((0.0, 0), (0.0, 0)))
+        self.assertTupleEqual(
+            self.price._get_system_orders(token, 10000002, 30000142, [1022734985679], 34),
+            ((56.00, 26), (0.0, 0))
+        )
+        self.assertTupleEqual(
+            self.price._get_system_orders(token, 10000002, 30000142, [1022734985679], 35),
+            ((1.00, 1), (0.0, 0))
+        )
+        token.request_esi.assert_called_once()
+
+    @mock.patch("vmbot.helpers.staticdata.system_stations", return_value={60003760})
+    @mock.patch("vmbot.price.MarketStructureLookup")
+    def test_get_system_orders_denied(self, mock_lookup, mock_stations):
+        mock_lookup.return_value.return_value = [1022734985679]
+        token = mock.Mock(name="SSOToken", scopes=["esi-universe.read_structures.v1",
+                                                   "esi-markets.structure_markets.v1"])
+        exc = mock.Mock(name="RequestException")
+        exc.response.status_code = 403
+        token.request_esi.side_effect = APIStatusError(exc, "TestException")
+
+        with mock.patch("vmbot.helpers.api.request_esi",
+                        return_value=([mock_order(True, 500, 42.33)], {})):
+            res = self.price._get_system_orders(token, 10000002, 30000142, [1022734985679], 34)
+
+        self.assertTupleEqual(res, ((0.0, 0), (42.33, 500)))
+        mock_lookup.return_value.mark_inaccessible.assert_called_once_with(1022734985679)
+
+    @mock.patch("vmbot.helpers.staticdata.system_stations", return_value=set())
+    @mock.patch("vmbot.price.MarketStructureLookup")
+    @mock.patch("vmbot.helpers.api.request_esi", return_value=([], {}))
+    def test_get_system_orders_structures(self, mock_esi, mock_lookup, mock_stations):
+        mock_lookup.return_value.return_value = [1022734985679, 1028858195912, 1030049082711]
+        token = mock.Mock(name="SSOToken", scopes=["esi-universe.read_structures.v1",
+                                                   "esi-markets.structure_markets.v1"])
+
+        def request_structure(route, fmt, **kwargs):
+            if fmt[0] == 1028858195912:
+                exc = mock.Mock(name="RequestException")
+                exc.response.status_code = 403
+                raise APIStatusError(exc, "TestException")
+            return [mock_order(False, 10, fmt[0] % 100, location_id=fmt[0])], {'X-Pages': 1}
+
+        token.request_esi.side_effect = request_structure
+        res = self.price._get_system_orders(token, 10000002, 30000142,
+                                            [1022734985679, 1028858195912, 1030049082711], 34)
+
+        self.assertTupleEqual(res, ((11.00, 20), (0.0, 0)))
+        self.assertEqual(token.request_esi.call_count, 3)
+        mock_lookup.return_value.mark_inaccessible.assert_called_once_with(1028858195912)
+
+    @mock.patch("vmbot.helpers.api.request_esi", side_effect=[
+        ([mock_order(False, 674, 63.61)], {'X-Pages': 2}),
+        ([mock_order(True, 500, 42.33)], {})
+    ])
+    def test_get_region_orders_depth(self, mock_esi):
+        book = self.price._get_region_orders(10000002, 34, depth=True)
+        self.assertIsInstance(book, OrderBook)
+        self.assertTupleEqual(book.totals(), ((63.61, 674), (42.33, 500)))
 
     def test_get_region_orders(self):
         # region_id: 10000002 The Forge
@@ -152,7 +316,7 @@ class TestPrice(unittest.TestCase):
         self.assertIsInstance(res_r[1][0], float)
         self.assertIsInstance(res_r[1][1], (int, long))
 
-    @mock.patch("vmbot.helpers.api.request_esi", side_effect=[([], {'X-Pages': 2}), []])
+    @mock.patch("vmbot.helpers.api.request_esi", side_effect=[([], {'X-Pages': 2}), ([], {})])
     def test_get_region_orders_paginated(self, mock_esi):
         # region_id: 10000002 The Forge
         # type_id: 36 Mexallon
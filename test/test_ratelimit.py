@@ -0,0 +1,96 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+import mock
+
+import threading
+import time
+
+from vmbot.services.ratelimit import ESIRateLimiter
+
+
+class TestESIRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.limiter = ESIRateLimiter()
+
+    def tearDown(self):
+        del self.limiter
+
+    def test_route_group(self):
+        self.assertEqual(ESIRateLimiter.route_group("/v1/markets/{}/orders/"), "markets")
+        self.assertEqual(ESIRateLimiter.route_group("/latest/universe/names/"), "universe")
+        self.assertEqual(ESIRateLimiter.route_group("/status/"), "status")
+        self.assertEqual(ESIRateLimiter.route_group("/"), "")
+
+    def test_acquire_release(self):
+        self.limiter.acquire("markets")
+        self.assertEqual(self.limiter.in_flight, 1)
+        self.limiter.release({'X-ESI-Error-Limit-Remain': "80", 'X-ESI-Error-Limit-Reset': "30"})
+
+        stats = self.limiter.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['error_remain'], 80)
+        self.assertDictEqual(stats['throttled'], {})
+
+    def test_release_noheaders(self):
+        self.limiter.acquire("markets")
+        self.limiter.release(None)
+        self.limiter.acquire("markets")
+        self.limiter.release({})
+        self.assertEqual(self.limiter.error_remain, ESIRateLimiter.ERROR_LIMIT)
+
+    def test_concurrency_limit(self):
+        self.assertEqual(self.limiter.concurrency_limit, ESIRateLimiter.MAX_CONCURRENCY)
+        self.limiter.error_remain = 50
+        self.assertEqual(self.limiter.concurrency_limit, ESIRateLimiter.MAX_CONCURRENCY // 2)
+        self.limiter.error_remain = 1
+        self.assertEqual(self.limiter.concurrency_limit, 1)
+
+    def test_concurrency_throttle(self):
+        self.limiter.error_remain = 20
+        self.limiter.reset_at = time.time() + 60
+        for _ in xrange(self.limiter.concurrency_limit):
+            self.limiter.acquire("markets")
+
+        t = threading.Thread(target=self.limiter.acquire, args=("universe",))
+        t.start()
+        t.join(0.1)
+        self.assertTrue(t.is_alive())
+
+        self.limiter.release(None)
+        t.join(1)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(self.limiter.throttled['concurrency'], 1)
+
+    @mock.patch.object(ESIRateLimiter, "BURST", new=2)
+    @mock.patch.object(ESIRateLimiter, "RATE", new=20.0)
+    def test_rate_throttle(self):
+        for _ in xrange(3):
+            self.limiter.acquire("markets")
+            self.limiter.release(None)
+
+        self.assertEqual(self.limiter.throttled['rate'], 1)
+        self.assertGreater(self.limiter.wait_time, 0)
+
+        # Other route groups have separate buckets
+        self.limiter.acquire("universe")
+        self.assertEqual(self.limiter.throttled['rate'], 1)
+
+    def test_error_limit(self):
+        self.limiter.acquire("markets")
+        with mock.patch("logging.Logger.warning") as mock_log:
+            self.limiter.release({'X-ESI-Error-Limit-Remain': "5",
+                                  'X-ESI-Error-Limit-Reset': "0"})
+            mock_log.assert_called_once()
+
+        # The reset window has passed, so the budget is restored
+        self.limiter.reset_at = time.time() + 0.1
+        self.limiter.acquire("markets")
+        self.assertEqual(self.limiter.throttled['error_limit'], 1)
+        self.assertEqual(self.limiter.error_remain, ESIRateLimiter.ERROR_LIMIT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,12 @@
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 import unittest
+import mock
 
+import sqlite3
+import threading
+
+from .support.staticdata import create_mock_sde
 from vmbot.helpers import staticdata
 
 
@@ -16,10 +21,10 @@ class TestStaticdata(unittest.TestCase):
 
     def test_type_name(self):
         # type_id: 34 Tritanium
-        self.assertEqual(staticdata.type_name.__wrapped__(34), "Tritanium")
+        self.assertEqual(staticdata._type_name.__wrapped__(34), "Tritanium")
 
     def test_type_name_invaliditem(self):
-        self.assertEqual(staticdata.type_name.__wrapped__(-1), "{Failed to load}")
+        self.assertEqual(staticdata._type_name.__wrapped__(-1), "{Failed to load}")
 
     def test_search_location(self):
         # region_id: 10000043 Domain
@@ -58,20 +63,20 @@ class TestStaticdata(unittest.TestCase):
     def test_region_data(self):
         # region_id: 10000002 The Forge
         self.assertDictEqual(
-            staticdata.region_data.__wrapped__(10000002),
+            staticdata._region_data.__wrapped__(10000002),
             {'region_id': 10000002, 'region_name': "The Forge"}
         )
 
     def test_region_data_invalidregion(self):
         self.assertDictEqual(
-            staticdata.region_data.__wrapped__(-1),
+            staticdata._region_data.__wrapped__(-1),
             {'region_id': 0, 'region_name': "{Failed to load}"}
         )
 
     def test_system_data(self):
         # system_id: 30000142 Jita
         self.assertDictEqual(
-            staticdata.system_data.__wrapped__(30000142),
+            staticdata._system_data.__wrapped__(30000142),
             {'system_id': 30000142, 'system_name': "Jita",
              'constellation_id': 20000020, 'constellation_name': "Kimotoro",
              'region_id': 10000002, 'region_name': "The Forge"}
@@ -79,7 +84,7 @@ class TestStaticdata(unittest.TestCase):
 
     def test_system_data_invalidsystem(self):
         self.assertDictEqual(
-            staticdata.system_data.__wrapped__(-1),
+            staticdata._system_data.__wrapped__(-1),
             {'system_id': 0, 'system_name': "{Failed to load}",
              'constellation_id': 0, 'constellation_name': "{Failed to load}",
              'region_id': 0, 'region_name': "{Failed to load}"}
@@ -87,17 +92,17 @@ class TestStaticdata(unittest.TestCase):
 
     def test_item_name(self):
         # item_id: 40009082 Jita IV
-        self.assertEqual(staticdata.item_name.__wrapped__(40009082), "Jita IV")
+        self.assertEqual(staticdata._item_name.__wrapped__(40009082), "Jita IV")
 
     def test_item_name_invaliditem(self):
-        self.assertEqual(staticdata.item_name.__wrapped__(-1), "{Failed to load}")
+        self.assertEqual(staticdata._item_name.__wrapped__(-1), "{Failed to load}")
 
     def test_faction_name(self):
         # faction_id: 500001 Caldari State
-        self.assertEqual(staticdata.faction_name.__wrapped__(500001), "Caldari State")
+        self.assertEqual(staticdata._faction_name.__wrapped__(500001), "Caldari State")
 
     def test_faction_name_invalidfaction(self):
-        self.assertEqual(staticdata.faction_name.__wrapped__(-1), "{Failed to load}")
+        self.assertEqual(staticdata._faction_name.__wrapped__(-1), "{Failed to load}")
 
     def test_system_stations(self):
         # system_id: 30000001 Tanoo
@@ -113,11 +118,161 @@ class TestStaticdata(unittest.TestCase):
 
     def test_market_structure_types(self):
         # types: 35834 Keepstar, 35826 Azbel, 35836 Tatara
-        market_structures = staticdata.market_structure_types.__wrapped__()
+        market_structures = staticdata._market_structure_types.__wrapped__()
         self.assertIn(35834, market_structures)
         self.assertIn(35826, market_structures)
         self.assertIn(35836, market_structures)
 
 
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = staticdata.ConnectionPool(":memory:", size=2)
+
+    def tearDown(self):
+        del self.pool
+
+    def test_reuse(self):
+        with self.pool.connection() as c:
+            conn = c
+        with self.pool.connection() as c:
+            self.assertIs(c, conn)
+        self.assertEqual(self.pool.stats()['opened'], 1)
+
+    def test_read_only(self):
+        with self.pool.connection() as conn:
+            self.assertRaises(sqlite3.OperationalError, conn.execute, "CREATE TABLE t (x);")
+
+    def test_max_size(self):
+        with self.pool.connection() as c1, self.pool.connection() as c2:
+            self.assertIsNot(c1, c2)
+            self.assertDictContainsSubset({'opened': 2, 'in_use': 2}, self.pool.stats())
+        self.assertDictContainsSubset({'opened': 2, 'in_use': 0, 'waits': 0}, self.pool.stats())
+
+    def test_wait(self):
+        acquired = threading.Event()
+
+        def borrow():
+            with self.pool.connection():
+                acquired.set()
+
+        with self.pool.connection(), self.pool.connection():
+            t = threading.Thread(target=borrow)
+            t.start()
+            self.assertFalse(acquired.wait(0.1))
+        t.join()
+
+        self.assertTrue(acquired.is_set())
+        stats = self.pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_time'], 0)
+
+
+class TestStaticdataSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.indexes = staticdata._build_search_indexes(create_mock_sde())
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.indexes
+
+    def setUp(self):
+        self.patcher = mock.patch("vmbot.helpers.staticdata._search_indexes", new=self.indexes)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    @mock.patch("vmbot.helpers.staticdata._search_indexes", new=None)
+    @mock.patch("vmbot.helpers.staticdata._get_sde_conn")
+    def test_get_search_indexes(self, mock_conn):
+        mock_conn.return_value.__enter__.return_value = create_mock_sde()
+        indexes = staticdata._get_search_indexes()
+        self.assertIs(staticdata._get_search_indexes(), indexes)
+        mock_conn.assert_called_once()
+
+    def test_search_location(self):
+        # Domistic is located in a non-public region
+        self.assertDictEqual(
+            staticdata.search_location("dom"),
+            {"region": [10000043], "solar_system": [30005243, 30005226]}
+        )
+
+    def test_search_location_case(self):
+        self.assertDictEqual(staticdata.search_location("jITA"), {"solar_system": [30000142]})
+
+    def test_search_location_empty(self):
+        self.assertDictEqual(staticdata.search_location("InvalidLoc"), {})
+
+    def test_search_market_types(self):
+        # Tritanium Pin is unpublished
+        self.assertListEqual(staticdata.search_market_types("trit"),
+                             [(34, "Tritanium"), (25595, "Alloyed Tritanium Bar")])
+
+    def test_search_market_types_wildcard(self):
+        self.assertListEqual(staticdata.search_market_types("Trit%Bar"), [])
+
+
+class TestStaticdataSnapshot(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.snapshot = staticdata.StaticDataSnapshot(create_mock_sde())
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.snapshot
+
+    def setUp(self):
+        self.patcher = mock.patch("vmbot.helpers.staticdata._snapshot", new=self.snapshot)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    @mock.patch("vmbot.helpers.staticdata._search_indexes", new=None)
+    @mock.patch("vmbot.helpers.staticdata._get_sde_conn")
+    def test_load_snapshot(self, mock_conn):
+        mock_conn.return_value.__enter__.return_value = create_mock_sde()
+        staticdata.load_snapshot()
+        self.assertIsInstance(staticdata._snapshot, staticdata.StaticDataSnapshot)
+        self.assertIsNot(staticdata._snapshot, self.snapshot)
+        self.assertIsNotNone(staticdata._search_indexes)
+
+    def test_type_name(self):
+        self.assertEqual(staticdata.type_name(34), "Tritanium")
+        self.assertEqual(staticdata.type_name(-1), "{Failed to load}")
+
+    def test_region_data(self):
+        self.assertDictEqual(staticdata.region_data(10000002),
+                             {'region_id': 10000002, 'region_name': "The Forge"})
+        self.assertDictEqual(staticdata.region_data(-1),
+                             {'region_id': 0, 'region_name': "{Failed to load}"})
+
+    def test_system_data(self):
+        self.assertDictEqual(
+            staticdata.system_data(30000142),
+            {'system_id': 30000142, 'system_name': "Jita",
+             'constellation_id': 20000020, 'constellation_name': "Kimotoro",
+             'region_id': 10000002, 'region_name': "The Forge"}
+        )
+        self.assertEqual(staticdata.system_data(-1)['system_name'], "{Failed to load}")
+
+    def test_item_name(self):
+        self.assertEqual(staticdata.item_name(40009082), "Jita IV")
+        self.assertEqual(staticdata.item_name(-1), "{Failed to load}")
+        self.assertEqual(staticdata.item_name(99999999), "{Failed to load}")
+
+    def test_faction_name(self):
+        self.assertEqual(staticdata.faction_name(500001), "Caldari State")
+        self.assertEqual(staticdata.faction_name(-1), "{Failed to load}")
+
+    def test_system_stations(self):
+        self.assertSetEqual(staticdata.system_stations(30000001), {60012526, 60014437})
+        self.assertSetEqual(staticdata.system_stations(30002187), set())
+
+    def test_market_structure_types(self):
+        self.assertSetEqual(staticdata.market_structure_types(), {35833, 35834})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,172 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+import mock
+
+from datetime import timedelta
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.pool import StaticPool
+
+from vmbot.helpers import database as db
+from vmbot.helpers.exceptions import APIStatusError
+from vmbot.models.entity import EntityTicker
+
+from vmbot.services.tickercache import TickerCache
+
+MOCK_ENTITIES = {
+    ("corporation", 1164409536): {'ticker': "OTHER"},
+    ("corporation", 667531913): {'ticker': "GEWNS", 'alliance_id': 1354830081},
+    ("alliance", 1354830081): {'ticker': "CONDI"},
+    ("alliance", 159826257): {'ticker': "OTHER"}
+}
+
+
+def mock_status_error(status_code):
+    exc = mock.Mock(name="RequestException")
+    exc.response.status_code = status_code
+    return APIStatusError(exc, "TestException")
+
+
+def mock_request_ticker(category, entity_id):
+    try:
+        return MOCK_ENTITIES[(category, entity_id)]
+    except KeyError:
+        raise mock_status_error(404)
+
+
+class TestTickerCache(unittest.TestCase):
+    # Lookups access the database from multiple threads
+    db_engine = db.create_engine("sqlite://", poolclass=StaticPool,
+                                 connect_args={'check_same_thread': False})
+
+    @classmethod
+    def setUpClass(cls):
+        db.init_db(cls.db_engine)
+        db.Session.configure(bind=cls.db_engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        db.Session.configure(bind=db.engine)
+        cls.db_engine.dispose()
+        del cls.db_engine
+
+    def setUp(self):
+        self.request = mock.Mock(side_effect=mock_request_ticker)
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.cache = TickerCache(self.request, refresh_pool=self.pool)
+
+        with db.Session.begin() as sess:
+            sess.execute(db.delete(EntityTicker))
+
+    def tearDown(self):
+        self.pool.shutdown()
+        del self.cache
+
+    def test_tickers(self):
+        self.assertTupleEqual(self.cache(1164409536, 159826257), ("OTHER", "OTHER"))
+
+    def test_tickers_corponly(self):
+        self.assertTupleEqual(self.cache(667531913, None), ("GEWNS", "CONDI"))
+
+    def test_tickers_allianceonly(self):
+        self.assertTupleEqual(self.cache(None, 1354830081), (None, "CONDI"))
+
+    def test_tickers_invalidid(self):
+        self.assertTupleEqual(self.cache(-1, -1), ("ERROR", "ERROR"))
+
+    def test_tickers_none(self):
+        self.assertTupleEqual(self.cache(None, None), (None, None))
+        self.request.assert_not_called()
+
+    def test_mem_cache(self):
+        self.cache(667531913, None)
+        self.cache(667531913, None)
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_db_cache(self):
+        self.cache(667531913, None)
+        cache = TickerCache(self.request, refresh_pool=self.pool)
+        self.assertTupleEqual(cache(667531913, None), ("GEWNS", "CONDI"))
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_background_refresh(self):
+        self.cache(1164409536, None)
+        entry = self.cache._mem[("corporation", 1164409536)]
+        entry.last_updated -= TickerCache.TICKER_REFRESH_AGE + timedelta(minutes=1)
+
+        self.assertTupleEqual(self.cache(1164409536, None), ("OTHER", None))
+        self.pool.shutdown(wait=True)
+        self.assertEqual(self.request.call_count, 2)
+        self.assertLess(self.cache._mem[("corporation", 1164409536)].update_age,
+                        timedelta(minutes=1))
+
+    def test_category(self):
+        MOCK_ENTITIES[("alliance", 1164409536)] = {'ticker': "ALLY"}
+        try:
+            self.assertTupleEqual(self.cache(1164409536, None), ("OTHER", None))
+            self.assertTupleEqual(self.cache(None, 1164409536), (None, "ALLY"))
+        finally:
+            del MOCK_ENTITIES[("alliance", 1164409536)]
+
+        cache = TickerCache(self.request, refresh_pool=self.pool)
+        self.assertTupleEqual(cache(None, 1164409536), (None, "ALLY"))
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_expired_cache(self):
+        self.cache(1164409536, None)
+        entry = self.cache._mem[("corporation", 1164409536)]
+        entry.last_updated -= TickerCache.TICKER_CACHE_TTL + timedelta(days=1)
+
+        self.assertTupleEqual(self.cache(1164409536, None), ("OTHER", None))
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_fetch_shared(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def request(category, entity_id):
+            started.set()
+            release.wait(5)
+            return mock_request_ticker(category, entity_id)
+        self.request.side_effect = request
+
+        f = self.pool.submit(self.cache, 1164409536, None)
+        started.wait(5)
+        g = self.pool.submit(self.cache, 1164409536, None)
+        time.sleep(0.05)
+        release.set()
+
+        self.assertTupleEqual(f.result(), ("OTHER", None))
+        self.assertTupleEqual(g.result(), ("OTHER", None))
+        self.assertEqual(self.request.call_count, 1)
+
+    def test_store_conflict(self):
+        with mock.patch("sqlalchemy.orm.Session.merge",
+                        side_effect=db.IntegrityError("", {}, "")):
+            self.assertTupleEqual(self.cache(1164409536, None), ("OTHER", None))
+        self.assertTupleEqual(self.cache(1164409536, None), ("OTHER", None))
+        self.assertEqual(self.request.call_count, 1)
+
+    def test_prefetch(self):
+        keys = [("corporation", 667531913), ("alliance", 1354830081),
+                ("corporation", 1164409536), ("alliance", 159826257)]
+        self.cache.prefetch([(667531913, None), (1164409536, 159826257)], self.pool)
+        # Prefetching doesn't wait for the lookups
+        for _ in range(100):
+            if all(key in self.cache._mem for key in keys):
+                break
+            time.sleep(0.01)
+
+        self.assertTupleEqual(self.cache(667531913, None), ("GEWNS", "CONDI"))
+        self.assertTupleEqual(self.cache(1164409536, 159826257), ("OTHER", "OTHER"))
+        self.assertEqual(self.request.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
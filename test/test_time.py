@@ -37,6 +37,17 @@ class TestTime(unittest.TestCase):
         self.assertRaises(ValueError, datetime.strptime,
                           "Fri, 20 Apr 2018 14:00:00 GMT", time.ISO8601_DATETIME_MICRO_FMT)
 
+    def test_parse_iso8601_datetime(self):
+        self.assertEqual(time.parse_iso8601_datetime("2018-07-09T14:43:21Z"),
+                         datetime(year=2018, month=7, day=9, hour=14, minute=43, second=21))
+
+    def test_parse_iso8601_datetime_fallback(self):
+        self.assertEqual(time.parse_iso8601_datetime("2018-7-9T14:43:21Z"),
+                         datetime(year=2018, month=7, day=9, hour=14, minute=43, second=21))
+        self.assertRaises(ValueError, time.parse_iso8601_datetime,
+                          "Fri, 20 Apr 2018 14:00:00 GMT")
+        self.assertRaises(ValueError, time.parse_iso8601_datetime, "2018-07-09T14:43:2xZ")
+
     def test_parse_iso8601_duration(self):
         self.assertEqual(time.parse_iso8601_duration("5 days"), None)
 
@@ -0,0 +1,49 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import unittest
+
+from vmbot.helpers.trigram import TrigramIndex
+
+
+class TestTrigramIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex([(3, "Tritanium"), (1, "Alloyed Tritanium Bar"),
+                                   (2, "Pyerite"), (4, "Mexallon"), (5, "Isogen")])
+
+    def tearDown(self):
+        del self.index
+
+    def test_len(self):
+        self.assertEqual(len(self.index), 5)
+
+    def test_search(self):
+        self.assertListEqual(self.index.search("tanium"),
+                             [(3, "Tritanium"), (1, "Alloyed Tritanium Bar")])
+
+    def test_search_case(self):
+        self.assertListEqual(self.index.search("PYER"), [(2, "Pyerite")])
+
+    def test_search_short(self):
+        self.assertListEqual(self.index.search("ri"),
+                             [(2, "Pyerite"), (3, "Tritanium"), (1, "Alloyed Tritanium Bar")])
+
+    def test_search_order(self):
+        index = TrigramIndex([(2, "Ibis"), (1, "Ibis")])
+        self.assertListEqual(index.search("ibis"), [(1, "Ibis"), (2, "Ibis")])
+
+    def test_search_trigrams_not_contiguous(self):
+        # Every trigram of "allonite" occurs in "Allon Donite", but not the term itself
+        index = TrigramIndex([(1, "Allon"), (2, "Donite"), (3, "Allon Donite")])
+        self.assertTrue(all(tri in index._postings
+                            for tri in ("all", "llo", "lon", "oni", "nit", "ite")))
+        self.assertListEqual(index.search("allonite"), [])
+        self.assertListEqual(index.search("lon don"), [(3, "Allon Donite")])
+
+    def test_search_unknown_trigram(self):
+        self.assertListEqual(self.index.search("Veldspar"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
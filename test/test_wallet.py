@@ -3,23 +3,129 @@
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 import unittest
+import mock
 
-from datetime import datetime
+from datetime import datetime, date
 
-from vmbot.models.wallet import WalletJournalEntry
+from vmbot.helpers import database as db
+from vmbot.models.wallet import WalletJournalEntry, WalletDailyTotal
 
 
 class TestWalletEntry(unittest.TestCase):
+    rec = {"id": 14541533899, "ref_type": "bounty_prizes",
+           "amount": 1754495.63, "date": "2017-09-07T20:43:22Z"}
+
     def test_from_esi_record(self):
-        rec = {"id": 14541533899, "ref_type": "bounty_prizes",
-               "amount": 1754495.63, "date": "2017-09-07T20:43:22Z"}
-        entry = WalletJournalEntry.from_esi_record(rec)
+        entry = WalletJournalEntry.from_esi_record(self.rec)
 
         self.assertEqual(entry.ref_id, 14541533899)
         self.assertEqual(entry.ref_type, "bounty_prizes")
         self.assertEqual(entry.amount, 1754495.63)
         self.assertEqual(entry.date, datetime(2017, 9, 7, 20, 43, 22))
 
+    def test_row_from_esi_record(self):
+        self.assertDictEqual(WalletJournalEntry.row_from_esi_record({
+            "id": 1, "ref_type": "player_donation", "date": "2017-09-07T20:43:22Z"
+        }), {'ref_id': 1, 'ref_type': "player_donation", 'amount': 0.0,
+             'date': datetime(2017, 9, 7, 20, 43, 22)})
+
+    def _test_insert_ignore(self, engine):
+        db.init_db(engine)
+        sess = db.Session(bind=engine)
+        row = WalletJournalEntry.row_from_esi_record(self.rec)
+
+        db.insert_ignore(sess, WalletJournalEntry.__table__, [row])
+        db.insert_ignore(sess, WalletJournalEntry.__table__, [row, dict(row, ref_id=1)])
+        sess.commit()
+        self.assertEqual(sess.execute(db.select(db.func.count())
+                                      .select_from(WalletJournalEntry)).scalar(), 2)
+        sess.close()
+        engine.dispose()
+
+    def test_insert_ignore(self):
+        self._test_insert_ignore(db.create_engine("sqlite://"))
+
+    def test_insert_ignore_fallback(self):
+        engine = db.create_engine("sqlite://")
+
+        # pysqlite needs to leave transaction handling to SQLAlchemy for SAVEPOINTs
+        # See https://docs.sqlalchemy.org/en/14/dialects/sqlite.html#pysqlite-serializable
+        @db.event.listens_for(engine, "connect")
+        def do_connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @db.event.listens_for(engine, "begin")
+        def do_begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+        # Take the row by row path of dialects without INSERT ignoring conflicts
+        with mock.patch.object(engine.dialect, "name", new="generic"):
+            self._test_insert_ignore(engine)
+
+
+class TestWalletDailyTotal(unittest.TestCase):
+    db_engine = db.create_engine("sqlite://")
+
+    @classmethod
+    def setUpClass(cls):
+        db.init_db(cls.db_engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_engine.dispose()
+        del cls.db_engine
+
+    def setUp(self):
+        self.sess = db.Session(bind=self.db_engine)
+        self.sess.add_all([
+            WalletJournalEntry(1, "bounty_prizes", 100.0, datetime(2020, 1, 1, 6)),
+            WalletJournalEntry(2, "bounty_prizes", 50.0, datetime(2020, 1, 1, 18)),
+            WalletJournalEntry(3, "brokers_fee", -20.0, datetime(2020, 1, 1, 20)),
+            WalletJournalEntry(4, "bounty_prizes", 25.0, datetime(2020, 1, 2, 12)),
+            WalletJournalEntry(5, "brokers_fee", 10.0, datetime(2020, 1, 3, 1))
+        ])
+        WalletDailyTotal.refresh(self.sess)
+        self.sess.commit()
+
+    def tearDown(self):
+        self.sess.execute(db.delete(WalletJournalEntry))
+        self.sess.execute(db.delete(WalletDailyTotal))
+        self.sess.commit()
+        self.sess.close()
+
+    def test_refresh(self):
+        totals = self.sess.execute(db.select(WalletDailyTotal.day, WalletDailyTotal.ref_type,
+                                             WalletDailyTotal.income, WalletDailyTotal.expenses).
+                                   order_by(WalletDailyTotal.day, WalletDailyTotal.ref_type))
+        self.assertListEqual(totals.all(), [
+            (date(2020, 1, 1), "bounty_prizes", 150.0, 0.0),
+            (date(2020, 1, 1), "brokers_fee", 0.0, -20.0),
+            (date(2020, 1, 2), "bounty_prizes", 25.0, 0.0),
+            (date(2020, 1, 3), "brokers_fee", 10.0, 0.0)
+        ])
+
+    def test_totals(self):
+        # Partial first day is read from the journal
+        self.assertDictEqual(
+            WalletDailyTotal.totals(self.sess, "income", datetime(2020, 1, 1, 12)),
+            {"bounty_prizes": 75.0, "brokers_fee": 10.0}
+        )
+        self.assertDictEqual(
+            WalletDailyTotal.totals(self.sess, "expenses", datetime(2019, 12, 31, 12)),
+            {"brokers_fee": -20.0}
+        )
+
+    def test_check(self):
+        self.assertListEqual(WalletDailyTotal.check(self.sess), [])
+
+        self.sess.add(WalletJournalEntry(6, "bounty_prizes", 5.0, datetime(2020, 1, 2, 13)))
+        self.sess.commit()
+        self.assertListEqual(WalletDailyTotal.check(self.sess),
+                             [("2020-01-02", "bounty_prizes", (25.0, 0.0), (30.0, 0.0))])
+
+        WalletDailyTotal.refresh(self.sess, date(2020, 1, 2), date(2020, 1, 2))
+        self.assertListEqual(WalletDailyTotal.check(self.sess), [])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,3 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
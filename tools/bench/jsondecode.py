@@ -0,0 +1,72 @@
+# coding: utf-8
+"""Compare decoding ESI market order pages via requests, the selected backend, and streaming.
+
+Run from the tools directory: python -m bench.jsondecode [PAGE.json ...]
+Pages can be recorded with eg. curl -o PAGE.json \
+"https://esi.evetech.net/v1/markets/10000002/orders/?page=1"
+Without arguments, a synthetic page of 1000 orders is used.
+"""
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import timeit
+import random
+import json
+import sys
+
+from . import path
+
+from vmbot.helpers import jsondecode
+from vmbot.helpers.orderbook import OrderBook
+
+PAGE_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+REPEAT = 20
+
+
+def synthetic_page(num):
+    return json.dumps([
+        {'duration': 90, 'is_buy_order': random.random() < 0.4,
+         'issued': "2020-01-01T12:00:00Z", 'location_id': 60003760, 'min_volume': 1,
+         'order_id': random.randint(5000000000, 6000000000), 'price': random.uniform(4.0, 6.0),
+         'range': "region", 'system_id': 30000142, 'type_id': random.randint(18, 40000),
+         'volume_remain': random.randint(1, 1000000), 'volume_total': 1000000}
+        for _ in xrange(num)
+    ]).encode("utf-8")
+
+
+def chunked(raw):
+    return (raw[i:i + CHUNK_SIZE] for i in xrange(0, len(raw), CHUNK_SIZE))
+
+
+def best(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def main(paths):
+    if paths:
+        pages = []
+        for p in paths:
+            with open(p, "rb") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_page(PAGE_SIZE)]
+
+    cases = (
+        ("json.loads", lambda: [json.loads(raw.decode("utf-8")) for raw in pages]),
+        ("jsondecode.loads ({})".format(jsondecode.BACKEND),
+         lambda: [jsondecode.loads(raw) for raw in pages]),
+        ("jsondecode.iter_array", lambda: [list(jsondecode.iter_array(chunked(raw)))
+                                           for raw in pages]),
+        ("loads + from_orders", lambda: [OrderBook.from_orders(jsondecode.loads(raw))
+                                         for raw in pages]),
+        ("iter_array + from_orders",
+         lambda: [OrderBook.from_orders(jsondecode.iter_array(chunked(raw))) for raw in pages])
+    )
+    print("{} page(s), {:,} bytes, best of {}".format(len(pages), sum(map(len, pages)), REPEAT))
+    for name, func in cases:
+        print("{:<32} {:8.2f}ms".format(name, best(func) * 1000))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
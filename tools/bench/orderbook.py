@@ -0,0 +1,67 @@
+# coding: utf-8
+"""Compare pricing via a plain loop over orders with the vectorized OrderBook.
+
+Run from the tools directory: python -m bench.orderbook
+"""
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import timeit
+import random
+
+from . import path
+
+from vmbot.helpers.orderbook import OrderBook
+
+NUM_ORDERS = 100000
+REPEAT = 5
+
+
+def synthetic_orders(num):
+    return [{'is_buy_order': random.random() < 0.4, 'price': random.uniform(4.0, 6.0),
+             'volume_remain': random.randint(1, 1000000),
+             'location_id': random.choice((60003760, 60008494, 1022734985679)),
+             'type_id': 34}
+            for _ in xrange(num)]
+
+
+def loop_totals(orders):
+    """Reference implementation of OrderBook.totals as a loop over order dicts."""
+    sell_vol, sell_price = 0, None
+    buy_vol, buy_price = 0, None
+
+    for order in orders:
+        if order['is_buy_order']:
+            buy_vol += order['volume_remain']
+            if buy_price is None or order['price'] > buy_price:
+                buy_price = order['price']
+        else:
+            sell_vol += order['volume_remain']
+            if sell_price is None or order['price'] < sell_price:
+                sell_price = order['price']
+
+    return (sell_price or 0.0, sell_vol), (buy_price or 0.0, buy_vol)
+
+
+def best(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def main():
+    orders = synthetic_orders(NUM_ORDERS)
+    book = OrderBook.from_orders(orders)
+    assert book.totals() == loop_totals(orders)
+
+    cases = (
+        ("loop_totals", lambda: loop_totals(orders)),
+        ("OrderBook.from_orders", lambda: OrderBook.from_orders(orders)),
+        ("OrderBook.totals", book.totals),
+        ("OrderBook.stats", book.stats)
+    )
+    print("{:,} orders, best of {}".format(NUM_ORDERS, REPEAT))
+    for name, func in cases:
+        print("{:<24} {:8.2f}ms".format(name, best(func) * 1000))
+
+
+if __name__ == "__main__":
+    main()
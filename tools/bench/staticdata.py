@@ -0,0 +1,70 @@
+# coding: utf-8
+"""Compare static data lookups via sqlite with lookups via the in-memory snapshot.
+
+Run from the tools directory: python -m bench.staticdata
+"""
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import time
+import threading
+import random
+
+from . import path
+
+from vmbot.helpers import staticdata
+
+NUM_THREADS = 20
+LOOKUPS_PER_THREAD = 2000
+
+
+def run_threads(func, ids):
+    def worker():
+        for _ in xrange(LOOKUPS_PER_THREAD):
+            func(random.choice(ids))
+
+    threads = [threading.Thread(target=worker) for _ in xrange(NUM_THREADS)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return time.time() - start
+
+
+def main():
+    with staticdata._get_sde_conn() as conn:
+        type_ids = [r[0] for r in conn.execute("SELECT typeID FROM invTypes;")]
+        system_ids = [r[0] for r in conn.execute("SELECT solarSystemID FROM mapSolarSystems;")]
+
+        start = time.time()
+        snapshot = staticdata.StaticDataSnapshot(conn)
+        print("Snapshot loaded in {:.2f}s".format(time.time() - start))
+
+    cases = (
+        ("type_name", staticdata._type_name, type_ids),
+        ("system_data", staticdata._system_data, system_ids),
+        ("system_stations", staticdata._system_stations, system_ids)
+    )
+    lookups = NUM_THREADS * LOOKUPS_PER_THREAD
+    print("{} threads, {:,} lookups per case".format(NUM_THREADS, lookups))
+
+    for name, sde_func, ids in cases:
+        staticdata._snapshot = None
+        uncached = run_threads(getattr(sde_func, "__wrapped__", sde_func), ids)
+        cached = run_threads(getattr(staticdata, name), ids)
+
+        staticdata._snapshot = snapshot
+        mem = run_threads(getattr(staticdata, name), ids)
+
+        print("{:<16} sqlite: {:8.3f}s  sqlite+lru: {:8.3f}s  snapshot: {:8.3f}s "
+              "({:,.0f} lookups/s)".format(name, uncached, cached, mem, lookups / mem))
+
+    stats = staticdata.pool_stats()
+    print("SDE pool: {opened}/{size} connections, {waits:,} waits "
+          "({wait_time:.3f}s total)".format(**stats))
+
+
+if __name__ == "__main__":
+    main()
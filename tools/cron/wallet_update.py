@@ -9,7 +9,8 @@ from .models import Storage
 
 from vmbot.helpers.exceptions import APIError
 from vmbot.helpers import database as db
-from vmbot.models import WalletJournalEntry
+from vmbot.helpers import api
+from vmbot.models import WalletJournalEntry, WalletDailyTotal
 
 import config
 
@@ -35,58 +36,64 @@ def needs_run(session):
 
 def main(session, token):
     Storage.set(session, "wallet_update_next_run", time.time() + WALLET_UPDATE_INTERVAL)
-    walk_journal(session, token)
-
-
-def walk_journal(session, token):
-    min_id = session.execute(db.select(db.func.max(WalletJournalEntry.ref_id))).scalar()
 
-    entries, pages = get_entries(token)
-    raw_len = len(entries)
-    entries = filter_known_entries(min_id, entries)
-    session.add_all(entries)
-    session.commit()
+    # Build the daily totals of existing journals once
+    if session.execute(db.select(WalletDailyTotal.day).limit(1)).first() is None:
+        WalletDailyTotal.refresh(session)
+        session.commit()
 
-    for p in range(2, pages + 1):
-        if len(entries) != raw_len:
-            break
+    walk_journal(session, token)
 
-        entries = get_entries(token, page=p)
-        raw_len = len(entries)
-        entries = filter_known_entries(min_id, entries)
-        session.add_all(entries)
-        session.commit()
 
+def walk_journal(session, token):
+    """Store new journal entries, stopping at the first page with known entries.
 
-def get_entries(token, page=None):
+    Entries are bulk inserted in a single transaction along with the updated daily
+    totals. If any page fails, nothing is stored so that the next run doesn't skip
+    the missing entries.
+    """
     if "esi-wallet.read_corporation_wallets.v1" not in token.scopes:
-        return ([], 1) if page is None else []
+        return
+
+    min_id = session.execute(db.select(db.func.max(WalletJournalEntry.ref_id))).scalar()
 
+    pages = api.iter_pages(token.request_esi, token.request_esi_async,
+                           "/v4/corporations/{}/wallets/{}/journal/",
+                           (config.CORPORATION_ID, WALLET_DIVISION))
+    days = set()
     try:
-        recs = token.request_esi("/v4/corporations/{}/wallets/{}/journal/",
-                                 (config.CORPORATION_ID, WALLET_DIVISION),
-                                 params={'page': page or 1}, with_head=page is None)
+        for recs, _ in pages:
+            new_recs = filter_known_entries(min_id, recs)
+            if new_recs:
+                rows = [WalletJournalEntry.row_from_esi_record(r) for r in new_recs]
+                db.insert_ignore(session, WalletJournalEntry.__table__, rows)
+                days.update(row['date'].date() for row in rows)
+
+            if len(new_recs) != len(recs):
+                break
     except APIError:
-        return ([], 1) if page is None else []
-
-    if page is None:
-        recs, head = recs
-        return list(map(WalletJournalEntry.from_esi_record, recs)), int(head.get('X-Pages', 1))
+        session.rollback()
+        return
+    finally:
+        # Cancel pages that are no longer needed
+        pages.close()
 
-    return list(map(WalletJournalEntry.from_esi_record, recs))
+    if days:
+        WalletDailyTotal.refresh(session, min(days), max(days))
+    session.commit()
 
 
-def filter_known_entries(min_id, entries):
+def filter_known_entries(min_id, recs):
     if min_id is None:
-        return entries
+        return recs
 
-    # Binary search for min_id (entries is sorted in descending order)
-    lo, hi = 0, len(entries)
+    # Binary search for min_id (recs is sorted in descending order)
+    lo, hi = 0, len(recs)
     while lo < hi:
         mid = (lo + hi) // 2
-        if entries[mid].ref_id > min_id:
+        if recs[mid]['id'] > min_id:
             lo = mid + 1
         else:
             hi = mid
 
-    return entries[:lo]
+    return recs[:lo]
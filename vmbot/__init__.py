@@ -4,7 +4,7 @@ from __future__ import absolute_import, division, unicode_literals, print_functi
 
 import time
 from datetime import datetime
-from collections import defaultdict
+from functools import partial
 from os import path, pardir
 import subprocess
 import random
@@ -29,10 +29,15 @@ from .async.km_feed import KMFeed
 from .helpers.exceptions import TimeoutError
 from .helpers import database as db
 from .helpers import api
+from .helpers import staticdata
 from .helpers.sso import SSOToken
 from .helpers.decorators import HAS_TIMEOUT, timeout, requires_role, inject_db
 from .helpers.format import format_jid_nick
 from .helpers.regex import PUBBIE_REGEX, ZKB_REGEX, YT_REGEX
+from .services.cmdexecutor import CommandExecutor
+from .services.presencebuffer import PresenceBuffer
+from .services.occupancy import OccupancyIndex
+from .services.linkcache import LinkExpansionCache
 from .models.message import Message
 from .models.user import User, Nickname
 from .models import Note
@@ -54,11 +59,14 @@ class MUCJabberBot(JabberBot):
     MAX_CHAT_CHARS = 2000
     MAX_CHAT_LINES = 10
 
+    MSG_COMMAND_BUSY = "Too many commands are running right now, please try again in a moment"
+
     def __init__(self, username, password, res, *args, **kwargs):
         super(MUCJabberBot, self).__init__(username, password, res, *args, **kwargs)
         self.jid.setResource(res)
         self.occupant_jids = Multiset()
-        self.nick_dict = defaultdict(dict)
+        self.occupancy = OccupancyIndex()
+        self.cmd_executor = CommandExecutor()
 
     def get_sender_username(self, mess):
         from_ = mess.getFrom()
@@ -74,11 +82,7 @@ class MUCJabberBot(JabberBot):
 
         # In MUCs and MUC PMs, the from attribute contains the sender's MUC address
         if mess.getType() == b"groupchat" or from_.getStripped() in config.JABBER['chatrooms']:
-            room, nick = from_.getNode(), from_.getResource()
-            try:
-                from_ = self.nick_dict[room][nick]
-            except KeyError:
-                from_ = JID(b"default")
+            from_ = self.occupancy.jid(from_.getNode(), from_.getResource()) or JID(b"default")
 
         return from_ if full_jid else from_.getNode()
 
@@ -99,11 +103,11 @@ class MUCJabberBot(JabberBot):
             # JID attribute is only included in MUC presence stanzas
             jid = JID(jid)
             if presence.getType() == self.OFFLINE:
-                self.nick_dict[room].pop(nick, None)
+                self.occupancy.leave(room, nick)
                 self.occupant_jids[jid] -= 1
             else:
                 self.occupant_jids[jid] += 1
-                self.nick_dict[room][nick] = jid
+                self.occupancy.join(room, nick, jid)
 
         return super(MUCJabberBot, self).callback_presence(conn, presence)
 
@@ -149,13 +153,34 @@ class MUCJabberBot(JabberBot):
         if cmd is None:
             return
 
+        if cmd._jabberbot_command_thread:
+            # Keep slow commands from blocking the XMPP receive loop
+            self.submit_command(mess, cmd, args,
+                                lambda reply: self.send_command_reply(mess, cmd, reply))
+            return
+
+        self.send_command_reply(mess, cmd, self.execute_command(mess, cmd, args))
+
+    def submit_command(self, mess, cmd, args, callback):
+        """Execute cmd on the command executor and pass its reply to callback from idle_proc.
+
+        Reply with MSG_COMMAND_BUSY if the command is rejected.
+        """
+        user = self.get_uname_from_mess(mess, full_jid=True).getStripped()
+        room = mess.getFrom().getStripped() if mess.getType() == b"groupchat" else None
+        if not self.cmd_executor.submit(user, room, callback,
+                                        self.execute_command, mess, cmd, args):
+            self.send_simple_reply(mess, self.MSG_COMMAND_BUSY)
+
+    def execute_command(self, mess, cmd, args):
         try:
-            reply = cmd(mess, args)
+            return cmd(mess, args)
         except Exception:
             self.log.exception('An error happened while processing a message ("%s") from %s:',
-                               text, mess.getFrom())
-            reply = self.MSG_ERROR_OCCURRED
+                               mess.getBody(), mess.getFrom())
+            return self.MSG_ERROR_OCCURRED
 
+    def send_command_reply(self, mess, cmd, reply):
         if reply:
             lines = reply.count('\n') + reply.count("<br/>") + reply.count("<br />")
             if (len(reply) > self.MAX_CHAT_CHARS or lines > self.MAX_CHAT_LINES
@@ -165,6 +190,15 @@ class MUCJabberBot(JabberBot):
 
             self.send_simple_reply(mess, reply)
 
+    def idle_proc(self):
+        """Send results of commands that were executed in the background."""
+        self.cmd_executor.process()
+        return super(MUCJabberBot, self).idle_proc()
+
+    def shutdown(self):
+        self.cmd_executor.shutdown(wait=False)
+        return super(MUCJabberBot, self).shutdown()
+
     @botcmd
     def help(self, mess, args):
         reply = super(MUCJabberBot, self).help(mess, args)
@@ -192,8 +226,14 @@ class MUCJabberBot(JabberBot):
     def nopm(self, mess, args):
         """<command> [args] - Forces command to be sent to the channel"""
         cmd, args = self.get_cmd_from_text(args.lstrip())
-        if cmd is not None:
-            self.send_simple_reply(mess, cmd(mess, args))
+        if cmd is None:
+            return
+
+        if cmd._jabberbot_command_thread:
+            self.submit_command(mess, cmd, args, lambda reply: self.send_simple_reply(mess, reply))
+            return
+
+        self.send_simple_reply(mess, cmd(mess, args))
 
 
 class VMBot(ACL, Director, Say, Fun, Chains, Pager, Price, EVEUtils, MUCJabberBot):
@@ -205,16 +245,27 @@ class VMBot(ACL, Director, Say, Fun, Chains, Pager, Price, EVEUtils, MUCJabberBo
         self.startup_time = datetime.utcnow()
         super(VMBot, self).__init__(*args, **kwargs)
 
+        if config.STATICDATA_SNAPSHOT:
+            staticdata.load_snapshot()
+
         self.message_trigger = time.time() + 30
         self.sess = db.Session()
 
-        self.api_pool = futures.ThreadPoolExecutor(max_workers=20)
+        self.presence_buffer = PresenceBuffer()
+        self.api_pool = futures.ThreadPoolExecutor(max_workers=api.API_POOL_WORKERS)
+        self.link_cache = LinkExpansionCache()
+        self._link_replies = []
         self.yt_quota_exceeded = False
         if config.ZKILL_FEED:
-            self.km_feed = KMFeed(config.CORPORATION_ID)
+            self.km_feed = KMFeed(config.CORPORATION_ID, self.api_pool)
 
     def idle_proc(self):
-        """Retrieve and send stored messages."""
+        """Send expanded links, store buffered presences, and retrieve and send stored messages."""
+        self.send_link_replies()
+
+        if self.presence_buffer.flush_due():
+            self.presence_buffer.flush(self.sess)
+
         if self.message_trigger <= time.time():
             if config.ZKILL_FEED:
                 for km_res in self.km_feed.process():
@@ -230,7 +281,7 @@ class VMBot(ACL, Director, Say, Fun, Chains, Pager, Price, EVEUtils, MUCJabberBo
                 self.sess.delete(mess)
 
             # Notes
-            for mess in self.pager_queue.fetch(self.nick_dict, self.sess):
+            for mess in self.pager_queue.fetch(self.occupancy, self.sess):
                 self.send(**mess.send_dict)
 
             self.sess.commit()
@@ -239,24 +290,22 @@ class VMBot(ACL, Director, Say, Fun, Chains, Pager, Price, EVEUtils, MUCJabberBo
         return super(VMBot, self).idle_proc()
 
     def callback_presence(self, conn, presence):
-        jid = presence.getJid()
+        full_jid = presence.getJid()
         nick_str = presence.getFrom().getResource()
 
-        if jid is not None:
-            jid = JID(jid).getStripped()
-            nick = self.sess.get(Nickname, (nick_str, jid))
-
-            if nick is None:
-                nick = Nickname(nick_str)
-                nick.user = (self.sess.get(User, jid, options=(db.joinedload(User.nicks),))
-                             or User(jid))
-                self.sess.add(nick)
-            else:
-                nick.last_seen = datetime.utcnow()
+        if full_jid is not None:
+            # Stored in bulk by idle_proc
+            self.presence_buffer.record(nick_str, JID(full_jid).getStripped())
 
-            self.sess.commit()
+        res = super(VMBot, self).callback_presence(conn, presence)
+
+        # Deliver waiting notes as soon as their receiver joins
+        if full_jid is not None and presence.getType() != self.OFFLINE:
+            for mess in self.pager_queue.fetch_for_occupant(presence.getFrom().getNode(),
+                                                            nick_str, JID(full_jid), self.sess):
+                self.send(**mess.send_dict)
 
-        return super(VMBot, self).callback_presence(conn, presence)
+        return res
 
     def callback_message(self, conn, mess):
         reply = super(VMBot, self).callback_message(conn, mess)
@@ -272,42 +321,62 @@ class VMBot(ACL, Director, Say, Fun, Chains, Pager, Price, EVEUtils, MUCJabberBo
 
             # zBot
             if config.ZBOT:
-                matches = {match.group(1) for match in ZKB_REGEX.finditer(msg)}
-                replies = [api.zbot(match) for match in matches]
-                if replies:
-                    self.send_simple_reply(mess, '\n'.join(replies))
+                keys = {("zkb", match.group(1)) for match in ZKB_REGEX.finditer(msg)}
+                futs = self.link_cache.get_many(list(keys), self._expand_zbots)
+                if futs:
+                    self._link_replies.append((mess, futs))
 
             # YTBot
             if not self.yt_quota_exceeded:
                 matches = {match.group(1) for match in YT_REGEX.finditer(msg)}
-                replies = []
-                for match in matches:
-                    reply = api.ytbot(match)
-                    if reply is None:
-                        continue
-                    if reply is False:
-                        self.yt_quota_exceeded = True
-                        break
-                    replies.append(reply)
-
-                if replies:
-                    self.send_simple_reply(mess, '\n'.join(replies))
+                futs = [self.link_cache.get(("yt", match), partial(api.expand_ytbot, match))
+                        for match in matches]
+                if futs:
+                    self._link_replies.append((mess, futs))
 
         return reply
 
+    def _expand_zbots(self, keys):
+        kills = api.expand_zbots([kill_id for _, kill_id in keys], self.api_pool)
+        return {("zkb", kill_id): res for kill_id, res in kills.items()}
+
+    def send_link_replies(self):
+        """Send replies to messages whose links have all been expanded."""
+        pending = []
+        for mess, futs in self._link_replies:
+            if not all(f.done() for f in futs):
+                pending.append((mess, futs))
+                continue
+
+            replies = []
+            for f in futs:
+                try:
+                    reply = f.result()
+                except Exception:
+                    self.log.exception("An error happened while expanding a link in %s:",
+                                       mess.getBody())
+                    continue
+
+                if reply is None:
+                    continue
+                if reply is False:
+                    # YouTube quota exceeded
+                    self.yt_quota_exceeded = True
+                    break
+                replies.append(reply)
+
+            if replies:
+                self.send_simple_reply(mess, '\n'.join(replies))
+
+        self._link_replies = pending
+
     def shutdown(self):
-        nicks = {(nick, jid.getStripped()) for room in self.nick_dict.values()
-                 for nick, jid in room.items()}
-        update_nicks = (db.update(Nickname).where(Nickname.nick == db.bindparam("n"),
-                                                  Nickname._user_jid == db.bindparam("j")).
-                        values(last_seen=datetime.utcnow()).
-                        execution_options(synchronize_session=False))
-        try:
-            self.sess.execute(update_nicks, [{"n": nick, "j": jid} for nick, jid in nicks])
-            self.sess.commit()
-        except db.OperationalError:
-            self.sess.rollback()
+        now = datetime.utcnow()
+        for _, nick, jid in self.occupancy.occupants():
+            self.presence_buffer.record(nick, jid.getStripped(), now)
+        self.presence_buffer.flush(self.sess)
 
+        self.link_cache.shutdown(wait=False)
         self.sess.close()
         if config.ZKILL_FEED:
             self.km_feed.close()
@@ -455,6 +524,13 @@ class VMBot(ACL, Director, Say, Fun, Chains, Pager, Price, EVEUtils, MUCJabberBo
             self.quit()
             return "afk shower"
 
+    @botcmd(hidden=True)
+    @requires_role("admin")
+    def cmdstats(self, mess, args):
+        """Number of running, queued, and rejected background commands"""
+        return ("{running} running, {queue_depth} queued, "
+                "{rejected} rejected command(s)").format(**self.cmd_executor.stats())
+
     @botcmd(hidden=True, force_pm=True)
     @requires_role("admin")
     def gitpull(self, mess, args):
@@ -13,11 +13,13 @@ import numpy as np
 from sklearn.neighbors import LocalOutlierFactor
 
 from ..helpers.exceptions import APIError
+from ..helpers.files import KILLMAIL_LOG
 from ..helpers.time import ISO8601_DATETIME_FMT
 from ..helpers import api
 from ..helpers import staticdata
 from ..helpers.format import format_tickers
 from ..models import ISK
+from .km_store import KillmailStore
 
 REDISQ_URL = "https://redisq.zkillboard.com/listen.php"
 KM_MIN_VAL = 5000000
@@ -51,13 +53,19 @@ class Killmail(object):
         victim = km['victim']
 
         self.id, self.value = km['killmail_id'], ISK(data['zkb']['totalValue'])
-        self._tickers = victim['corporation_id'], victim.get('alliance_id', None)
+        self._entity_ids = victim['corporation_id'], victim.get('alliance_id', None)
+        self._tickers = None
         self._ship = victim['ship_type_id']
 
+    @property
+    def entity_ids(self):
+        """(corp_id, ally_id) of the victim."""
+        return self._entity_ids
+
     @property
     def tickers(self):
-        if not isinstance(self._tickers[0], unicode):
-            self._tickers = api.get_tickers(*self._tickers)
+        if self._tickers is None:
+            self._tickers = api.get_tickers(*self._entity_ids)
         return self._tickers
 
     @property
@@ -92,17 +100,33 @@ class Lossmail(object):
 
 
 class KMFeed(object):
-    """Continuously fetch and process zKB killmails."""
+    """Continuously fetch and process zKB killmails.
+
+    Kills and losses are logged in a KillmailStore until they are processed,
+    so that they survive restarts and redelivered killmails are ignored.
+    Lossmails are resolved by the worker thread and queued with their sequence
+    numbers, so that process_losses doesn't block on API lookups.
+    """
 
-    def __init__(self, corp_id):
+    def __init__(self, corp_id, api_pool=None, store=None):
         self.corp_id = corp_id
-        self.kill_list = []
+        self.api_pool = api_pool
+        self.store = store or KillmailStore(KILLMAIL_LOG)
+        self.num_kills = 0
         self.mean_ttk = None
         self.kill_timer = None
         self.kill_timer_range = None
         self.kill_lock = threading.Lock()
         self.loss_queue = Queue.Queue()
 
+        _, num_kills, _ = self.store.summary("kill")
+        if num_kills:
+            # Resume spooling kills that were received before a restart
+            cur_time = time.time()
+            self.num_kills = num_kills
+            self.kill_timer_range = tuple(cur_time + v for v in KILL_SPOOL)
+            self.kill_timer = self.kill_timer_range[0]
+
         self.abort_exec = threading.Event()
         self.worker = threading.Thread(target=self._async_exec)
         self.worker.daemon = True
@@ -111,40 +135,47 @@ class KMFeed(object):
     def close(self):
         self.abort_exec.set()
         self.worker.join()
+        self.store.close()
 
     def process(self):
         return self.process_kills(), self.process_losses()
 
     def process_kills(self):
         with self.kill_lock:
-            if not self.kill_timer or self.kill_timer > time.time() or not self.kill_list:
+            if not self.kill_timer or self.kill_timer > time.time():
                 return
 
-            kill_sum = sum(k.value for k in self.kill_list)
-            res = "{} new kill(s) worth {:.2f} ISK:".format(len(self.kill_list), ISK(kill_sum))
+            upto, num_kills, kill_sum = self.store.summary("kill")
+            if not num_kills:
+                return
 
-            self.kill_list.sort(key=lambda k: k.value)
-            suff_val_idx = next((i for i, k in enumerate(self.kill_list)
-                                 if k.value >= KM_MIN_VAL), None)
-            del self.kill_list[:suff_val_idx]
+            res = "{} new kill(s) worth {:.2f} ISK:".format(num_kills, ISK(kill_sum))
 
-            if 1 <= len(self.kill_list) <= 3:
+            # Sorted by value
+            kills = [Killmail(p) for p in self.store.packages("kill", upto, min_value=KM_MIN_VAL)]
+            if 1 <= len(kills) <= 3:
                 res += ' '
-                highlights = self.kill_list
-            elif len(self.kill_list) <= 5:
+                highlights = kills
+            elif len(kills) <= 5:
                 res += " https://zkillboard.com/corporation/{}/".format(self.corp_id)
                 highlights = []
             else:
                 res += " https://zkillboard.com/corporation/{}/".format(self.corp_id)
                 res += "<br />Highlight(s): "
-                highlights = detect_anomalies(self.kill_list)
+                highlights = detect_anomalies(kills)
 
-            self.kill_list = []
+            self.store.ack("kill", upto)
+            self.num_kills = 0
             self.mean_ttk = None
             self.kill_timer = None
             self.kill_timer_range = None
 
-        highlights = [unicode(k) for k, _ in zip(reversed(highlights), xrange(KILL_MAX_HL))]
+        highlights = [k for k, _ in zip(reversed(highlights), xrange(KILL_MAX_HL))]
+        if self.api_pool is not None:
+            # Resolve missing tickers in parallel, formatting waits for lookups in flight
+            api.prefetch_tickers([k.entity_ids for k in highlights], self.api_pool)
+
+        highlights = [unicode(k) for k in highlights]
         if highlights:
             res += ", ".join(highlights)
 
@@ -152,20 +183,38 @@ class KMFeed(object):
 
     def process_losses(self):
         losses = []
+        upto = None
         try:
             while True:
-                losses.append(self.loss_queue.get_nowait())
+                upto, loss = self.loss_queue.get_nowait()
                 self.loss_queue.task_done()
+                if loss is not None:
+                    losses.append(loss)
         except Queue.Empty:
             pass
 
+        if upto is not None:
+            self.store.ack("loss", upto)
         if not losses:
             return
 
         return "{} new loss(es):\n".format(len(losses)) + '\n'.join(map(unicode, losses))
 
+    def _queue_loss(self, seq, package):
+        try:
+            loss = Lossmail(package)
+        except Exception:
+            # Skip the loss instead of failing on every attempt to report it
+            logging.getLogger(__name__).exception("Failed to process loss %s:",
+                                                  package['killmail']['killmail_id'])
+            loss = None
+        self.loss_queue.put((seq, loss))
+
     def _async_exec(self):
         try:
+            # Resume reporting losses that were received before a restart
+            for seq, package in self.store.pending("loss"):
+                self._queue_loss(seq, package)
             self._request()
         except Exception:
             logging.getLogger(__name__).exception("An error happened in KMFeed:")
@@ -179,18 +228,28 @@ class KMFeed(object):
             if res is None:
                 continue
 
-            if (res['killmail']['victim']['corporation_id'] == self.corp_id
-                    and res['zkb']['totalValue'] >= KM_MIN_VAL):
-                self.loss_queue.put(Lossmail(res))
+            victim = res['killmail']['victim']
+            if victim['corporation_id'] == self.corp_id and res['zkb']['totalValue'] >= KM_MIN_VAL:
+                seq = self.store.append("loss", res)
+                if seq is not None:
+                    self._queue_loss(seq, res)
             elif any(att['corporation_id'] == self.corp_id
                      for att in res['killmail']['attackers'] if 'corporation_id' in att):
                 with self.kill_lock:
-                    self.kill_list.append(Killmail(res))
+                    # Keep process_kills from acknowledging the kill without counting it
+                    if self.store.append("kill", res) is None:
+                        continue
+                    if self.api_pool is not None:
+                        # Warm the ticker cache before the kill is formatted on the main thread
+                        self.api_pool.submit(api.get_tickers, victim['corporation_id'],
+                                             victim.get('alliance_id', None))
+
+                    self.num_kills += 1
                     cur_time = time.time()
                     if self.kill_timer_range is None:
                         self.kill_timer_range = tuple(cur_time + v for v in KILL_SPOOL)
 
-                    num_kills = len(self.kill_list)
+                    num_kills = self.num_kills
                     if num_kills == 1 or self.mean_ttk is None:
                         self.mean_ttk = [0, cur_time]
                     else:
@@ -0,0 +1,116 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import json
+import os
+import threading
+import sqlite3
+import time
+import zlib
+
+from ..helpers import jsondecode
+
+
+class KillmailStore(object):
+    """Log zKB killmail packages compressed in a single sqlite database.
+
+    Packages are appended under an increasing sequence number and indexed by
+    killmail_id, so redelivered killmails are ignored. Each kind of killmail
+    (eg. kills and losses) has a cursor marking the packages that have been
+    processed. Processed packages are removed once they are older than max_age seconds.
+    """
+
+    def __init__(self, db_path, max_age=7 * 24 * 60 * 60):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA synchronous = NORMAL;")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS killmails (
+                                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                                killmail_id INTEGER NOT NULL UNIQUE,
+                                kind TEXT NOT NULL,
+                                value REAL NOT NULL,
+                                received REAL NOT NULL,
+                                package BLOB NOT NULL
+                              );""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS killmails_kind_seq "
+                           "ON killmails (kind, seq);")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS cursors (
+                                kind TEXT PRIMARY KEY,
+                                seq INTEGER NOT NULL
+                              );""")
+
+    def _cursor(self, kind):
+        row = self._conn.execute("SELECT seq FROM cursors WHERE kind = ?;", (kind,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def append(self, kind, package):
+        """Log package as kind and return its sequence number or None if it's a duplicate."""
+        data = zlib.compress(json.dumps(package, separators=(',', ':')).encode("utf-8"))
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO killmails (killmail_id, kind, value, received, package) "
+                "VALUES (?, ?, ?, ?, ?);",
+                (package['killmail']['killmail_id'], kind, package['zkb']['totalValue'],
+                 time.time(), sqlite3.Binary(data))
+            )
+            return cur.lastrowid if cur.rowcount == 1 else None
+
+    def summary(self, kind):
+        """Return (upto, count, total value) of the unprocessed packages of kind.
+
+        upto is the sequence number of the last of these packages (the current cursor
+        if there are none) and limits packages and ack to a consistent snapshot.
+        """
+        with self._lock:
+            cursor = self._cursor(kind)
+            upto, count, total = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), ?), COUNT(*), COALESCE(SUM(value), 0) "
+                "FROM killmails WHERE kind = ? AND seq > ?;",
+                (cursor, kind, cursor)
+            ).fetchone()
+        return upto, count, total
+
+    def packages(self, kind, upto, min_value=0):
+        """Return the unprocessed packages of kind up to upto worth at least min_value.
+
+        Packages are sorted by value in ascending order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT package FROM killmails WHERE kind = ? AND seq > ? AND seq <= ? "
+                "AND value >= ? ORDER BY value, seq;",
+                (kind, self._cursor(kind), upto, min_value)
+            ).fetchall()
+        return [jsondecode.loads(zlib.decompress(bytes(row[0]))) for row in rows]
+
+    def pending(self, kind):
+        """Return (seq, package) of all unprocessed packages of kind in the order of arrival."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, package FROM killmails WHERE kind = ? AND seq > ? ORDER BY seq;",
+                (kind, self._cursor(kind))
+            ).fetchall()
+        return [(seq, jsondecode.loads(zlib.decompress(bytes(data)))) for seq, data in rows]
+
+    def ack(self, kind, upto):
+        """Mark the packages of kind up to upto as processed and remove old packages."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cursors (kind, seq) VALUES (?, ?);",
+                               (kind, upto))
+            self._conn.execute(
+                "DELETE FROM killmails WHERE received < ? AND seq <= "
+                "(SELECT seq FROM cursors WHERE cursors.kind = killmails.kind);",
+                (time.time() - self.max_age,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
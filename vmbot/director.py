@@ -11,11 +11,10 @@ from terminaltables import AsciiTable
 
 from .botcmd import botcmd
 from .helpers.exceptions import APIError, APIStatusError
-from .helpers import database as db
 from .helpers import api
 from .helpers.decorators import requires_role, requires_dir_chat, requires_muc, inject_db
 from .helpers.format import format_ref_type
-from .models import ISK, WalletJournalEntry
+from .models import ISK, WalletDailyTotal
 
 import config
 
@@ -93,7 +92,7 @@ class Director(object):
     def pingall(self, mess, args):
         """Pings everyone in the current multi-user chatroom"""
         reply = "All hands on {} dick!\n".format(self.get_sender_username(mess))
-        reply += ", ".join(self.nick_dict[mess.getFrom().getNode()].keys())
+        reply += ", ".join(self.occupancy.nicks(mess.getFrom().getNode()))
         return reply
 
     @botcmd(hidden=True, force_pm=True)
@@ -107,11 +106,6 @@ class Director(object):
         totp = pyotp.TOTP(config.TOTP_KEYS[args])
         return totp.now()
 
-    @staticmethod
-    def _wallet_type_stmt():
-        select_refs = db.select(WalletJournalEntry.ref_type, db.func.sum(WalletJournalEntry.amount))
-        return select_refs.group_by(WalletJournalEntry.ref_type)
-
     @botcmd(disable_if=not config.REVENUE_TRACKING)
     @inject_db
     @requires_dir_chat
@@ -120,16 +114,13 @@ class Director(object):
         data = []
         table = [["Type"]]
         now = datetime.utcnow()
-        select_refs = self._wallet_type_stmt().where(WalletJournalEntry.amount > 0)
 
         for title, from_date in REVENUE_COLS:
             table[0].append(title)
 
             if isinstance(from_date, timedelta):
                 from_date = now - from_date
-            data.append(dict(
-                session.execute(select_refs.where(WalletJournalEntry.date > from_date))
-            ))
+            data.append(WalletDailyTotal.totals(session, "income", from_date))
 
         for name, types in REVENUE_ROWS:
             row = [name]
@@ -162,12 +153,8 @@ class Director(object):
     @requires_dir_chat
     def income(self, mess, args, session):
         """Income statistics for the last month"""
-        select_refs = self._wallet_type_stmt().where(
-            WalletJournalEntry.amount > 0,
-            WalletJournalEntry.date > datetime.utcnow() - timedelta(days=30)
-        )
-
-        res = sorted(session.execute(select_refs).all(), key=lambda x: x[1], reverse=True)
+        res = WalletDailyTotal.totals(session, "income", datetime.utcnow() - timedelta(days=30))
+        res = sorted(res.items(), key=lambda x: x[1], reverse=True)
         return self._type_overview(res)
 
     @botcmd(disable_if=not config.REVENUE_TRACKING)
@@ -175,10 +162,27 @@ class Director(object):
     @requires_dir_chat
     def expenses(self, mess, args, session):
         """Expense statistics for the last month"""
-        select_refs = self._wallet_type_stmt().where(
-            WalletJournalEntry.amount < 0,
-            WalletJournalEntry.date > datetime.utcnow() - timedelta(days=30)
-        )
-
-        res = sorted(session.execute(select_refs).all(), key=lambda x: x[1])
+        res = WalletDailyTotal.totals(session, "expenses", datetime.utcnow() - timedelta(days=30))
+        res = sorted(res.items(), key=lambda x: x[1])
         return self._type_overview(res)
+
+    @botcmd(hidden=True, disable_if=not config.REVENUE_TRACKING)
+    @inject_db
+    @requires_role("admin")
+    def wallettotals(self, mess, args, session):
+        """[rebuild] - Checks the daily wallet totals against the journal or rebuilds them"""
+        if args.strip().lower() == "rebuild":
+            WalletDailyTotal.refresh(session)
+            session.commit()
+            return "Daily wallet totals have been rebuilt"
+
+        diffs = WalletDailyTotal.check(session)
+        if not diffs:
+            return "Daily wallet totals match the journal"
+
+        res = "{} daily total(s) differ from the journal:".format(len(diffs))
+        for day, ref_type, stored, journal in diffs[:10]:
+            res += "<br />{} {}: {:,.2f}/{:,.2f} ISK stored, {:,.2f}/{:,.2f} ISK in journal".format(
+                day, format_ref_type(ref_type), stored[0], stored[1], journal[0], journal[1]
+            )
+        return res
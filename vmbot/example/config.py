@@ -19,6 +19,10 @@ PUBBIE_SMACKTALK = False
 ZBOT = True
 REVENUE_TRACKING = False
 
+# Load the static data required for lookups into memory at startup
+# Trades roughly 100 MB of memory for lock-free lookups
+STATICDATA_SNAPSHOT = False
+
 # Jabber credentials
 # Primary chatrooms: main corp channel(s), feeds will be posted there (if enabled)
 # Director chatrooms: director channel(s), some commands are restricted to those channels
@@ -221,7 +221,7 @@ class Fun(object):
         """Like a box of chocolates, you never know what you're gonna get"""
         return random.choice(_read_lines(EMOTES)).split()[-1]
 
-    @botcmd
+    @botcmd(thread=True)
     def rtq(self, mess, args):
         """Like a box of chocolates, but without emotes this time"""
         try:
@@ -3,114 +3,269 @@
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 from datetime import datetime
+from functools import partial
+from collections import deque
+from itertools import islice
+import cookielib
 import threading
 import logging
 import traceback
+import time
 
+from concurrent import futures
 from ..jabberbot import __version__ as jb_version
 import requests
+from requests.adapters import HTTPAdapter
 from cachecontrol import CacheControl
-from cachecontrol.caches import FileCache
+from cachecontrol.adapter import CacheControlAdapter
 
 from .files import HTTPCACHE
+from .httpcache import SQLiteCache
+from . import jsondecode
 from .exceptions import APIError, APIStatusError, APIRequestError
 from .time import ISO8601_DATETIME_FMT, parse_iso8601_duration
 from . import staticdata
 from .format import format_tickers
 from ..models import ISK
+from ..services.namecache import NameResolver
+from ..services.tickercache import TickerCache
+from ..services.ratelimit import ESIRateLimiter
 
 import config
 
-_API_REG = threading.local()
+API_POOL_WORKERS = 20
+MAX_IN_FLIGHT = 16
+# One keep-alive connection per thread that may issue requests concurrently
+# (api_pool and _http_pool). Other threads get extra, non-pooled connections when necessary.
+POOL_MAXSIZE = API_POOL_WORKERS + MAX_IN_FLIGHT
+NOT_MODIFIED = object()
+STREAM_CHUNK_SIZE = 64 * 1024
+PAGE_PARALLELISM = 4
+PAGE_RETRIES = 2
+PAGE_RETRY_DELAY = 1
+# Killmails are immutable, video statistics aren't
+ZBOT_CACHE_TTL = 7 * 24 * 60 * 60
+YTBOT_CACHE_TTL = 10 * 60
+
+_sess_lock = threading.Lock()
+_shared_sess = None
+_cache_lock = threading.Lock()
+_http_cache = None
+_http_pool = futures.ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT)
+_esi_limiter = ESIRateLimiter()
+
+
+def _get_http_cache():
+    """Retrieve or create the HTTP cache shared by all sessions."""
+    global _http_cache
+    if _http_cache is None:
+        with _cache_lock:
+            if _http_cache is None:
+                _http_cache = SQLiteCache(HTTPCACHE)
+    return _http_cache
+
+
+def http_cache_stats():
+    """Report size and hit rate of the HTTP cache."""
+    return _get_http_cache().stats()
+
+
+class _BlockCookies(cookielib.DefaultCookiePolicy):
+    """Refuse all cookies, so that threads sharing a session can't affect each other."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+class _ESILimitedAdapter(HTTPAdapter):
+    """Throttle ESI requests that reach the network with the shared ESIRateLimiter."""
+
+    def send(self, request, **kwargs):
+        if not request.url.startswith(config.ESI['base_url']):
+            return super(_ESILimitedAdapter, self).send(request, **kwargs)
+
+        _esi_limiter.acquire(ESIRateLimiter.route_group(request.path_url.split('?', 1)[0]))
+        try:
+            r = super(_ESILimitedAdapter, self).send(request, **kwargs)
+        except Exception:
+            _esi_limiter.release()
+            raise
+        # Error responses aren't raised here, so their headers always update the budget
+        _esi_limiter.release(r.headers)
+        return r
+
+
+class _CachingAdapter(CacheControlAdapter, _ESILimitedAdapter):
+    """Answer requests from the HTTP cache before they are throttled.
+
+    CacheControlAdapter only passes requests it can't answer from the cache on to
+    _ESILimitedAdapter, so cache hits neither wait for nor affect the ESI error budget.
+    """
+
+
+def _create_session():
+    sess = requests.session()
+    ua = "XVMX-VMBot (JabberBot {}) ".format(jb_version) + sess.headers['User-Agent']
+    sess.headers['User-Agent'] = ua
+    sess.cookies.set_policy(_BlockCookies())
+
+    return CacheControl(sess, cache=_get_http_cache(),
+                        adapter_class=partial(_CachingAdapter, pool_maxsize=POOL_MAXSIZE))
 
 
 def _get_requests_session():
-    """Retrieve or create a thread-local requests session."""
-    try:
-        return _API_REG.http_sess
-    except AttributeError:
-        sess = requests.session()
-        ua = "XVMX-VMBot (JabberBot {}) ".format(jb_version) + sess.headers['User-Agent']
-        sess.headers['User-Agent'] = ua
+    """Retrieve or create the requests session shared by all threads."""
+    global _shared_sess
+    if _shared_sess is None:
+        with _sess_lock:
+            if _shared_sess is None:
+                _shared_sess = _create_session()
+    return _shared_sess
+
 
-        _API_REG.http_sess = CacheControl(sess, cache=FileCache(HTTPCACHE))
-        return _API_REG.http_sess
+def connection_pool_stats():
+    """Report connection usage of the shared session per host."""
+    stats = {}
+    adapter = _get_requests_session().get_adapter("https://")
+    pools = adapter.poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        stats[pool.host] = {'maxsize': pool.pool.maxsize, 'available': pool.pool.qsize(),
+                            'connections': pool.num_connections, 'requests': pool.num_requests}
+    return stats
+
+
+def _request_names(ids):
+    return request_esi("/v3/universe/names/", json=ids, method="POST")
+
+
+_name_resolver = NameResolver(_request_names)
 
 
 def get_names(*ids):
     """Resolve char_ids/corp_ids/ally_ids to their names."""
-    try:
-        res = request_esi("/v3/universe/names/", json=ids, method="POST")
-    except APIError:
-        return {id_: "{ERROR}" for id_ in ids}
+    return _name_resolver(ids)
 
-    # ESI returns either names for all ids or none at all
-    # See https://esi.evetech.net/ui/#/Universe/post_universe_names
-    return {item['id']: item['name'] for item in res}
+
+def _request_ticker(category, entity_id):
+    if category == "corporation":
+        return request_esi("/v5/corporations/{}/", (entity_id,))
+    return request_esi("/v4/alliances/{}/", (entity_id,))
+
+
+_ticker_cache = TickerCache(_request_ticker)
 
 
 def get_tickers(corp_id, ally_id):
     """Resolve corp_id/ally_id to their respective ticker(s)."""
-    corp_ticker = None
-    if corp_id:
-        corp_ticker = "ERROR"
-        try:
-            corp = request_esi("/v5/corporations/{}/", (corp_id,))
-        except APIError:
-            pass
-        else:
-            corp_ticker = corp['ticker']
-            ally_id = ally_id or corp.get('alliance_id', None)
-
-    alliance_ticker = None
-    if ally_id:
-        alliance_ticker = "ERROR"
-        try:
-            ally = request_esi("/v4/alliances/{}/", (ally_id,))
-        except APIError:
-            pass
-        else:
-            alliance_ticker = ally['ticker']
+    return _ticker_cache(corp_id, ally_id)
 
-    return corp_ticker, alliance_ticker
 
+def prefetch_tickers(pairs, pool):
+    """Start warming the ticker cache for a batch of (corp_id, ally_id) pairs using pool."""
+    _ticker_cache.prefetch(pairs, pool)
 
-def zbot(kill_id):
-    """Create a compact overview of a zKB killmail."""
+
+def _call(pool, func, *args):
+    """Submit func(*args) to pool or run it right away if pool is None."""
+    if pool is not None:
+        return pool.submit(func, *args)
+
+    f = futures.Future()
     try:
-        zkb = request_api("https://zkillboard.com/api/killID/{}/".format(kill_id)).json()
-    except APIError as e:
-        return unicode(e)
+        f.set_result(func(*args))
+    except Exception as e:
+        f.set_exception(e)
+    return f
+
 
+def _fetch_killmail(kill_id):
+    """Return (zkb, killmail) of kill_id or None if zKB doesn't know the kill."""
+    zkb = request_api("https://zkillboard.com/api/killID/{}/".format(kill_id)).json()
     if not zkb:
-        return "Failed to load data for https://zkillboard.com/kill/{}/".format(kill_id)
+        return None
 
     zkb = zkb[0]['zkb']
-    try:
-        killdata = request_esi("/v1/killmails/{}/{}/", (kill_id, zkb['hash']))
-    except APIError as e:
-        return unicode(e)
+    return zkb, request_esi("/v1/killmails/{}/{}/", (kill_id, zkb['hash']))
 
-    victim = killdata['victim']
-    name = get_names(victim.get('character_id', victim['corporation_id'])).values()[0]
-    system = staticdata.system_data(killdata['solar_system_id'])
-    corp_ticker, alliance_ticker = get_tickers(victim['corporation_id'],
-                                               victim.get('alliance_id', None))
-    killtime = datetime.strptime(killdata['killmail_time'], ISO8601_DATETIME_FMT)
 
-    return ("{} {} | {} ({:,} point(s)) | {:.2f} ISK | "
-            "{} ({}) | {:,} attacker(s) ({:,} damage) | {:%Y-%m-%d %H:%M:%S}").format(
-        name, format_tickers(corp_ticker, alliance_ticker),
-        staticdata.type_name(victim['ship_type_id']), zkb['points'],
-        ISK(zkb['totalValue']), system['system_name'], system['region_name'],
-        len(killdata['attackers']), victim['damage_taken'], killtime
-    )
+def expand_zbots(kill_ids, pool=None):
+    """Create compact overviews of several zKB killmails.
 
+    Killmails are fetched concurrently on pool. The tickers of each victim are looked up
+    as soon as its killmail arrives, all victim names are resolved in a single batch.
+    Return {kill_id: (overview, ttl)} with ttl being None if the overview mustn't be cached.
+    """
+    res = {}
+    km_futs = {_call(pool, _fetch_killmail, kill_id): kill_id for kill_id in set(kill_ids)}
+    kills = {}
+    for f in futures.as_completed(km_futs):
+        kill_id = km_futs[f]
+        try:
+            km = f.result()
+        except APIError as e:
+            res[kill_id] = unicode(e), None
+            continue
+
+        if km is None:
+            # zKB may not have processed the kill yet
+            res[kill_id] = ("Failed to load data for "
+                            "https://zkillboard.com/kill/{}/".format(kill_id)), None
+            continue
+
+        victim = km[1]['victim']
+        kills[kill_id] = km + (_call(pool, get_tickers, victim['corporation_id'],
+                                     victim.get('alliance_id', None)),)
+
+    victim_ids = [km['victim'].get('character_id', km['victim']['corporation_id'])
+                  for _, km, _ in kills.values()]
+    names = get_names(*victim_ids) if victim_ids else {}
+
+    for kill_id, (zkb, killdata, ticker_fut) in kills.items():
+        victim = killdata['victim']
+        name = names[victim.get('character_id', victim['corporation_id'])]
+        system = staticdata.system_data(killdata['solar_system_id'])
+        corp_ticker, alliance_ticker = ticker_fut.result()
+        killtime = datetime.strptime(killdata['killmail_time'], ISO8601_DATETIME_FMT)
+
+        res[kill_id] = ("{} {} | {} ({:,} point(s)) | {:.2f} ISK | "
+                        "{} ({}) | {:,} attacker(s) ({:,} damage) | "
+                        "{:%Y-%m-%d %H:%M:%S}").format(
+            name, format_tickers(corp_ticker, alliance_ticker),
+            staticdata.type_name(victim['ship_type_id']), zkb['points'],
+            ISK(zkb['totalValue']), system['system_name'], system['region_name'],
+            len(killdata['attackers']), victim['damage_taken'], killtime
+        ), ZBOT_CACHE_TTL
 
-def ytbot(video_id):
-    """Create a compact overview of a YouTube video."""
+    return res
+
+
+def expand_zbot(kill_id, pool=None):
+    """Create a compact overview of a zKB killmail.
+
+    Return (overview, ttl) with ttl being None if the overview mustn't be cached.
+    """
+    return expand_zbots([kill_id], pool)[kill_id]
+
+
+def zbot(kill_id):
+    """Create a compact overview of a zKB killmail."""
+    return expand_zbot(kill_id)[0]
+
+
+def expand_ytbot(video_id):
+    """Create a compact overview of a YouTube video.
+
+    Return (overview, ttl) with ttl being None if the overview mustn't be cached.
+    Overviews are False if the API quota is exhausted and None if there is no video.
+    """
     if not config.YT_KEY:
-        return False
+        return False, None
 
     fields = ("items(snippet(publishedAt,channelTitle,liveBroadcastContent,localized/title),"
               "contentDetails(duration,definition),statistics(viewCount,likeCount))")
@@ -122,15 +277,15 @@ def ytbot(video_id):
         res = e.response.json()
         if e.status_code == 403:
             if any(err['reason'] == "quotaExceeded" for err in res['error']['errors']):
-                return False
+                return False, None
         elif e.status_code == 404:
-            return None
-        return unicode(e) + ": " + res['error']['message']
+            return None, None
+        return unicode(e) + ": " + res['error']['message'], None
     except APIError as e:
-        return unicode(e)
+        return unicode(e), None
 
     if not yt['items']:
-        return None
+        return None, None
     yt = yt['items'][0]
 
     res = yt['snippet']['localized']['title']
@@ -155,11 +310,27 @@ def ytbot(video_id):
     published = datetime.strptime(yt['snippet']['publishedAt'], ISO8601_DATETIME_FMT)
     res += " | {:%Y-%m-%d %H:%M:%S}".format(published)
 
-    return res
+    return res, YTBOT_CACHE_TTL
 
 
-def request_esi(route, fmt=(), params=None, data=None, headers=None,
-                timeout=3, json=None, method="GET", with_head=False):
+def ytbot(video_id):
+    """Create a compact overview of a YouTube video."""
+    return expand_ytbot(video_id)[0]
+
+
+def _iter_stream(r):
+    """Decode a streamed JSON array response element by element."""
+    try:
+        for obj in jsondecode.iter_array(r.iter_content(STREAM_CHUNK_SIZE)):
+            yield obj
+    except requests.RequestException as e:
+        raise APIRequestError(e, "Error while connecting to API: {}".format(e))
+    finally:
+        r.close()
+
+
+def _request_esi(send, route, fmt, params, data, headers, timeout, json, method, with_head,
+                 etag, stream):
     url = route.format(*fmt)
     if url.startswith('/'):
         url = config.ESI['base_url'] + url
@@ -168,30 +339,130 @@ def request_esi(route, fmt=(), params=None, data=None, headers=None,
     if params is not None:
         full_params.update(params)
 
-    r = request_api(url, params=full_params, data=data, headers=headers,
-                    timeout=timeout, json=json, method=method)
+    if etag is not None:
+        headers = {} if headers is None else headers.copy()
+        headers.setdefault('If-None-Match', etag)
+
+    r = send(url, params=full_params, data=data, headers=headers,
+             timeout=timeout, json=json, method=method, stream=stream)
 
     if not r.from_cache and 'warning' in r.headers:
         # Versioned endpoint is outdated (199) or deprecated (299)
         kw = "outdated" if r.headers['warning'][:3] == "199" else "deprecated"
-        # Omit top stack frame (this function) and strip trailing newline
-        trace = "".join(traceback.format_stack(limit=3)[:-1])[:-1]
+        # Omit top two stack frames (this function and request_esi) and strip trailing newline
+        trace = "".join(traceback.format_stack(limit=4)[:-2])[:-1]
 
         warn = 'Route "{}" is {}'.format(route, kw)
         warn += "\nResponse header: warning: " + r.headers['warning']
         warn += "\nTraceback (most recent call last):\n```\n" + trace + "\n```"
         logging.getLogger(__name__ + ".esi").warning(warn, extra={'gh_labels': ["esi-warning"]})
 
+    if etag is not None and (r.status_code == 304 or r.headers.get('ETag', None) == etag):
+        body = NOT_MODIFIED
+    elif stream:
+        body = _iter_stream(r)
+    else:
+        body = jsondecode.loads(r.content)
+
     if with_head:
-        return r.json(), r.headers
-    return r.json()
+        return body, r.headers
+    return body
+
+
+def esi_limiter_stats():
+    """Report ESI error budget and throttling of ESI requests."""
+    return _esi_limiter.stats()
+
+
+def request_esi(route, fmt=(), params=None, data=None, headers=None,
+                timeout=3, json=None, method="GET", with_head=False, etag=None, stream=False):
+    """Request an ESI route and decode its response.
+
+    If etag is given and the response still carries it, the body is neither
+    downloaded (ESI answers 304) nor decoded and NOT_MODIFIED is returned instead.
+    If stream is True, the response must be a JSON array and is returned as a
+    generator decoding its elements while the body is downloaded.
+    """
+    return _request_esi(request_api, route, fmt, params, data, headers,
+                        timeout, json, method, with_head, etag, stream)
+
+
+def request_esi_async(route, fmt=(), params=None, data=None, headers=None,
+                      timeout=3, json=None, method="GET", with_head=False, etag=None):
+    """Schedule an ESI request on the shared HTTP pool.
+
+    Return a Future resolving to the result of the equivalent request_esi call.
+    """
+    return _http_pool.submit(_request_esi, request_api, route, fmt, params, data, headers,
+                             timeout, json, method, with_head, etag, False)
+
+
+def _is_transient(e):
+    return isinstance(e, APIRequestError) or (isinstance(e, APIStatusError)
+                                              and e.status_code >= 500)
+
+
+def _retry(attempt_fn, retries):
+    """Call attempt_fn(attempt) until it succeeds, retrying on transient errors."""
+    for attempt in xrange(retries + 1):
+        try:
+            return attempt_fn(attempt)
+        except APIError as e:
+            if attempt == retries or not _is_transient(e):
+                raise
+        time.sleep(PAGE_RETRY_DELAY * (attempt + 1))
+
+
+def iter_pages(request, request_async, route, fmt=(), params=None, headers=None, timeout=5,
+               stream=False, parallel=PAGE_PARALLELISM, retries=PAGE_RETRIES):
+    """Request all pages of a paged ESI route.
+
+    request and request_async are request_esi and request_esi_async or the
+    equivalent methods of an SSOToken. Yield (page, headers) in page order.
+    Page 1 is requested on the calling thread (and streamed if stream is True)
+    to learn the number of pages from X-Pages. At most parallel of the remaining
+    pages are in flight at once, with the next page requested as each page is consumed.
+    Closing the generator cancels pages that haven't been requested yet.
+    Pages failing with connection errors or 5xx responses are retried.
+    """
+    params = params or {}
+
+    def submit(page):
+        return request_async(route, fmt, params=dict(params, page=page), headers=headers,
+                             timeout=timeout, with_head=True)
+
+    body, head = _retry(lambda _: request(route, fmt, params=dict(params, page=1),
+                                          headers=headers, timeout=timeout, with_head=True,
+                                          stream=stream), retries)
+    remaining = iter(xrange(2, int(head.get('X-Pages', 1)) + 1))
+    pending = deque()
+
+    def fill():
+        for page in islice(remaining, parallel - len(pending)):
+            pending.append((page, submit(page)))
+
+    try:
+        # Start downloading while page 1 is processed
+        fill()
+        yield body, head
+        del body
+
+        while pending:
+            page, fut = pending.popleft()
+            res = _retry(lambda attempt: (fut if not attempt else submit(page)).result(), retries)
+            fill()
+            yield res
+    finally:
+        for _, fut in pending:
+            fut.cancel()
 
 
 def request_api(url, params=None, data=None, headers=None,
-                auth=None, timeout=3, json=None, method="GET"):
+                auth=None, timeout=3, json=None, method="GET", stream=False):
     try:
         r = _get_requests_session().request(method, url, params=params, data=data,
-                                            headers=headers, auth=auth, timeout=timeout, json=json)
+                                            headers=headers, auth=auth, timeout=timeout, json=json,
+                                            stream=stream)
         r.raise_for_status()
     except requests.HTTPError as e:
         raise APIStatusError(e, "API returned error code {}".format(e.response.status_code))
@@ -199,3 +470,10 @@ def request_api(url, params=None, data=None, headers=None,
         raise APIRequestError(e, "Error while connecting to API: {}".format(e))
 
     return r
+
+
+def request_api_async(url, params=None, data=None, headers=None,
+                      auth=None, timeout=3, json=None, method="GET"):
+    """Schedule a request on the shared HTTP pool, returning a Future."""
+    return _http_pool.submit(request_api, url, params, data, headers,
+                             auth, timeout, json, method)
@@ -3,11 +3,12 @@
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 from sqlalchemy import (create_engine, event, Column, Boolean, Integer, BigInteger, Float,
-                        String, Text, Enum, DateTime, LargeBinary, PickleType, ForeignKey, Index)
+                        String, Text, Enum, Date, DateTime, LargeBinary, PickleType, ForeignKey,
+                        Index)
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship, joinedload, selectinload
-from sqlalchemy.sql import select, update, delete, bindparam, null, func
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import select, insert, update, delete, bindparam, null, func, case
+from sqlalchemy.exc import OperationalError, IntegrityError
 
 import config
 
@@ -31,5 +32,32 @@ Model = declarative_base()
 def init_db(bind=engine):
     """Create all required database tables."""
     # Import all models which have associated tables
-    from ..models import market, message, note, user, wallet
+    from ..models import entity, market, message, note, user, wallet
     Model.metadata.create_all(bind)
+
+
+def insert_ignore(session, table, rows):
+    """Insert rows into table, skipping rows that conflict with existing rows.
+
+    Dialects without a native INSERT ignoring conflicts insert row by row,
+    each in a SAVEPOINT that is rolled back on IntegrityError.
+    """
+    if not rows:
+        return
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        session.execute(sqlite_insert(table).on_conflict_do_nothing(), rows)
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        session.execute(pg_insert(table).on_conflict_do_nothing(), rows)
+    elif dialect == "mysql":
+        session.execute(insert(table).prefix_with("IGNORE"), rows)
+    else:
+        for row in rows:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(table), row)
+            except IntegrityError:
+                pass
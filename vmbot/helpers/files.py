@@ -11,4 +11,5 @@ EMOTES = path.join(_DATADIR, "emotes.txt")
 HANDEY_QUOTES = path.join(_DATADIR, "handeysay.txt")
 STATICDATA_DB = path.join(_DATADIR, "staticdata.sqlite")
 BOT_DB = path.join(_DATADIR, "vmbot.db")
-HTTPCACHE = path.join(_CACHEDIR, "http")
+HTTPCACHE = path.join(_CACHEDIR, "http.sqlite")
+KILLMAIL_LOG = path.join(_CACHEDIR, "killmails.sqlite")
@@ -0,0 +1,146 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import os
+import threading
+import logging
+import sqlite3
+import time
+import zlib
+
+from cachecontrol.cache import BaseCache
+
+
+class SQLiteCache(BaseCache):
+    """Store cached HTTP responses compressed in a single sqlite database.
+
+    Least recently used entries are evicted once the stored size exceeds max_bytes.
+    Entries that haven't been used for idle_ttl seconds are removed by a background
+    sweep every sweep_interval seconds (disabled if None). Access times are only
+    updated once they are older than TOUCH_INTERVAL seconds, so most reads don't write.
+
+    Entries aren't removed when their HTTP expiry passes (values are opaque serialized
+    responses). CacheControl deletes expired entries without an ETag once they are looked
+    up again and keeps the others for revalidation, so expired entries that aren't
+    requested again stay until they are evicted or swept as idle.
+    """
+
+    EVICT_BATCH = 64
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, db_path, max_bytes=256 * 1024 * 1024, idle_ttl=24 * 60 * 60,
+                 sweep_interval=10 * 60):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA synchronous = NORMAL;")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS http_cache (
+                                key TEXT PRIMARY KEY,
+                                value BLOB NOT NULL,
+                                size INTEGER NOT NULL,
+                                accessed REAL NOT NULL
+                              );""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS http_cache_accessed "
+                           "ON http_cache (accessed);")
+        self.nbytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM http_cache;"
+        ).fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._closed = threading.Event()
+        self._sweeper = None
+        if sweep_interval is not None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, args=(sweep_interval,),
+                                             name="HTTPCacheSweeper")
+            self._sweeper.daemon = True
+            self._sweeper.start()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, accessed FROM http_cache WHERE key = ?;",
+                                     (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            now = time.time()
+            if now - row[1] > self.TOUCH_INTERVAL:
+                self._conn.execute("UPDATE http_cache SET accessed = ? WHERE key = ?;",
+                                   (now, key))
+        return zlib.decompress(bytes(row[0]))
+
+    def set(self, key, value):
+        value = zlib.compress(value)
+        with self._lock:
+            self._delete(key)
+            self._conn.execute("INSERT INTO http_cache (key, value, size, accessed) "
+                               "VALUES (?, ?, ?, ?);",
+                               (key, sqlite3.Binary(value), len(value), time.time()))
+            self.nbytes += len(value)
+            self._evict(self.max_bytes)
+
+    def delete(self, key):
+        with self._lock:
+            self._delete(key)
+
+    def _delete(self, key):
+        row = self._conn.execute("SELECT size FROM http_cache WHERE key = ?;", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM http_cache WHERE key = ?;", (key,))
+            self.nbytes -= row[0]
+
+    def _evict(self, max_bytes):
+        """Remove least recently used entries until at most max_bytes are stored."""
+        while self.nbytes > max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM http_cache "
+                                      "ORDER BY accessed LIMIT ?;", (self.EVICT_BATCH,)).fetchall()
+            for key, size in rows:
+                if self.nbytes <= max_bytes:
+                    break
+                self._conn.execute("DELETE FROM http_cache WHERE key = ?;", (key,))
+                self.nbytes -= size
+                self.evictions += 1
+
+    def sweep(self):
+        """Remove idle entries and return the number of removed entries."""
+        with self._lock:
+            cutoff = time.time() - self.idle_ttl
+            freed, count = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM http_cache WHERE accessed < ?;",
+                (cutoff,)
+            ).fetchone()
+            self._conn.execute("DELETE FROM http_cache WHERE accessed < ?;", (cutoff,))
+            self.nbytes -= freed
+            self.evictions += count
+            return count
+
+    def _sweep_loop(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                logging.getLogger(__name__).exception("Failed to sweep the HTTP cache:")
+
+    def stats(self):
+        with self._lock:
+            return {'nbytes': self.nbytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+    def close(self):
+        self._closed.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+        with self._lock:
+            self._conn.close()
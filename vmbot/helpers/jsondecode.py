@@ -0,0 +1,87 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import itertools
+import codecs
+import json
+import re
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+# Parser states of iter_array
+_START, _FIRST, _ELEMENT, _SEPARATOR = range(4)
+
+if ujson is not None:
+    BACKEND = "ujson"
+    try:
+        # Older ujson releases round floats unless asked not to
+        ujson.loads("0.1", precise_float=True)
+    except TypeError:
+        _loads = ujson.loads
+    else:
+        def _loads(data):
+            return ujson.loads(data, precise_float=True)
+else:
+    BACKEND = "json"
+    _loads = json.loads
+
+
+def loads(data):
+    """Decode a JSON document using the fastest available backend."""
+    return _loads(data)
+
+
+def iter_array(chunks):
+    """Decode a top-level JSON array from an iterable of UTF-8 chunks.
+
+    Elements are yielded as soon as they are complete, so the full array
+    never needs to be held in memory. Raise ValueError on malformed input.
+    """
+    decode = codecs.getincrementaldecoder("utf-8")().decode
+    buf, state = "", _START
+
+    # A trailing None marks the end of input
+    for chunk in itertools.chain(chunks, (None,)):
+        final = chunk is None
+        buf += decode(b"" if final else chunk, final)
+        pos = 0
+
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos == len(buf):
+                break
+
+            if state == _START:
+                if buf[pos] != "[":
+                    raise ValueError("Expected '[' at the start of the array")
+                state, pos = _FIRST, pos + 1
+            elif state in (_FIRST, _SEPARATOR) and buf[pos] == "]":
+                return
+            elif state == _SEPARATOR:
+                if buf[pos] != ",":
+                    raise ValueError("Expected ',' or ']' between array elements")
+                state, pos = _ELEMENT, pos + 1
+            else:
+                try:
+                    obj, end = _decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if final:
+                        raise
+                    # Element continues in the next chunk
+                    break
+                if end == len(buf) and not final:
+                    # Numbers may continue in the next chunk as well
+                    break
+                yield obj
+                state, pos = _SEPARATOR, end
+
+        buf = buf[pos:]
+
+    raise ValueError("Truncated JSON array")
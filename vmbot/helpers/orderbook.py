@@ -0,0 +1,136 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+import sys
+
+import numpy as np
+
+DEPTH_PERCENTILE = 5
+
+
+class OrderBook(object):
+    """Market orders stored as columns of price, volume, side, location, and type."""
+
+    def __init__(self, price, volume, is_buy, location_id, type_id):
+        self.price = price
+        self.volume = volume
+        self.is_buy = is_buy
+        self.location_id = location_id
+        self.type_id = type_id
+
+    @property
+    def _columns(self):
+        return self.price, self.volume, self.is_buy, self.location_id, self.type_id
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.float64), np.empty(0, np.int64), np.empty(0, np.bool_),
+                   np.empty(0, np.int64), np.empty(0, np.int64))
+
+    @classmethod
+    def from_orders(cls, orders):
+        """Convert an iterable of ESI market orders.
+
+        Orders are consumed one by one, so a streamed response never needs
+        to be decoded into a complete list of dicts.
+        """
+        rows = [(o['price'], o['volume_remain'], o['is_buy_order'], o['location_id'], o['type_id'])
+                for o in orders]
+        if not rows:
+            return cls.empty()
+
+        price, volume, is_buy, location_id, type_id = zip(*rows)
+        del rows
+        return cls(np.array(price, np.float64), np.array(volume, np.int64),
+                   np.array(is_buy, np.bool_), np.array(location_id, np.int64),
+                   np.array(type_id, np.int64))
+
+    @classmethod
+    def concat(cls, *books):
+        return cls(*[np.concatenate(cols) for cols in zip(*[b._columns for b in books])])
+
+    def __len__(self):
+        return len(self.price)
+
+    @property
+    def nbytes(self):
+        return sum(col.nbytes for col in self._columns)
+
+    def select(self, index):
+        """Create a book containing the orders selected by a boolean mask or index array."""
+        return OrderBook(*[col[index] for col in self._columns])
+
+    def at_locations(self, location_ids):
+        return self.select(np.in1d(self.location_id, list(location_ids)))
+
+    def of_type(self, type_id):
+        return self.select(self.type_id == type_id)
+
+    def _side(self, is_buy):
+        mask = self.is_buy if is_buy else ~self.is_buy
+        return self.price[mask], self.volume[mask]
+
+    @staticmethod
+    def _side_stats(price, volume, is_buy, percentile):
+        """Calculate best price, volume-weighted percentile price, and volume.
+
+        The percentile is taken from the best price outwards, ie. the price up to
+        which percentile % of the side's volume could be bought or sold.
+        """
+        if not len(price):
+            return 0.0, 0.0, 0
+
+        # Stable sort from best to worst price
+        order = np.argsort(-price if is_buy else price, kind="mergesort")
+        cum_volume = np.cumsum(volume[order])
+        total = int(cum_volume[-1])
+        idx = min(np.searchsorted(cum_volume, total * percentile / 100), len(order) - 1)
+
+        return float(price[order[0]]), float(price[order[idx]]), total
+
+    def stats(self, percentile=DEPTH_PERCENTILE):
+        """Summarize both sides of the book.
+
+        Output format: {'sell': (best, percentile, volume), 'buy': (best, percentile, volume),
+        'spread': fraction of the best sell price or None}
+        """
+        sell = self._side_stats(*self._side(False), is_buy=False, percentile=percentile)
+        buy = self._side_stats(*self._side(True), is_buy=True, percentile=percentile)
+        spread = (sell[0] - buy[0]) / sell[0] if sell[0] else None
+        return {'sell': sell, 'buy': buy, 'spread': spread}
+
+    def totals(self):
+        """Output format: ((sell_price, sell_volume), (buy_price, buy_volume))"""
+        sell_price, sell_volume = self._side(False)
+        buy_price, buy_volume = self._side(True)
+        return ((float(sell_price.min()) if len(sell_price) else 0.0, int(sell_volume.sum())),
+                (float(buy_price.max()) if len(buy_price) else 0.0, int(buy_volume.sum())))
+
+
+class TypeIndexedBook(object):
+    """Orders of an entire market, grouped by type_id for repeated per-type lookups."""
+
+    def __init__(self, book):
+        # Stable sort keeps the original order within each type
+        self.book = book.select(np.argsort(book.type_id, kind="mergesort"))
+
+        type_ids, starts = np.unique(self.book.type_id, return_index=True)
+        ends = np.append(starts[1:], len(self.book))
+        self._slices = {type_id: slice(start, end) for type_id, start, end
+                        in zip(type_ids.tolist(), starts.tolist(), ends.tolist())}
+
+    def __len__(self):
+        return len(self.book)
+
+    @property
+    def nbytes(self):
+        return self.book.nbytes + sys.getsizeof(self._slices) + 64 * len(self._slices)
+
+    def type_ids(self):
+        return set(self._slices)
+
+    def of_type(self, type_id):
+        """Create a book containing the orders for type_id, sharing memory with the index."""
+        s = self._slices.get(type_id, slice(0, 0))
+        return OrderBook(*[col[s] for col in self.book._columns])
@@ -64,10 +64,18 @@ class SSOToken(object):
         self._expiry = datetime.utcnow() + timedelta(seconds=res['expires_in'])
 
     def request_esi(self, route, fmt=(), params=None, data=None, headers=None,
-                    timeout=3, json=None, method="GET", with_head=False):
+                    timeout=3, json=None, method="GET", with_head=False, etag=None, stream=False):
         headers = {} if headers is None else headers.copy()
         headers['Authorization'] = self.auth
-        return api.request_esi(route, fmt, params, data, headers, timeout, json, method, with_head)
+        return api.request_esi(route, fmt, params, data, headers, timeout, json, method,
+                               with_head, etag, stream)
+
+    def request_esi_async(self, route, fmt=(), params=None, data=None, headers=None,
+                          timeout=3, json=None, method="GET", with_head=False, etag=None):
+        headers = {} if headers is None else headers.copy()
+        headers['Authorization'] = self.auth
+        return api.request_esi_async(route, fmt, params, data, headers,
+                                     timeout, json, method, with_head, etag)
 
     @staticmethod
     def _request_grant(token, type_="authorization_code"):
@@ -4,29 +4,256 @@ from __future__ import absolute_import, division, unicode_literals, print_functi
 
 import threading
 from contextlib import contextmanager
+import time
+import Queue
+from collections import defaultdict
+from array import array
+import bisect
 import sqlite3
 
 import cachetools.func
 
 from .files import STATICDATA_DB
+from .trigram import TrigramIndex
+
+_snapshot = None
+_search_lock = threading.Lock()
+_search_indexes = None
+
+_SYSTEM_DATA_QUERY = """SELECT solarSystemID, solarSystemName,
+                               mapSolarSystems.constellationID, constellationName,
+                               mapSolarSystems.regionID, regionName
+                        FROM mapSolarSystems
+                        INNER JOIN mapConstellations
+                          ON mapConstellations.constellationID = mapSolarSystems.constellationID
+                        INNER JOIN mapRegions
+                          ON mapRegions.regionID = mapSolarSystems.regionID"""
+
+
+class ConnectionPool(object):
+    """Hand out up to size read-only connections to a sqlite database.
+
+    Each connection is used by one thread at a time. Connections are opened lazily
+    and reused most-recently-returned first.
+    """
+
+    MMAP_SIZE = 256 * 1024 * 1024
+    CACHE_SIZE_KIB = 64 * 1024
+
+    def __init__(self, db_path, size=4):
+        self.db_path = db_path
+        self.size = size
+        self._idle = Queue.LifoQueue()
+        self._lock = threading.Lock()
+
+        self.opened = 0
+        self.in_use = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _connect(self):
+        # Python 2's sqlite3 module can't open mode=ro/immutable URIs, so the
+        # connection is made read-only via PRAGMA instead
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON;")
+        conn.execute("PRAGMA mmap_size = {:d};".format(self.MMAP_SIZE))
+        conn.execute("PRAGMA cache_size = -{:d};".format(self.CACHE_SIZE_KIB))
+        return conn
+
+    def stats(self):
+        with self._lock:
+            return {'size': self.size, 'opened': self.opened, 'in_use': self.in_use,
+                    'waits': self.waits, 'wait_time': self.wait_time}
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Queue.Empty:
+            pass
+
+        with self._lock:
+            create = self.opened < self.size
+            if create:
+                self.opened += 1
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self.opened -= 1
+                raise
+
+        start = time.time()
+        conn = self._idle.get()
+        with self._lock:
+            self.waits += 1
+            self.wait_time += time.time() - start
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._idle.put(conn)
+
 
-_sde_lock = threading.Lock()
+_sde_pool = ConnectionPool(STATICDATA_DB)
 
 
-@contextmanager
 def _get_sde_conn():
-    """Retrieve or create and lock the global sqlite SDE connection."""
-    global _sde_conn
-    with _sde_lock:
-        try:
-            _sde_conn
-        except NameError:
-            _sde_conn = sqlite3.connect(STATICDATA_DB)
-        yield _sde_conn
+    """Borrow a read-only connection to the SDE from the pool."""
+    return _sde_pool.connection()
+
+
+def pool_stats():
+    """Report size and contention of the SDE connection pool."""
+    return _sde_pool.stats()
+
+
+class StaticDataSnapshot(object):
+    """Hold the static data used by the lookup functions in memory."""
+
+    def __init__(self, conn):
+        self.type_names = dict(conn.execute("SELECT typeID, typeName FROM invTypes;"))
+        self.region_names = dict(conn.execute("SELECT regionID, regionName FROM mapRegions;"))
+        self.faction_names = dict(conn.execute("SELECT factionID, factionName FROM chrFactions;"))
+        self.systems = {row[0]: row for row in conn.execute(_SYSTEM_DATA_QUERY + ';')}
+
+        stations = defaultdict(set)
+        for station_id, system_id in conn.execute(
+                "SELECT stationID, solarSystemID FROM staStations;"):
+            stations[system_id].add(station_id)
+        self.stations = {system_id: frozenset(ids) for system_id, ids in stations.items()}
+
+        # invNames is by far the largest table, so store it as a sorted array instead of a dict
+        items = conn.execute("SELECT itemID, itemName FROM invNames ORDER BY itemID;").fetchall()
+        self._item_ids = array(b'l', (row[0] for row in items))
+        self._item_names = [row[1] for row in items]
+
+        self.market_structure_types = frozenset(
+            row[0] for row in conn.execute("SELECT typeID FROM market_structures;")
+        )
+
+    def item_name(self, item_id):
+        idx = bisect.bisect_left(self._item_ids, item_id)
+        if idx < len(self._item_ids) and self._item_ids[idx] == item_id:
+            return self._item_names[idx]
+        return None
+
+
+def load_snapshot():
+    """Load static data into memory, making lookups independent of the sqlite connection."""
+    global _snapshot
+    with _get_sde_conn() as conn:
+        _snapshot = StaticDataSnapshot(conn)
+    _get_search_indexes()
+
+
+def _build_search_indexes(conn):
+    return {
+        'region': TrigramIndex(conn.execute(
+            """SELECT regionID, regionName
+               FROM mapRegions
+               WHERE regionID < 12000000;  -- only public regions"""
+        )),
+        'solar_system': TrigramIndex(conn.execute(
+            """SELECT solarSystemID, solarSystemName
+               FROM mapSolarSystems
+               WHERE regionID < 12000000;  -- only public regions"""
+        )),
+        'market_type': TrigramIndex(conn.execute(
+            """SELECT typeID, typeName
+               FROM invTypes
+               WHERE published
+                 AND marketGroupID IS NOT NULL;"""
+        ))
+    }
+
+
+def _get_search_indexes():
+    """Retrieve or build the search indexes for locations and market types."""
+    global _search_indexes
+    if _search_indexes is None:
+        with _search_lock:
+            if _search_indexes is None:
+                with _get_sde_conn() as conn:
+                    _search_indexes = _build_search_indexes(conn)
+    return _search_indexes
+
+
+def _format_region_data(region_id, region_name):
+    if region_name is None:
+        return {'region_id': 0, 'region_name': "{Failed to load}"}
+    return {'region_id': region_id, 'region_name': region_name}
+
+
+def _format_system_data(system):
+    if not system:
+        return {'system_id': 0, 'system_name': "{Failed to load}",
+                'constellation_id': 0, 'constellation_name': "{Failed to load}",
+                'region_id': 0, 'region_name': "{Failed to load}"}
+    return {'system_id': system[0], 'system_name': system[1],
+            'constellation_id': system[2], 'constellation_name': system[3],
+            'region_id': system[4], 'region_name': system[5]}
 
 
-@cachetools.func.lru_cache(maxsize=128)
 def type_name(type_id):
+    """Resolve a type_id to its name."""
+    if _snapshot is not None:
+        return _snapshot.type_names.get(type_id, "{Failed to load}")
+    return _type_name(type_id)
+
+
+def region_data(region_id):
+    """Resolve a region_id to its data."""
+    if _snapshot is not None:
+        return _format_region_data(region_id, _snapshot.region_names.get(region_id, None))
+    return _region_data(region_id)
+
+
+def system_data(system_id):
+    """Resolve a system_id to its data."""
+    if _snapshot is not None:
+        return _format_system_data(_snapshot.systems.get(system_id, None))
+    return _system_data(system_id)
+
+
+def item_name(item_id):
+    """Resolve an item_id to its name."""
+    if _snapshot is not None:
+        return _snapshot.item_name(item_id) or "{Failed to load}"
+    return _item_name(item_id)
+
+
+def faction_name(faction_id):
+    """Resolve a faction_id to its name."""
+    if _snapshot is not None:
+        return _snapshot.faction_names.get(faction_id, "{Failed to load}")
+    return _faction_name(faction_id)
+
+
+def system_stations(system_id):
+    """Resolve a system_id to all station_ids contained within the system."""
+    if _snapshot is not None:
+        return _snapshot.stations.get(system_id, frozenset())
+    return _system_stations(system_id)
+
+
+def market_structure_types():
+    """List all structure types capable of fitting the market service module."""
+    if _snapshot is not None:
+        return _snapshot.market_structure_types
+    return _market_structure_types()
+
+
+@cachetools.func.lru_cache(maxsize=128)
+def _type_name(type_id):
     """Resolve a type_id to its name."""
     with _get_sde_conn() as conn:
         type = conn.execute(
@@ -41,50 +268,24 @@ def type_name(type_id):
 
 def search_location(term):
     """Resolve a search term to regions and solar systems."""
-    params = {'name': "%{}%".format(term)}
-    with _get_sde_conn() as conn:
-        regions = conn.execute(
-            """SELECT regionID
-               FROM mapRegions
-               WHERE regionName LIKE :name
-                 AND regionID < 12000000  -- only public regions
-               ORDER BY LENGTH(regionName) ASC;
-            """, params
-        ).fetchall()
-        systems = conn.execute(
-            """SELECT solarSystemID
-               FROM mapSolarSystems
-               WHERE solarSystemName LIKE :name
-                 AND regionID < 12000000  -- only public regions
-               ORDER BY LENGTH(solarSystemName) ASC;
-            """, params
-        ).fetchall()
+    indexes = _get_search_indexes()
 
     res = {}
-    if regions:
-        res["region"] = [i[0] for i in regions]
-    if systems:
-        res["solar_system"] = [i[0] for i in systems]
+    for category in ("region", "solar_system"):
+        ids = [id_ for id_, _ in indexes[category].search(term)]
+        if ids:
+            res[category] = ids
     return res
 
 
 def search_market_types(term):
     """Resolve a search term to types that are listed on the market."""
-    with _get_sde_conn() as conn:
-        # Sort by name length so that the most similar item is first
-        return conn.execute(
-            """SELECT typeID, typeName
-               FROM invTypes
-               WHERE typeName LIKE :name
-                 AND published
-                 AND marketGroupID IS NOT NULL
-               ORDER BY LENGTH(typeName) ASC;""",
-            {'name': "%{}%".format(term)}
-        ).fetchall()
+    # Matches are sorted by name length so that the most similar item is first
+    return _get_search_indexes()['market_type'].search(term)
 
 
 @cachetools.func.lru_cache(maxsize=4)
-def region_data(region_id):
+def _region_data(region_id):
     """Resolve a region_id to its data."""
     with _get_sde_conn() as conn:
         region = conn.execute(
@@ -94,39 +295,22 @@ def region_data(region_id):
             {'id': region_id}
         ).fetchone()
 
-    if not region:
-        return {'region_id': 0, 'region_name': "{Failed to load}"}
-    return {'region_id': region_id, 'region_name': region[0]}
+    return _format_region_data(region_id, region[0] if region else None)
 
 
 @cachetools.func.lru_cache(maxsize=128)
-def system_data(system_id):
+def _system_data(system_id):
     """Resolve a system_id to its data."""
     with _get_sde_conn() as conn:
         system = conn.execute(
-            """SELECT solarSystemName,
-                      mapSolarSystems.constellationID, constellationName,
-                      mapSolarSystems.regionID, regionName
-               FROM mapSolarSystems
-               INNER JOIN mapConstellations
-                 ON mapConstellations.constellationID = mapSolarSystems.constellationID
-               INNER JOIN mapRegions
-                 ON mapRegions.regionID = mapSolarSystems.regionID
-               WHERE solarSystemID = :id;""",
-            {'id': system_id}
+            _SYSTEM_DATA_QUERY + " WHERE solarSystemID = :id;", {'id': system_id}
         ).fetchone()
 
-    if not system:
-        return {'system_id': 0, 'system_name': "{Failed to load}",
-                'constellation_id': 0, 'constellation_name': "{Failed to load}",
-                'region_id': 0, 'region_name': "{Failed to load}"}
-    return {'system_id': system_id, 'system_name': system[0],
-            'constellation_id': system[1], 'constellation_name': system[2],
-            'region_id': system[3], 'region_name': system[4]}
+    return _format_system_data(system)
 
 
 @cachetools.func.lru_cache(maxsize=64)
-def item_name(item_id):
+def _item_name(item_id):
     """Resolve an item_id to its name."""
     with _get_sde_conn() as conn:
         item = conn.execute(
@@ -140,7 +324,7 @@ def item_name(item_id):
 
 
 @cachetools.func.lru_cache(maxsize=None)
-def faction_name(faction_id):
+def _faction_name(faction_id):
     """Resolve a faction_id to its name."""
     with _get_sde_conn() as conn:
         faction = conn.execute(
@@ -153,7 +337,7 @@ def faction_name(faction_id):
     return faction[0] if faction else "{Failed to load}"
 
 
-def system_stations(system_id):
+def _system_stations(system_id):
     """Resolve a system_id to all station_ids contained within the system."""
     with _get_sde_conn() as conn:
         stations = conn.execute(
@@ -167,7 +351,7 @@ def system_stations(system_id):
 
 
 @cachetools.func.lru_cache(maxsize=None)
-def market_structure_types():
+def _market_structure_types():
     """List all structure types capable of fitting the market service module."""
     with _get_sde_conn() as conn:
         structures = conn.execute("SELECT typeID FROM market_structures;").fetchall()
@@ -2,7 +2,7 @@
 
 from __future__ import absolute_import, division, unicode_literals, print_function
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 import re
 from collections import Counter
 
@@ -61,3 +61,15 @@ def parse_iso8601_duration(dur):
         first_val = False
 
     return res
+
+
+def parse_iso8601_datetime(text):
+    """Parse an ISO 8601 formatted timestamp as returned by ESI.
+
+    Slicing the fixed-width format is several times faster than strptime,
+    other formats fall back to strptime.
+    """
+    if len(text) == 20 and text[4] == '-' and text[10] == 'T' and text[19] == 'Z':
+        return datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                        int(text[11:13]), int(text[14:16]), int(text[17:19]))
+    return datetime.strptime(text, ISO8601_DATETIME_FMT)
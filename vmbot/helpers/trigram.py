@@ -0,0 +1,46 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from collections import defaultdict
+from array import array
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in xrange(len(text) - 2)}
+
+
+class TrigramIndex(object):
+    """Index names for case-insensitive substring search.
+
+    Matches are ranked like ORDER BY LENGTH(name): shortest name first, ties by id.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda r: (len(r[1]), r[0]))
+        self._rows = [tuple(r) for r in rows]
+        self._folded = [r[1].lower() for r in rows]
+
+        postings = defaultdict(list)
+        for rank, name in enumerate(self._folded):
+            for tri in _trigrams(name):
+                postings[tri].append(rank)
+        self._postings = {tri: array(b'l', ranks) for tri, ranks in postings.items()}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def search(self, term):
+        """List all (id, name) rows whose name contains term."""
+        term = term.lower()
+        if len(term) < 3:
+            candidates = xrange(len(self._folded))
+        else:
+            # Every match is contained in the posting list of each trigram of term,
+            # so checking the shortest list suffices
+            try:
+                candidates = min((self._postings[tri] for tri in _trigrams(term)), key=len)
+            except KeyError:
+                return []
+
+        return [self._rows[rank] for rank in candidates if term in self._folded[rank]]
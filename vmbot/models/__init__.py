@@ -3,6 +3,7 @@
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 from .isk import ISK
+from .entity import EntityName, EntityTicker
 from .market import MarketStructure
 from .note import Note
-from .wallet import WalletJournalEntry
+from .wallet import WalletJournalEntry, WalletDailyTotal
@@ -0,0 +1,57 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from datetime import datetime
+
+from ..helpers import database as db
+
+
+class EntityName(db.Model):
+    """Store the name of a character, corporation, alliance, or other EVE entity."""
+    __tablename__ = "entity_names"
+
+    entity_id = db.Column(db.BigInteger, nullable=False, primary_key=True, autoincrement=False)
+    name = db.Column(db.Text, nullable=False)
+    category = db.Column(db.Text)
+    last_updated = db.Column(db.DateTime, nullable=False)
+
+    def __init__(self, entity_id, name, category=None):
+        self.entity_id = entity_id
+        self.name = name
+        self.category = category
+        self.last_updated = datetime.utcnow()
+
+    @classmethod
+    def from_esi_record(cls, record):
+        return cls(record['id'], record['name'], record.get('category', None))
+
+    @property
+    def update_age(self):
+        return datetime.utcnow() - self.last_updated
+
+
+class EntityTicker(db.Model):
+    """Store the ticker of a corporation or alliance."""
+    __tablename__ = "entity_tickers"
+
+    entity_id = db.Column(db.BigInteger, nullable=False, primary_key=True, autoincrement=False)
+    category = db.Column(db.String(16), nullable=False, primary_key=True)
+    ticker = db.Column(db.Text, nullable=False)
+    alliance_id = db.Column(db.BigInteger)
+    last_updated = db.Column(db.DateTime, nullable=False)
+
+    def __init__(self, entity_id, category, ticker, alliance_id=None):
+        self.entity_id = entity_id
+        self.category = category
+        self.ticker = ticker
+        self.alliance_id = alliance_id
+        self.last_updated = datetime.utcnow()
+
+    @classmethod
+    def from_esi_result(cls, entity_id, category, result):
+        return cls(entity_id, category, result['ticker'], result.get('alliance_id', None))
+
+    @property
+    def update_age(self):
+        return datetime.utcnow() - self.last_updated
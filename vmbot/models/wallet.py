@@ -2,9 +2,9 @@
 
 from __future__ import absolute_import, division, unicode_literals, print_function
 
-from datetime import datetime
+from datetime import datetime, time, timedelta
 
-from ..helpers.time import ISO8601_DATETIME_FMT
+from ..helpers.time import parse_iso8601_datetime
 from ..helpers import database as db
 
 
@@ -28,5 +28,97 @@ class WalletJournalEntry(db.Model):
 
     @classmethod
     def from_esi_record(cls, record):
-        date = datetime.strptime(record['date'], ISO8601_DATETIME_FMT)
-        return cls(record['id'], record['ref_type'], record.get('amount', 0.0), date)
+        return cls(**cls.row_from_esi_record(record))
+
+    @staticmethod
+    def row_from_esi_record(record):
+        """Convert an ESI record into column values for bulk inserts."""
+        return {'ref_id': record['id'], 'ref_type': record['ref_type'],
+                'amount': record.get('amount', 0.0),
+                'date': parse_iso8601_datetime(record['date'])}
+
+
+class WalletDailyTotal(db.Model):
+    """Store the daily income and expenses per ref_type of the wallet journal."""
+    __tablename__ = "corp_wallet_daily"
+
+    # Tolerated difference between sums of different summation order
+    CHECK_TOLERANCE = 0.01
+
+    day = db.Column(db.Date, nullable=False, primary_key=True)
+    ref_type = db.Column(db.Text, nullable=False, primary_key=True)
+    income = db.Column(db.Float, nullable=False)
+    expenses = db.Column(db.Float, nullable=False)
+
+    @staticmethod
+    def _day_stmt():
+        j = WalletJournalEntry
+        return db.select(
+            db.func.date(j.date).label("day"), j.ref_type,
+            db.func.sum(db.case((j.amount > 0, j.amount), else_=0.0)).label("income"),
+            db.func.sum(db.case((j.amount < 0, j.amount), else_=0.0)).label("expenses")
+        ).group_by(db.func.date(j.date), j.ref_type)
+
+    @classmethod
+    def refresh(cls, session, start=None, end=None):
+        """Recalculate the totals of all days between the dates start and end (inclusive).
+
+        Omit start and end to rebuild all totals.
+        """
+        delete = db.delete(cls)
+        select = cls._day_stmt()
+        if start is not None:
+            delete = delete.where(cls.day >= start)
+            select = select.where(WalletJournalEntry.date >= datetime.combine(start, time()))
+        if end is not None:
+            delete = delete.where(cls.day <= end)
+            select = select.where(WalletJournalEntry.date
+                                  < datetime.combine(end + timedelta(days=1), time()))
+
+        session.execute(delete.execution_options(synchronize_session=False))
+        session.execute(db.insert(cls).from_select(["day", "ref_type", "income", "expenses"],
+                                                   select))
+
+    @classmethod
+    def totals(cls, session, column, from_date):
+        """Sum up column ("income" or "expenses") per ref_type for entries after from_date.
+
+        Complete days are read from the daily totals and only the partial first day
+        from the journal itself.
+        """
+        next_day = from_date.date() + timedelta(days=1)
+        amount = WalletJournalEntry.amount
+        cond = amount > 0 if column == "income" else amount < 0
+
+        res = dict(session.execute(
+            db.select(cls.ref_type, db.func.sum(getattr(cls, column))).
+            where(cls.day >= next_day, getattr(cls, column) != 0).group_by(cls.ref_type)
+        ).all())
+        partial = session.execute(
+            db.select(WalletJournalEntry.ref_type, db.func.sum(amount)).
+            where(cond, WalletJournalEntry.date > from_date,
+                  WalletJournalEntry.date < datetime.combine(next_day, time())).
+            group_by(WalletJournalEntry.ref_type)
+        )
+        for ref_type, total in partial:
+            res[ref_type] = res.get(ref_type, 0.0) + total
+
+        return res
+
+    @classmethod
+    def check(cls, session):
+        """Compare the daily totals with the journal.
+
+        Output format: [(day, ref_type, stored totals, journal totals)] for days that differ
+        """
+        journal = {(str(day), ref_type): (income, expenses)
+                   for day, ref_type, income, expenses in session.execute(cls._day_stmt())}
+        stored = {(str(day), ref_type): (income, expenses) for day, ref_type, income, expenses
+                  in session.execute(db.select(cls.day, cls.ref_type, cls.income, cls.expenses))}
+
+        res = []
+        for key in sorted(set(journal) | set(stored)):
+            a, b = stored.get(key, (0.0, 0.0)), journal.get(key, (0.0, 0.0))
+            if any(abs(x - y) > cls.CHECK_TOLERANCE for x, y in zip(a, b)):
+                res.append(key + (a, b))
+        return res
@@ -2,58 +2,86 @@
 
 from __future__ import absolute_import, division, unicode_literals, print_function
 
-import threading
-
-from concurrent import futures
-
 from .botcmd import botcmd
 from .helpers.exceptions import APIError, APIStatusError
 from .helpers import api
 from .helpers import staticdata
 from .helpers.format import disambiguate
-from .services.marketcache import MarketStructureLookup
+from .helpers.orderbook import OrderBook, TypeIndexedBook, DEPTH_PERCENTILE
+from .services.marketcache import MarketStructureLookup, MarketSnapshotCache, MarketSnapshot
+
+_market_snapshots = MarketSnapshotCache()
 
 
 class Price(object):
     @staticmethod
-    def _calc_totals(orders):
-        """Extract pricing data from a list of orders."""
-        sell_vol, sell_price = 0, None
-        buy_vol, buy_price = 0, None
-
-        for order in orders:
-            if order['is_buy_order']:
-                buy_vol += order['volume_remain']
-                if buy_price is None or order['price'] > buy_price:
-                    buy_price = order['price']
-            else:
-                sell_vol += order['volume_remain']
-                if sell_price is None or order['price'] < sell_price:
-                    sell_price = order['price']
+    def _fetch_book(request, request_async, route, fmt, params, stale=None):
+        """Download all pages of orders.
 
-        return (sell_price or 0.0, sell_vol), (buy_price or 0.0, buy_vol)
-
-    def _get_region_orders(self, region_id, type_id):
+        If a stale snapshot is given, its pages are revalidated by ETag first
+        and the snapshot itself is returned if none of them changed.
+        Output format: (MarketSnapshot, Expires header of the first page)
+        """
+        if stale is not None:
+            page, head = request(route, fmt, params=dict(params, page=1), timeout=5,
+                                 with_head=True, etag=stale.etags[0])
+            if page is api.NOT_MODIFIED and int(head.get('X-Pages', 1)) == len(stale.etags):
+                futs = [request_async(route, fmt, params=dict(params, page=p), timeout=5,
+                                      etag=etag)
+                        for p, etag in enumerate(stale.etags[1:], start=2)]
+                if all(f.result() is api.NOT_MODIFIED for f in futs):
+                    return stale, head.get('Expires', None)
+
+        # Changed pages were just stored in the HTTP cache, so a full download
+        # after a failed revalidation mostly reads from the cache.
+        # Each page is converted as it arrives and dropped once it is converted, so at
+        # most one page of decoded orders is alive at a time. The columnar book itself
+        # holds every order, since snapshots are kept for later requests.
+        books, etags, expires = [], [], None
+        for orders, head in api.iter_pages(request, request_async, route, fmt, params,
+                                           stream=True):
+            if not books:
+                expires = head.get('Expires', None)
+            books.append(OrderBook.from_orders(orders))
+            etags.append(head.get('ETag', None))
+            del orders
+
+        return MarketSnapshot(OrderBook.concat(*books), etags), expires
+
+    def _region_book(self, region_id, type_id):
+        return _market_snapshots.get((region_id, type_id), lambda stale: Price._fetch_book(
+            api.request_esi, api.request_esi_async, "/v1/markets/{}/orders/", (region_id,),
+            {'type_id': type_id}, stale
+        )).book
+
+    def _fetch_structure_book(self, token, struct_id, stale=None):
+        """Download the full market of a structure and index it by type_id."""
+        snapshot, expires = Price._fetch_book(token.request_esi, token.request_esi_async,
+                                              "/v1/markets/structures/{}/", (struct_id,), {},
+                                              stale)
+        if snapshot is not stale:
+            snapshot.book = TypeIndexedBook(snapshot.book)
+        return snapshot, expires
+
+    def _structure_book(self, token, struct_id):
+        return _market_snapshots.get(struct_id, lambda stale: self._fetch_structure_book(
+            token, struct_id, stale
+        )).book
+
+    def _get_region_orders(self, region_id, type_id, depth=False):
         """Collect buy and sell order stats for item in region.
 
         Output format: ((sell_price, sell_volume), (buy_price, buy_volume))
+        or an OrderBook if depth is True
         """
-        params = {'page': 1, 'type_id': type_id}
-        orders, head = api.request_esi("/v1/markets/{}/orders/", (region_id,),
-                                       params=params, timeout=5, with_head=True)
-
-        futs = [self.api_pool.submit(api.request_esi, "/v1/markets/{}/orders/", (region_id,),
-                                     params={'page': p, 'type_id': type_id}, timeout=5)
-                for p in range(2, int(head.get('X-Pages', 1)) + 1)]
-        for f in futures.as_completed(futs):
-            orders += f.result()
-
-        return Price._calc_totals(orders)
+        book = self._region_book(region_id, type_id)
+        return book if depth else book.totals()
 
-    def _get_system_orders(self, token, region_id, system_id, struct_ids, type_id):
+    def _get_system_orders(self, token, region_id, system_id, struct_ids, type_id, depth=False):
         """Collect buy and sell order stats for item in system.
 
         Output format: ((sell_price, sell_volume), (buy_price, buy_volume))
+        or an OrderBook if depth is True
         """
         if struct_ids and not {"esi-universe.read_structures.v1",
                                "esi-markets.structure_markets.v1"}.issubset(token.scopes):
@@ -64,62 +92,55 @@ class Price(object):
         structs = lookup(system_id, struct_ids)
         stations = staticdata.system_stations(system_id)
 
-        # Collect matching orders
-        reg_fut = self.api_pool.submit(
-            api.request_esi, "/v1/markets/{}/orders/", (region_id,),
-            params={'page': 1, 'type_id': type_id}, timeout=5, with_head=True
-        )
-        struct_futs = []
-        for id_ in structs:
-            f = self.api_pool.submit(token.request_esi, "/v1/markets/structures/{}/", (id_,),
-                                     params={'page': 1}, timeout=5, with_head=True)
-            f.req_id = id_
-            struct_futs.append(f)
-
-        res, head = reg_fut.result()
-        orders = [o for o in res if o['location_id'] in stations]
-        orders_lock = threading.Lock()
-
-        def add_station_orders(f):
-            with orders_lock:
-                orders.extend(o for o in f.result() if o['location_id'] in stations)
-
-        def add_struct_orders(f):
-            with orders_lock:
-                orders.extend(o for o in f.result() if o['type_id'] == type_id)
-
-        order_futs = []
-        for p in range(2, int(head.get('X-Pages', 1)) + 1):
-            f = self.api_pool.submit(api.request_esi, "/v1/markets/{}/orders/", (region_id,),
-                                     params={'page': p, 'type_id': type_id}, timeout=5)
-            f.add_done_callback(add_station_orders)
-            order_futs.append(f)
-
-        for f in futures.as_completed(struct_futs):
+        # Collect matching orders, downloading all markets at once
+        reg_fut = self.api_pool.submit(self._region_book, region_id, type_id)
+        struct_futs = [(id_, self.api_pool.submit(self._structure_book, token, id_))
+                       for id_ in structs]
+
+        books = [reg_fut.result().at_locations(stations)]
+        for id_, f in struct_futs:
             try:
-                res, head = f.result()
+                books.append(f.result().of_type(type_id))
             except APIStatusError as e:
                 if e.status_code != 403:
                     raise e
                 # 403/Market access denied (cannot be determined otherwise currently)
-                lookup.mark_inaccessible(f.req_id)
-                continue
-            with orders_lock:
-                orders.extend(o for o in res if o['type_id'] == type_id)
-
-            for p in range(2, int(head.get('X-Pages', 1)) + 1):
-                page_f = self.api_pool.submit(token.request_esi, "/v1/markets/structures/{}/",
-                                              (f.req_id,), params={'page': p}, timeout=5)
-                page_f.add_done_callback(add_struct_orders)
-                order_futs.append(page_f)
+                lookup.mark_inaccessible(id_)
 
         lookup.finalize()
-        futures.wait(order_futs)
-        return Price._calc_totals(orders)
+        book = OrderBook.concat(*books)
+        return book if depth else book.totals()
 
-    @botcmd
-    def price(self, mess, args):
-        """<item>[@system_or_region] - Price of item in system_or_region, defaulting to Jita"""
+    @staticmethod
+    def _format_spread(sell_price, buy_price):
+        try:
+            return "{:,.2%}".format((sell_price - buy_price) / sell_price)
+        except ZeroDivisionError:
+            # By request from Jack (See https://www.destroyallsoftware.com/talks/wat)
+            return "NaNNaNNaNNaNNaNBatman!"
+
+    @staticmethod
+    def _format_totals(totals):
+        (sell_price, sell_volume), (buy_price, buy_volume) = totals
+        reply = ("Sells: <strong>{:,.2f}</strong> ISK -- {:,} units<br />"
+                 "Buys: <strong>{:,.2f}</strong> ISK -- {:,} units<br />"
+                 "Spread: ").format(sell_price, sell_volume, buy_price, buy_volume)
+        return reply + Price._format_spread(sell_price, buy_price)
+
+    @staticmethod
+    def _format_depth(book):
+        stats = book.stats()
+        sell_price, sell_depth, sell_volume = stats['sell']
+        buy_price, buy_depth, buy_volume = stats['buy']
+        reply = ("Sells: <strong>{:,.2f}</strong> ISK -- {:,.2f} ISK at {}% depth -- {:,} units"
+                 "<br />"
+                 "Buys: <strong>{:,.2f}</strong> ISK -- {:,.2f} ISK at {}% depth -- {:,} units"
+                 "<br />"
+                 "Spread: ").format(sell_price, sell_depth, DEPTH_PERCENTILE, sell_volume,
+                                    buy_price, buy_depth, DEPTH_PERCENTILE, buy_volume)
+        return reply + Price._format_spread(sell_price, buy_price)
+
+    def _price(self, args, depth):
         args = [item.strip() for item in args.split('@')]
         if not 1 <= len(args) <= 2 or args[0] == "":
             return ("Please provide an item name and optionally a system/region name: "
@@ -156,29 +177,18 @@ class Price(object):
         try:
             if region_id is not None:
                 market_name = staticdata.region_data(region_id)['region_name']
-                totals = self._get_region_orders(region_id, type_id)
+                totals = self._get_region_orders(region_id, type_id, depth=depth)
             else:
                 system_id = system_ids.pop(0)
                 sys_data = staticdata.system_data(system_id)
                 market_name = sys_data['system_name']
-                totals = self._get_system_orders(token, sys_data['region_id'],
-                                                 system_id, struct_ids, type_id)
+                totals = self._get_system_orders(token, sys_data['region_id'], system_id,
+                                                 struct_ids, type_id, depth=depth)
         except RuntimeError as e:
             return unicode(e)
 
-        (sell_price, sell_volume), (buy_price, buy_volume) = totals
-
-        reply = ("<strong>{}</strong> in <strong>{}</strong>:<br />"
-                 "Sells: <strong>{:,.2f}</strong> ISK -- {:,} units<br />"
-                 "Buys: <strong>{:,.2f}</strong> ISK -- {:,} units<br />"
-                 "Spread: ").format(
-            type_name, market_name, sell_price, sell_volume, buy_price, buy_volume
-        )
-        try:
-            reply += "{:,.2%}".format((sell_price - buy_price) / sell_price)
-        except ZeroDivisionError:
-            # By request from Jack (See https://www.destroyallsoftware.com/talks/wat)
-            reply += "NaNNaNNaNNaNNaNBatman!"
+        reply = "<strong>{}</strong> in <strong>{}</strong>:<br />".format(type_name, market_name)
+        reply += self._format_depth(totals) if depth else self._format_totals(totals)
 
         if items:
             reply += "<br />" + disambiguate(args[0], zip(*items)[1], "items")
@@ -189,3 +199,13 @@ class Price(object):
             )
 
         return reply
+
+    @botcmd(thread=True)
+    def price(self, mess, args):
+        """<item>[@system_or_region] - Price of item in system_or_region, defaulting to Jita"""
+        return self._price(args, depth=False)
+
+    @botcmd(thread=True)
+    def pricedepth(self, mess, args):
+        """<item>[@system_or_region] - Price of item including the price at 5% market depth"""
+        return self._price(args, depth=True)
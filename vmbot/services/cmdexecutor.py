@@ -0,0 +1,97 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from collections import Counter
+import threading
+import logging
+import Queue
+
+from concurrent import futures
+
+
+class CommandExecutor(object):
+    """Run bot commands on a bounded worker pool.
+
+    Results are queued until process is called, so that they can be sent
+    from the thread owning the XMPP connection.
+    """
+
+    MAX_WORKERS = 4
+    MAX_QUEUE_DEPTH = 32
+    MAX_PER_USER = 2
+    MAX_PER_ROOM = 4
+
+    def __init__(self):
+        self.pool = futures.ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+        self._lock = threading.Lock()
+        self._results = Queue.Queue()
+
+        self._users = Counter()
+        self._rooms = Counter()
+        self.pending = 0
+        self.running = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self):
+        """Number of submitted commands that haven't started yet."""
+        return self.pending - self.running
+
+    def stats(self):
+        with self._lock:
+            return {'queue_depth': self.pending - self.running, 'running': self.running,
+                    'rejected': self.rejected}
+
+    def submit(self, user, room, callback, func, *args):
+        """Schedule func(*args) for execution and callback(result) for delivery.
+
+        Return False without scheduling anything if user, room (None for PMs),
+        or the queue as a whole have reached their limits.
+        """
+        with self._lock:
+            if (self.pending >= self.MAX_QUEUE_DEPTH or self._users[user] >= self.MAX_PER_USER
+                    or (room is not None and self._rooms[room] >= self.MAX_PER_ROOM)):
+                self.rejected += 1
+                return False
+
+            self.pending += 1
+            self._users[user] += 1
+            if room is not None:
+                self._rooms[room] += 1
+
+        self.pool.submit(self._run, user, room, callback, func, args)
+        return True
+
+    def _run(self, user, room, callback, func, args):
+        with self._lock:
+            self.running += 1
+
+        try:
+            self._results.put((callback, func(*args)))
+        except Exception:
+            logging.getLogger(__name__).exception("An error happened in a command worker:")
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+                self._users[user] -= 1
+                if not self._users[user]:
+                    del self._users[user]
+                if room is not None:
+                    self._rooms[room] -= 1
+                    if not self._rooms[room]:
+                        del self._rooms[room]
+
+    def process(self):
+        """Deliver all available results on the calling thread."""
+        while True:
+            try:
+                callback, res = self._results.get_nowait()
+            except Queue.Empty:
+                break
+            callback(res)
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+        self.process()
@@ -0,0 +1,104 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from collections import OrderedDict
+import threading
+import time
+
+from concurrent import futures
+
+
+class LinkExpansionCache(object):
+    """Expand links in the background and share the results between messages.
+
+    Expansions are cached with a TTL chosen by the expansion itself and evicted
+    least recently used first once there are more than MAX_ENTRIES. Concurrent
+    requests for the same key share a single expansion.
+    """
+
+    MAX_WORKERS = 4
+    MAX_ENTRIES = 1024
+
+    def __init__(self):
+        self.pool = futures.ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        """Return a future for a cached or running expansion of key or None."""
+        entry = self._entries.get(key, None)
+        if entry is not None:
+            if entry[1] > time.time():
+                # Move to the end of the LRU order
+                del self._entries[key]
+                self._entries[key] = entry
+                fut = futures.Future()
+                fut.set_result(entry[0])
+                return fut
+            del self._entries[key]
+
+        return self._inflight.get(key, None)
+
+    def _insert(self, key, result, ttl):
+        self._entries.pop(key, None)
+        self._entries[key] = (result, time.time() + ttl)
+        while len(self._entries) > self.MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def _run(self, keys, expand):
+        try:
+            results, error = expand(keys), None
+        except Exception as e:
+            results, error = {}, e
+
+        with self._lock:
+            futs = [self._inflight.pop(key) for key in keys]
+            for key in keys:
+                result, ttl = results.get(key, (None, None))
+                if ttl:
+                    self._insert(key, result, ttl)
+
+        for key, fut in zip(keys, futs):
+            if key in results:
+                fut.set_result(results[key][0])
+            else:
+                fut.set_exception(error or KeyError(key))
+
+    def get_many(self, keys, expand):
+        """Return futures for the expansions stored under keys, in order.
+
+        Keys that are neither cached nor being expanded are expanded together by
+        a single call to expand(keys) on the cache's pool, which must return
+        {key: (result, ttl)}. Results with a falsy ttl (eg. errors) are not cached.
+        """
+        futs = []
+        missing = []
+        with self._lock:
+            for key in keys:
+                fut = self._lookup(key)
+                if fut is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    fut = self._inflight[key] = futures.Future()
+                    missing.append(key)
+                futs.append(fut)
+
+        if missing:
+            self.pool.submit(self._run, missing, expand)
+        return futs
+
+    def get(self, key, expand):
+        """Return a future for the expansion stored under key.
+
+        On a miss, expand() is called on the cache's pool and must return (result, ttl).
+        """
+        return self.get_many([key], lambda keys: {key: expand()})[0]
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
@@ -3,6 +3,10 @@
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from email.utils import parsedate_tz, mktime_tz
+import threading
+import time
 
 from concurrent import futures
 
@@ -105,3 +109,113 @@ class MarketStructureLookup(object):
         except db.OperationalError:
             self.sess.rollback()
         self.sess.close()
+
+
+class MarketSnapshotCache(object):
+    """Share market snapshots between requests until ESI's cache expires.
+
+    Snapshots are evicted least recently used first once their combined size
+    exceeds MAX_BYTES. Concurrent misses for the same key share a single download.
+    """
+
+    MAX_BYTES = 64 * 1024 * 1024
+    DEFAULT_TTL = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _expiry(self, expires):
+        """Convert an Expires header into a timestamp."""
+        try:
+            return mktime_tz(parsedate_tz(expires))
+        except (TypeError, ValueError):
+            return time.time() + self.DEFAULT_TTL
+
+    def _remove(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+    def _insert(self, key, snapshot, expiry):
+        if key in self._entries:
+            self._remove(key)
+        if snapshot.nbytes > self.MAX_BYTES:
+            return
+
+        self._entries[key] = (snapshot, expiry, snapshot.nbytes)
+        self.nbytes += snapshot.nbytes
+        while self.nbytes > self.MAX_BYTES:
+            self._remove(next(iter(self._entries)))
+
+    def get(self, key, fetch):
+        """Retrieve the snapshot stored under key.
+
+        On a miss, fetch(stale) must return (snapshot, expires) with expires being
+        ESI's Expires header or None. stale is the expired snapshot previously stored
+        under key, if any, so that it can be revalidated instead of downloaded again.
+        Snapshots must report their size in nbytes.
+        """
+        stale = None
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                if entry[1] > time.time():
+                    # Move to the end of the LRU order
+                    del self._entries[key]
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return entry[0]
+                stale = entry[0]
+                self._remove(key)
+
+            fut = self._inflight.get(key, None)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = futures.Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not leader:
+            return fut.result()
+
+        try:
+            snapshot, expires = fetch(stale)
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            fut.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            self._insert(key, snapshot, self._expiry(expires))
+        fut.set_result(snapshot)
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'nbytes': self.nbytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class MarketSnapshot(object):
+    """Market orders along with the ETags of the pages they were loaded from."""
+
+    def __init__(self, book, etags):
+        self.book = book
+        self.etags = etags
+
+    @property
+    def nbytes(self):
+        return self.book.nbytes + sum(len(etag or "") for etag in self.etags)
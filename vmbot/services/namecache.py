@@ -0,0 +1,118 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from datetime import datetime, timedelta
+import threading
+
+from concurrent import futures
+
+from ..helpers.exceptions import APIError, APIStatusError
+from ..helpers import database as db
+from ..models import EntityName
+
+
+class NameResolver(object):
+    """Resolve entity ids to names, merging concurrent lookups into batched requests.
+
+    request is called with a list of up to MAX_BATCH_SIZE ids and must return
+    the matching ESI /universe/names/ records.
+    """
+
+    NAME_CACHE_TTL = timedelta(days=30)
+    MAX_BATCH_SIZE = 1000
+
+    def __init__(self, request):
+        self._request = request
+        self._lock = threading.Lock()
+        self._pending = []
+        self._flushing = False
+
+    def __call__(self, ids):
+        ids = set(ids)
+        names = self._load_cached(ids)
+
+        missing = ids.difference(names)
+        if missing:
+            names.update(self._submit(missing).result())
+
+        return names
+
+    def _load_cached(self, ids):
+        min_update = datetime.utcnow() - self.NAME_CACHE_TTL
+        select_names = (db.select(EntityName.entity_id, EntityName.name).
+                        where(EntityName.entity_id.in_(ids),
+                              EntityName.last_updated > min_update))
+
+        sess = db.Session()
+        try:
+            return dict(sess.execute(select_names).all())
+        except db.OperationalError:
+            return {}
+        finally:
+            sess.close()
+
+    def _store(self, records):
+        sess = db.Session()
+        try:
+            for rec in records:
+                sess.merge(EntityName.from_esi_record(rec))
+            sess.commit()
+        except (db.OperationalError, db.IntegrityError):
+            # Another resolver may have stored the same names concurrently
+            sess.rollback()
+        finally:
+            sess.close()
+
+    def _submit(self, ids):
+        """Queue ids for the next batch, flushing batches if no other thread does.
+
+        Lookups queued while a batch is being requested are merged into the next one.
+        """
+        f = futures.Future()
+        with self._lock:
+            self._pending.append((ids, f))
+            lead = not self._flushing
+            self._flushing = True
+
+        while lead:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if not batch:
+                    self._flushing = False
+                    break
+
+            try:
+                self._resolve(batch)
+            except Exception as e:
+                for _, pending_f in batch:
+                    if not pending_f.done():
+                        pending_f.set_exception(e)
+
+        return f
+
+    def _fetch(self, ids):
+        ids = list(ids)
+        records = []
+        for i in xrange(0, len(ids), self.MAX_BATCH_SIZE):
+            records.extend(self._request(ids[i:i + self.MAX_BATCH_SIZE]))
+
+        self._store(records)
+        return {rec['id']: rec['name'] for rec in records}
+
+    def _resolve(self, batch):
+        try:
+            names = self._fetch(set().union(*(ids for ids, _ in batch)))
+        except APIStatusError as e:
+            # ESI rejects the whole request if a single id is invalid
+            # See https://esi.evetech.net/ui/#/Universe/post_universe_names
+            if e.status_code == 404 and len(batch) > 1:
+                for lookup in batch:
+                    self._resolve([lookup])
+                return
+            names = {}
+        except APIError:
+            names = {}
+
+        for ids, f in batch:
+            f.set_result({id_: names.get(id_, "{ERROR}") for id_ in ids})
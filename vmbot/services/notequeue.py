@@ -4,7 +4,8 @@ from __future__ import absolute_import, division, unicode_literals, print_functi
 
 import time
 from datetime import datetime, timedelta
-import bisect
+from collections import defaultdict
+import heapq
 
 from xmpp.protocol import JID
 
@@ -13,7 +14,12 @@ from ..models import Note
 
 
 class NoteQueue(object):
-    """Store upcoming notes in memory until they are delivered."""
+    """Store upcoming notes in memory until they are delivered.
+
+    Notes wait in a heap ordered by offset_time until they are due. Due notes
+    whose receivers are offline are indexed by (room, receiver), with room None
+    for PMs, and delivered as soon as a matching occupant joins.
+    """
 
     QUEUE_UPDATE_INTERVAL = 12 * 60 * 60
     QUEUE_MAX_OFFSET = timedelta(hours=14)
@@ -21,48 +27,36 @@ class NoteQueue(object):
 
     def __init__(self):
         self._next_update = time.time()
-        self._queue = []
-
-    def fetch(self, nick_dict, session):
-        """Retrieve due notes from the queue if their receivers are online."""
-        if self._next_update <= time.time():
-            self.update_queue(session)
-
-        cur_time = datetime.utcnow()
-        JID_ALL = 0
-        jids = {}
-
-        ids, picks = [], []
-        for idx, (offset, note) in enumerate(self._queue):
-            if offset > cur_time:
-                break
-
-            id_, recv, room = note
-            if room is None:
-                # PM
-                if JID_ALL not in jids:
-                    jids[JID_ALL] = {jid.getStripped() for room in nick_dict.values()
-                                     for jid in room.values()}
-                if recv in jids[JID_ALL]:
-                    ids.append(id_)
-                    picks.append(idx)
-            else:
-                # MUC
-                room = JID(room).getNode()
-                if room in nick_dict:
-                    if room not in jids:
-                        jids[room] = {jid.getNode() for jid in nick_dict[room].values()}
-                    if recv in nick_dict[room] or recv in jids[room]:
-                        ids.append(id_)
-                        picks.append(idx)
-
+        # Notes with offset_time up to _loaded_until have been loaded from the database
+        self._loaded_until = None
+        self._heap = []
+        self._waiting = {}
+        self._index = defaultdict(set)
+
+    @staticmethod
+    def _key(receiver, room):
+        return (JID(room).getNode() if room is not None else None), receiver
+
+    @staticmethod
+    def _is_online(key, occupancy):
+        room, recv = key
+        if room is None:
+            # PM
+            return occupancy.is_online(recv)
+        # MUC
+        return occupancy.in_room(room, recv)
+
+    def _push(self, note_id, receiver, room, offset):
+        heapq.heappush(self._heap, (offset, note_id, receiver, room))
+
+    def _wait(self, note_id, key, offset):
+        self._waiting[note_id] = (key, offset)
+        self._index[key].add(note_id)
+
+    def _deliver(self, ids, session):
         if not ids:
             return []
 
-        # picks is sorted because self._queue is sorted
-        for idx in reversed(picks):
-            del self._queue[idx]
-
         messages = []
         for note in session.execute(db.select(Note).where(Note.note_id.in_(ids))).scalars():
             messages.append(note.to_msg())
@@ -71,25 +65,66 @@ class NoteQueue(object):
         session.commit()
         return messages
 
+    def fetch(self, occupancy, session):
+        """Retrieve notes that became due from the queue if their receivers are online.
+
+        Notes of offline receivers are delivered by fetch_for_occupant once they join.
+        """
+        if self._next_update <= time.time():
+            self.update_queue(session)
+
+        cur_time = datetime.utcnow()
+        ids = []
+        while self._heap and self._heap[0][0] <= cur_time:
+            offset, id_, recv, room = heapq.heappop(self._heap)
+            key = self._key(recv, room)
+            if self._is_online(key, occupancy):
+                ids.append(id_)
+            else:
+                self._wait(id_, key, offset)
+
+        return self._deliver(ids, session)
+
+    def fetch_for_occupant(self, room, nick, jid, session):
+        """Retrieve due notes for an occupant who just joined room."""
+        keys = ((None, jid.getStripped()), (room, nick), (room, jid.getNode()))
+
+        ids = set()
+        for key in keys:
+            if key in self._index:
+                ids.update(self._index.pop(key))
+        for id_ in ids:
+            del self._waiting[id_]
+
+        return self._deliver(list(ids), session)
+
     def update_queue(self, session):
+        """Load notes that are due soon and remove notes that can't be delivered anymore."""
         cur_time = datetime.utcnow()
-        select_notes = (db.select(Note.note_id, Note.receiver, Note.room, Note.offset_time).
-                        where(Note.offset_time <= cur_time + self.QUEUE_MAX_OFFSET).
-                        order_by(Note.offset_time.asc()))
+        horizon = cur_time + self.QUEUE_MAX_OFFSET
+        expired = cur_time - self.NOTE_DELIVERY_FRAME
 
-        self._queue, expired = [], []
-        for note in session.execute(select_notes):
-            if cur_time - note[-1] > self.NOTE_DELIVERY_FRAME:
-                expired.append(note[0])
-            else:
-                self._queue.append((note[-1], note[:-1]))
-        # self._queue is sorted because the database results are
+        select_notes = db.select(Note.note_id, Note.receiver, Note.room, Note.offset_time).where(
+            Note.offset_time <= horizon, Note.offset_time >= expired
+        )
+        if self._loaded_until is not None:
+            select_notes = select_notes.where(Note.offset_time > self._loaded_until)
 
-        if expired:
-            # Session is synchronized after commit
-            session.execute(db.delete(Note).where(Note.note_id.in_(expired)).
-                            execution_options(synchronize_session=False))
-            session.commit()
+        for note in session.execute(select_notes):
+            self._push(*note)
+        self._loaded_until = horizon
+
+        for id_, (key, offset) in list(self._waiting.items()):
+            if offset < expired:
+                del self._waiting[id_]
+                self._index[key].discard(id_)
+                if not self._index[key]:
+                    del self._index[key]
+
+        # Session is synchronized after commit
+        session.execute(db.delete(Note).where(Note.offset_time < expired).
+                        execution_options(synchronize_session=False))
+        session.commit()
 
         self._next_update = time.time() + self.QUEUE_UPDATE_INTERVAL
 
@@ -97,7 +132,6 @@ class NoteQueue(object):
         session.add(note)
         session.commit()
 
-        # Update note queue, keeping it sorted
-        if note.offset_time <= datetime.utcnow() + self.QUEUE_MAX_OFFSET:
-            bisect.insort(self._queue,
-                          (note.offset_time, (note.note_id, note.receiver, note.room)))
+        # Later notes are loaded by update_queue
+        if self._loaded_until is not None and note.offset_time <= self._loaded_until:
+            self._push(note.note_id, note.receiver, note.room, note.offset_time)
@@ -0,0 +1,94 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from collections import defaultdict, Counter
+
+
+class OccupancyIndex(object):
+    """Track MUC occupants with constant-time lookups by room, nick, node, and JID.
+
+    Rooms are identified by their node, JIDs are stored as xmpp JID objects
+    and indexed by their stripped form and node. A user may occupy a room with
+    several nicks (eg. from multiple resources), so reverse indexes count nicks.
+    """
+
+    def __init__(self):
+        self._rooms = defaultdict(dict)
+        self._rooms_by_jid = defaultdict(Counter)
+        self._jids_by_room = defaultdict(Counter)
+        self._nodes_by_room = defaultdict(Counter)
+        self._nicks_by_node = defaultdict(set)
+
+    @staticmethod
+    def _decrement(index, key, value):
+        counter = index[key]
+        counter[value] -= 1
+        if counter[value] <= 0:
+            del counter[value]
+        if not counter:
+            del index[key]
+
+    def join(self, room, nick, jid):
+        """Add (or move) nick with full JID jid to room."""
+        self.leave(room, nick)
+        self._rooms[room][nick] = jid
+
+        stripped, node = jid.getStripped(), jid.getNode()
+        self._rooms_by_jid[stripped][room] += 1
+        self._jids_by_room[room][stripped] += 1
+        self._nodes_by_room[room][node] += 1
+        self._nicks_by_node[node].add((room, nick))
+
+    def leave(self, room, nick):
+        """Remove nick from room if present."""
+        occupants = self._rooms.get(room, None)
+        if occupants is None or nick not in occupants:
+            return
+
+        jid = occupants.pop(nick)
+        if not occupants:
+            del self._rooms[room]
+
+        stripped, node = jid.getStripped(), jid.getNode()
+        self._decrement(self._rooms_by_jid, stripped, room)
+        self._decrement(self._jids_by_room, room, stripped)
+        self._decrement(self._nodes_by_room, room, node)
+        self._nicks_by_node[node].discard((room, nick))
+        if not self._nicks_by_node[node]:
+            del self._nicks_by_node[node]
+
+    def __contains__(self, room):
+        return room in self._rooms
+
+    def jid(self, room, nick):
+        """Return the full JID of nick in room or None."""
+        return self._rooms.get(room, {}).get(nick, None)
+
+    def nicks(self, room):
+        return list(self._rooms.get(room, {}))
+
+    def occupants(self):
+        """Iterate over (room, nick, full JID) of all occupants."""
+        for room, occupants in self._rooms.items():
+            for nick, jid in occupants.items():
+                yield room, nick, jid
+
+    def is_online(self, stripped_jid):
+        """Check whether the user identified by the stripped JID occupies any room."""
+        return stripped_jid in self._rooms_by_jid
+
+    def rooms_of(self, stripped_jid):
+        return set(self._rooms_by_jid.get(stripped_jid, ()))
+
+    def jids_in(self, room):
+        """Return the set of stripped JIDs occupying room."""
+        return set(self._jids_by_room.get(room, ()))
+
+    def nicks_of(self, node):
+        """Return the set of (room, nick) used by users with JID node."""
+        return set(self._nicks_by_node.get(node, ()))
+
+    def in_room(self, room, name):
+        """Check whether name is the nick or JID node of an occupant of room."""
+        return name in self._rooms.get(room, ()) or name in self._nodes_by_room.get(room, ())
@@ -0,0 +1,64 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from datetime import datetime
+import logging
+import time
+
+from ..helpers import database as db
+from ..models.user import User, Nickname
+
+
+class PresenceBuffer(object):
+    """Collect last_seen updates of nicknames and write them to the database in bulk.
+
+    Updates are coalesced per (nick, jid) and flushed in a single transaction,
+    so a burst of presence stanzas costs a constant number of database writes.
+    Not thread-safe; use from the thread that processes presences.
+    """
+
+    FLUSH_INTERVAL = 5
+
+    def __init__(self):
+        self._pending = {}
+        self._next_flush = time.time() + self.FLUSH_INTERVAL
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, nick, jid, last_seen=None):
+        """Mark nick of the user identified by the stripped jid as seen."""
+        self._pending[(nick, jid)] = last_seen or datetime.utcnow()
+
+    def flush_due(self):
+        return self._next_flush <= time.time()
+
+    def flush(self, session):
+        """Insert new users and nicknames and update last_seen of all recorded nicknames."""
+        self._next_flush = time.time() + self.FLUSH_INTERVAL
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        update_nicks = (db.update(Nickname.__table__).
+                        where(Nickname.__table__.c.nick == db.bindparam("n"),
+                              Nickname.__table__.c.user_jid == db.bindparam("j")).
+                        values(last_seen=db.bindparam("t")))
+
+        try:
+            db.insert_ignore(session, User.__table__,
+                             [{'jid': jid} for jid in {j for _, j in pending}])
+            db.insert_ignore(session, Nickname.__table__,
+                             [{'nick': nick, 'user_jid': jid, 'last_seen': seen}
+                              for (nick, jid), seen in pending.items()])
+            session.execute(update_nicks, [{'n': nick, 'j': jid, 't': seen}
+                                           for (nick, jid), seen in pending.items()])
+            session.commit()
+        except db.OperationalError:
+            session.rollback()
+            logging.getLogger(__name__).warning("Failed to store %d presence(s), retrying later",
+                                                len(pending))
+            # Keep newer updates recorded in the meantime
+            for key, seen in pending.items():
+                self._pending.setdefault(key, seen)
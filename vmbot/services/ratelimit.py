@@ -0,0 +1,120 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from collections import Counter
+import threading
+import logging
+import time
+import re
+
+_VERSION_REGEX = re.compile(r"^(v\d+|latest|legacy|dev)$")
+
+
+class ESIRateLimiter(object):
+    """Throttle ESI requests to stay within ESI's error limit.
+
+    Each route group (eg. "markets" or "universe") draws from its own token bucket.
+    The number of concurrent requests shrinks with the remaining error budget,
+    and once the budget is nearly exhausted requests wait for the reset window.
+    """
+
+    RATE = 50.0
+    BURST = 100
+    MAX_CONCURRENCY = 16
+    ERROR_LIMIT = 100
+    MIN_ERROR_REMAIN = 10
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._buckets = {}
+
+        self.in_flight = 0
+        self.error_remain = self.ERROR_LIMIT
+        self.reset_at = 0.0
+        self.throttled = Counter()
+        self.wait_time = 0.0
+
+    @staticmethod
+    def route_group(route):
+        """Extract the resource group from an ESI route."""
+        parts = [p for p in route.split('/') if p]
+        if parts and _VERSION_REGEX.match(parts[0]):
+            parts.pop(0)
+        return parts[0] if parts else ""
+
+    @property
+    def concurrency_limit(self):
+        """Number of requests allowed in flight given the remaining error budget."""
+        scaled = self.MAX_CONCURRENCY * self.error_remain // self.ERROR_LIMIT
+        return max(1, min(self.MAX_CONCURRENCY, scaled))
+
+    def _take_token(self, group, now):
+        """Try to take a token from group's bucket.
+
+        Return the time to wait until a token is available, 0 on success.
+        """
+        tokens, last = self._buckets.get(group, (self.BURST, now))
+        tokens = min(self.BURST, tokens + (now - last) * self.RATE)
+
+        if tokens >= 1:
+            self._buckets[group] = (tokens - 1, now)
+            return 0
+        self._buckets[group] = (tokens, now)
+        return (1 - tokens) / self.RATE
+
+    def acquire(self, group):
+        """Block until a request to group may be sent."""
+        start = time.time()
+        reason = None
+
+        with self._cond:
+            while True:
+                now = time.time()
+                if self.reset_at and now >= self.reset_at:
+                    self.error_remain = self.ERROR_LIMIT
+                    self.reset_at = 0.0
+
+                if self.error_remain <= self.MIN_ERROR_REMAIN and self.reset_at:
+                    wait, cause = self.reset_at - now, "error_limit"
+                elif self.in_flight >= self.concurrency_limit:
+                    wait, cause = None, "concurrency"
+                else:
+                    wait, cause = self._take_token(group, now), "rate"
+                    if not wait:
+                        break
+
+                if reason is None:
+                    reason = cause
+                    self.throttled[cause] += 1
+                self._cond.wait(wait)
+
+            self.in_flight += 1
+            if reason is not None:
+                self.wait_time += time.time() - start
+
+    def release(self, headers=None):
+        """Mark a request as finished, updating the error budget from its response headers."""
+        with self._cond:
+            self.in_flight -= 1
+
+            try:
+                remain = int(headers['X-ESI-Error-Limit-Remain'])
+                reset = int(headers['X-ESI-Error-Limit-Reset'])
+            except (TypeError, KeyError, ValueError):
+                pass
+            else:
+                if remain <= self.MIN_ERROR_REMAIN < self.error_remain:
+                    logging.getLogger(__name__).warning(
+                        "ESI error limit nearly exhausted, pausing requests for %ds", reset
+                    )
+                self.error_remain = remain
+                self.reset_at = time.time() + reset
+
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {'in_flight': self.in_flight, 'concurrency_limit': self.concurrency_limit,
+                    'error_remain': self.error_remain, 'throttled': dict(self.throttled),
+                    'wait_time': self.wait_time}
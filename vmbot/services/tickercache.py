@@ -0,0 +1,158 @@
+# coding: utf-8
+
+from __future__ import absolute_import, division, unicode_literals, print_function
+
+from datetime import datetime, timedelta
+import threading
+
+from concurrent import futures
+import cachetools
+
+from ..helpers.exceptions import APIError
+from ..helpers import database as db
+from ..models import EntityTicker
+
+
+class TickerCache(object):
+    """Resolve corporation and alliance tickers via an in-memory LRU in front of the database.
+
+    request is called with a category ("corporation" or "alliance") and an entity id
+    and must return the matching ESI record. Entries older than TICKER_REFRESH_AGE are
+    served as-is while being refreshed in the background, entries older than
+    TICKER_CACHE_TTL are refreshed before being returned. Concurrent lookups of the
+    same entity share a single request.
+    """
+
+    MEM_CACHE_SIZE = 4096
+    TICKER_REFRESH_AGE = timedelta(hours=6)
+    TICKER_CACHE_TTL = timedelta(days=7)
+
+    def __init__(self, request, refresh_pool=None):
+        self._request = request
+        self._refresh_pool = refresh_pool or futures.ThreadPoolExecutor(max_workers=2)
+
+        self._lock = threading.Lock()
+        self._mem = cachetools.LRUCache(maxsize=self.MEM_CACHE_SIZE)
+        self._refreshing = set()
+        self._inflight = {}
+
+    def __call__(self, corp_id, ally_id):
+        corp_ticker = None
+        if corp_id:
+            corp = self._get("corporation", corp_id)
+            corp_ticker = corp.ticker if corp is not None else "ERROR"
+            if corp is not None:
+                ally_id = ally_id or corp.alliance_id
+
+        alliance_ticker = None
+        if ally_id:
+            ally = self._get("alliance", ally_id)
+            alliance_ticker = ally.ticker if ally is not None else "ERROR"
+
+        return corp_ticker, alliance_ticker
+
+    def prefetch(self, pairs, pool):
+        """Start resolving a batch of (corp_id, ally_id) pairs in parallel on pool.
+
+        Doesn't wait for the lookups. Alliances of corporations are looked up
+        as soon as their corporation is resolved.
+        """
+        pairs = set(pairs)
+        ally_ids = {a for _, a in pairs if a}
+        lock = threading.Lock()
+
+        def prefetch_alliance(f):
+            corp = f.result()
+            if corp is None or not corp.alliance_id:
+                return
+            with lock:
+                if corp.alliance_id in ally_ids:
+                    return
+                ally_ids.add(corp.alliance_id)
+            pool.submit(self._get, "alliance", corp.alliance_id)
+
+        for ally_id in list(ally_ids):
+            pool.submit(self._get, "alliance", ally_id)
+        for corp_id in {c for c, _ in pairs if c}:
+            pool.submit(self._get, "corporation", corp_id).add_done_callback(prefetch_alliance)
+
+    def _get(self, category, entity_id):
+        key = (category, entity_id)
+        with self._lock:
+            entry = self._mem.get(key, None)
+
+        if entry is None:
+            entry = self._load(category, entity_id)
+        if entry is None or entry.update_age > self.TICKER_CACHE_TTL:
+            return self._fetch(category, entity_id)
+
+        if entry.update_age > self.TICKER_REFRESH_AGE:
+            with self._lock:
+                refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            if refresh:
+                f = self._refresh_pool.submit(self._fetch, category, entity_id)
+                f.add_done_callback(lambda f: self._refresh_done(key))
+
+        return entry
+
+    def _refresh_done(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _load(self, category, entity_id):
+        sess = db.Session(expire_on_commit=False)
+        try:
+            entry = sess.get(EntityTicker, (entity_id, category))
+        except db.OperationalError:
+            return None
+        finally:
+            sess.close()
+
+        if entry is not None:
+            with self._lock:
+                self._mem[(category, entity_id)] = entry
+        return entry
+
+    def _fetch(self, category, entity_id):
+        key = (category, entity_id)
+        with self._lock:
+            fut = self._inflight.get(key, None)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = futures.Future()
+
+        if not leader:
+            return fut.result()
+
+        try:
+            entry = EntityTicker.from_esi_result(entity_id, category,
+                                                 self._request(category, entity_id))
+        except APIError:
+            entry = None
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            fut.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            if entry is not None:
+                self._mem[key] = entry
+        fut.set_result(entry)
+
+        if entry is not None:
+            self._store(entry)
+        return entry
+
+    def _store(self, entry):
+        sess = db.Session(expire_on_commit=False)
+        try:
+            sess.merge(entry)
+            sess.commit()
+        except (db.OperationalError, db.IntegrityError):
+            # Another process may have stored the same entity concurrently
+            sess.rollback()
+        finally:
+            sess.close()
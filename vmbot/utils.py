@@ -18,7 +18,7 @@ import config
 
 
 class EVEUtils(object):
-    @botcmd
+    @botcmd(thread=True)
     def character(self, mess, args):
         """<character> - Employment information for a single character"""
         args = args.strip()